@@ -0,0 +1,196 @@
+"""Admission control in front of the renderers.
+
+A PNG render holds a full-size RGBA canvas (about 95 MB at 300 DPI), so a
+burst of submissions must not all start rendering at once. Every render first
+takes a slot here: at most ``max_in_flight`` run together and, when a memory
+budget is set, the estimated canvas sizes of the running renders stay within
+it. Renders that cannot start wait in a short queue; once that is full (or a
+render has waited ``max_wait`` seconds) the request is turned away with
+``Overloaded``, which carries a Retry-After estimate, instead of piling up.
+
+With fair queuing, waiters are kept per client and slots are handed out
+round-robin between clients, so one client submitting a hundred schedules
+does not starve everybody queued behind it.
+
+Time spent waiting for a slot and time spent rendering are recorded apart.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Optional
+
+
+class Overloaded(Exception):
+    """No render slot is available; retry after ``retry_after`` seconds."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@dataclass
+class Ticket:
+    """A granted slot: its client, memory cost, and how long it waited."""
+    client: str
+    cost: int
+    queued_at: float = field(default_factory=time.monotonic)
+    admitted_at: Optional[float] = None
+
+    @property
+    def wait(self) -> float:
+        return (self.admitted_at or time.monotonic()) - self.queued_at
+
+
+class AdmissionController:
+    def __init__(self, max_in_flight: int, memory_budget: Optional[int] = None,
+                 max_queued: int = 32, max_queued_per_client: Optional[int] = None,
+                 max_wait: float = 20.0, fair: bool = True):
+        self.max_in_flight = max(1, max_in_flight)
+        self.memory_budget = memory_budget or None
+        self.max_queued = max_queued
+        self.max_queued_per_client = max_queued_per_client or None
+        self.max_wait = max_wait
+        self.fair = fair
+
+        self.in_flight = 0
+        self.memory_in_use = 0
+        # Waiters per client; the order of the keys is the round-robin order
+        self._waiting: "OrderedDict[str, Deque[tuple]]" = OrderedDict()
+        self._queued = 0
+
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.render_seconds = 0.0
+        self.completed = 0
+
+    def _fits(self, cost: int) -> bool:
+        if self.in_flight >= self.max_in_flight:
+            return False
+        # A render larger than the whole budget still runs, just on its own
+        return (self.memory_budget is None or self.in_flight == 0
+                or self.memory_in_use + cost <= self.memory_budget)
+
+    def retry_after(self) -> int:
+        """Seconds until the queue has likely drained enough to take a new render."""
+        per_render = self.render_seconds / self.completed if self.completed else 1.0
+        rounds = (self._queued + self.in_flight) / self.max_in_flight
+        return max(1, math.ceil(per_render * rounds))
+
+    def _grant(self, ticket: Ticket):
+        ticket.admitted_at = time.monotonic()
+        self.in_flight += 1
+        self.memory_in_use += ticket.cost
+        self.admitted += 1
+        self.wait_seconds += ticket.wait
+        self.max_wait_seconds = max(self.max_wait_seconds, ticket.wait)
+
+    def _reject(self, reason: str):
+        self.rejected += 1
+        raise Overloaded(reason, self.retry_after())
+
+    async def acquire(self, client: str, cost: int, fail_fast: bool = True) -> Ticket:
+        """Wait for a slot. With ``fail_fast`` a full queue or a wait past
+        ``max_wait`` raises ``Overloaded``; without it the caller (a job or
+        batch worker with its own bound) simply waits its turn."""
+        ticket = Ticket(client if self.fair else "", cost)
+        if not self._queued and self._fits(cost):
+            self._grant(ticket)
+            return ticket
+        if fail_fast:
+            if self._queued >= self.max_queued:
+                self._reject("Render queue is full")
+            waiting = self._waiting.get(ticket.client)
+            if self.fair and self.max_queued_per_client and waiting and len(waiting) >= self.max_queued_per_client:
+                self._reject("Too many renders queued for this client")
+
+        granted = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(ticket.client, deque()).append((ticket, granted))
+        self._queued += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(granted), self.max_wait if fail_fast else None)
+        except asyncio.TimeoutError:
+            # Unless the slot was granted in the same instant
+            if not granted.done():
+                granted.cancel()
+                self._forget(ticket)
+                self.timed_out += 1
+                self._reject("Timed out waiting for a render slot")
+        except asyncio.CancelledError:
+            if granted.done() and not granted.cancelled():
+                # Granted just as the caller went away: hand the slot on
+                self.release(ticket)
+            else:
+                granted.cancel()
+                self._forget(ticket)
+            raise
+        return ticket
+
+    def _forget(self, ticket: Ticket):
+        waiting = self._waiting.get(ticket.client)
+        if not waiting:
+            return
+        for entry in waiting:
+            if entry[0] is ticket:
+                waiting.remove(entry)
+                self._queued -= 1
+                break
+        if not waiting:
+            del self._waiting[ticket.client]
+        # The head of the queue may have been what held the others back
+        self._dispatch()
+
+    def release(self, ticket: Ticket):
+        self.in_flight -= 1
+        self.memory_in_use -= ticket.cost
+        self.completed += 1
+        self.render_seconds += time.monotonic() - ticket.admitted_at
+        self._dispatch()
+
+    def _dispatch(self):
+        """Admit waiters, taking one client's oldest at a time in rotation."""
+        while self._waiting:
+            client, waiting = next(iter(self._waiting.items()))
+            ticket, granted = waiting[0]
+            if not self._fits(ticket.cost):
+                return
+            waiting.popleft()
+            self._queued -= 1
+            if waiting:
+                self._waiting.move_to_end(client)
+            else:
+                del self._waiting[client]
+            self._grant(ticket)
+            granted.set_result(ticket)
+
+    @asynccontextmanager
+    async def slot(self, client: str, cost: int, fail_fast: bool = True):
+        ticket = await self.acquire(client, cost, fail_fast)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_in_flight": self.max_in_flight,
+            "memory_budget": self.memory_budget,
+            "in_flight": self.in_flight,
+            "memory_in_use": self.memory_in_use,
+            "queued": self._queued,
+            "clients_waiting": len(self._waiting),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "queue_wait_avg_s": round(self.wait_seconds / self.admitted, 4) if self.admitted else 0.0,
+            "queue_wait_max_s": round(self.max_wait_seconds, 4),
+            "render_avg_s": round(self.render_seconds / self.completed, 4) if self.completed else 0.0,
+        }
@@ -0,0 +1,275 @@
+"""Serve the ASGI app from a WSGI server inside the same process.
+
+``AsgiBridge`` wraps an ASGI application as a WSGI callable for hosts that
+only speak WSGI (Passenger on cPanel). Unlike a generic adapter it does not
+start an event loop per request, and unlike passenger_wsgi.py it needs no
+second server or HTTP hop:
+
+* one event loop runs for the life of the process on a daemon thread, and
+  every request is dispatched into it with ``run_coroutine_threadsafe``;
+* the app's lifespan runs once on that loop, so its render pool is started
+  and warmed once per process and shared by all requests;
+* response bodies are handed back to the WSGI thread chunk by chunk as the
+  app sends them, so large charts and streaming responses are not
+  collected in memory first.
+
+Passenger runs each request on its own thread; those threads block on a
+queue while the loop does the work.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import atexit
+import os
+import queue
+import sys
+import threading
+from http import HTTPStatus
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+CHUNK_SIZE = 64 * 1024
+
+# What the WSGI thread is waiting for, put on its queue by the loop
+_START, _BODY, _END, _ERROR = "start", "body", "end", "error"
+
+
+def _status_line(status: int) -> str:
+    try:
+        return f"{status} {HTTPStatus(status).phrase}"
+    except ValueError:
+        return f"{status} Unknown"
+
+
+def build_scope(environ: Dict[str, Any]) -> Dict[str, Any]:
+    """The ASGI HTTP connection scope for a WSGI environ."""
+    headers: List[Tuple[bytes, bytes]] = []
+    for key, value in environ.items():
+        if key.startswith("HTTP_"):
+            headers.append((key[5:].replace("_", "-").lower().encode("latin-1"), value.encode("latin-1")))
+    for key, name in (("CONTENT_TYPE", b"content-type"), ("CONTENT_LENGTH", b"content-length")):
+        if environ.get(key):
+            headers.append((name, environ[key].encode("latin-1")))
+    # PATH_INFO holds the raw bytes decoded as latin-1 (PEP 3333)
+    raw_path = environ.get("PATH_INFO", "/").encode("latin-1")
+    server_port = environ.get("SERVER_PORT")
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.3"},
+        "http_version": environ.get("SERVER_PROTOCOL", "HTTP/1.1").partition("/")[2] or "1.1",
+        "method": environ["REQUEST_METHOD"],
+        "scheme": environ.get("wsgi.url_scheme", "http"),
+        "path": raw_path.decode("utf-8", "replace"),
+        "raw_path": raw_path,
+        "root_path": environ.get("SCRIPT_NAME", ""),
+        "query_string": environ.get("QUERY_STRING", "").encode("latin-1"),
+        "headers": headers,
+        "client": (environ["REMOTE_ADDR"], int(environ.get("REMOTE_PORT") or 0)) if environ.get("REMOTE_ADDR") else None,
+        "server": (environ.get("SERVER_NAME", "localhost"), int(server_port)) if server_port else None,
+    }
+
+
+class _Exchange:
+    """One request: the app side runs on the loop, the WSGI side on the request thread."""
+
+    def __init__(self, bridge: "AsgiBridge", environ: Dict[str, Any]):
+        self.bridge = bridge
+        self.stream = environ["wsgi.input"]
+        length = environ.get("CONTENT_LENGTH")
+        self.remaining: Optional[int] = int(length) if length else None
+        if self.remaining is None and not environ.get("wsgi.input_terminated"):
+            self.remaining = 0
+        self.body: Optional[bytes] = None
+        if self.remaining is not None and self.remaining <= bridge.buffer_limit:
+            # Small bodies (every form post) are read here, off the loop
+            self.body = self.stream.read(self.remaining) if self.remaining else b""
+        self.outbox: "queue.Queue[Tuple[str, Any]]" = queue.Queue()
+        self.disconnected: Optional[asyncio.Event] = None
+
+    async def receive(self) -> Dict[str, Any]:
+        if self.body is not None:
+            body, self.body = self.body, None
+            return {"type": "http.request", "body": body, "more_body": False}
+        if self.remaining == 0:
+            # The request is fully read; the next thing to wait for is a disconnect
+            await self.disconnected.wait()
+            return {"type": "http.disconnect"}
+        size = CHUNK_SIZE if self.remaining is None else min(CHUNK_SIZE, self.remaining)
+        chunk = await asyncio.get_running_loop().run_in_executor(None, self.stream.read, size)
+        if self.remaining is not None:
+            self.remaining -= len(chunk)
+        if not chunk:
+            self.remaining = 0
+        return {"type": "http.request", "body": chunk, "more_body": self.remaining != 0}
+
+    async def send(self, message: Dict[str, Any]):
+        if self.disconnected.is_set():
+            return
+        if message["type"] == "http.response.start":
+            headers = [(name.decode("latin-1"), value.decode("latin-1")) for name, value in message.get("headers", [])]
+            self.outbox.put((_START, (_status_line(message["status"]), headers)))
+        elif message["type"] == "http.response.body":
+            body = message.get("body", b"")
+            if body:
+                self.outbox.put((_BODY, body))
+            if not message.get("more_body", False):
+                self.outbox.put((_END, None))
+
+    async def run(self, scope: Dict[str, Any]):
+        self.disconnected = asyncio.Event()
+        try:
+            await self.bridge.app(scope, self.receive, self.send)
+        except Exception:
+            self.outbox.put((_ERROR, sys.exc_info()))
+        else:
+            # An app that returns without finishing its response
+            self.outbox.put((_END, None))
+
+    def disconnect(self):
+        """Called from the WSGI thread when the client is gone or the response is done."""
+        loop = self.bridge.loop
+        if self.disconnected is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self.disconnected.set)
+
+
+class AsgiBridge:
+    """WSGI callable running ``app`` on one shared, long-lived event loop.
+
+    ``timeout`` bounds how long a request thread waits for the app to start
+    or continue its response before answering 504.
+    """
+
+    def __init__(self, app: Callable, timeout: float = 120.0, buffer_limit: int = 1024 * 1024,
+                 lifespan: bool = True):
+        self.app = app
+        self.timeout = timeout
+        self.buffer_limit = buffer_limit
+        self.lifespan = lifespan
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self._lifespan_events: Optional[asyncio.Queue] = None
+        self._lifespan_replies: Optional[asyncio.Queue] = None
+        self._lifespan_task = None
+
+    # --- loop and lifespan -------------------------------------------------
+
+    def start(self):
+        """Start the loop thread and run the app's startup; safe to call repeatedly.
+
+        Called on the first request rather than at import, so a server that
+        imports the app and then forks its workers starts one loop (and one
+        render pool) in each worker rather than in the parent.
+        """
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.loop = asyncio.new_event_loop()
+            ready = threading.Event()
+            self._thread = threading.Thread(target=self._run_loop, args=(ready,), name="asgi-bridge", daemon=True)
+            self._thread.start()
+            ready.wait()
+            if self.lifespan:
+                asyncio.run_coroutine_threadsafe(self._startup(), self.loop).result()
+            atexit.register(self.stop)
+
+    def _run_loop(self, ready: threading.Event):
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_soon(ready.set)
+        self.loop.run_forever()
+
+    async def _startup(self):
+        self._lifespan_events = asyncio.Queue()
+        replies: asyncio.Queue = asyncio.Queue()
+
+        async def receive():
+            return await self._lifespan_events.get()
+
+        async def send(message):
+            await replies.put(message)
+
+        async def run():
+            try:
+                await self.app({"type": "lifespan", "asgi": {"version": "3.0", "spec_version": "2.0"}, "state": {}},
+                               receive, send)
+            except Exception:
+                # Apps without lifespan support may raise; they just get no startup
+                await replies.put({"type": "lifespan.unsupported"})
+
+        self._lifespan_task = asyncio.get_running_loop().create_task(run())
+        await self._lifespan_events.put({"type": "lifespan.startup"})
+        reply = await replies.get()
+        if reply["type"] == "lifespan.startup.failed":
+            raise RuntimeError(f"ASGI app failed to start: {reply.get('message', '')}")
+        self._lifespan_replies = replies
+
+    async def _shutdown(self):
+        if self._lifespan_task is None or self._lifespan_task.done():
+            return
+        await self._lifespan_events.put({"type": "lifespan.shutdown"})
+        try:
+            await asyncio.wait_for(self._lifespan_replies.get(), 30)
+        except asyncio.TimeoutError:
+            pass
+
+    def stop(self):
+        """Run the app's shutdown and stop the loop thread."""
+        with self._lock:
+            if self._thread is None:
+                return
+            if self.lifespan:
+                try:
+                    asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result(35)
+                except Exception:
+                    pass
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(5)
+            self._thread = self._pid = None
+            self.loop.close()
+
+    # --- requests ------------------------------------------------------------
+
+    def __call__(self, environ: Dict[str, Any], start_response: Callable) -> Iterable[bytes]:
+        if self._pid != os.getpid():
+            self.start()
+        exchange = _Exchange(self, environ)
+        future = asyncio.run_coroutine_threadsafe(exchange.run(build_scope(environ)), self.loop)
+        try:
+            kind, value = exchange.outbox.get(timeout=self.timeout)
+        except queue.Empty:
+            future.cancel()
+            exchange.disconnect()
+            start_response("504 Gateway Timeout", [("Content-Type", "text/plain; charset=utf-8")])
+            return [b"The application did not respond in time\n"]
+        if kind == _ERROR:
+            exchange.disconnect()
+            start_response("500 Internal Server Error", [("Content-Type", "text/plain; charset=utf-8")], value)
+            return [b"Internal Server Error\n"]
+        if kind == _END:
+            # Finished without ever starting a response
+            exchange.disconnect()
+            start_response("500 Internal Server Error", [("Content-Type", "text/plain; charset=utf-8")])
+            return [b"Internal Server Error\n"]
+        start_response(*value)
+        return self._body(exchange)
+
+    def _body(self, exchange: _Exchange):
+        try:
+            while True:
+                try:
+                    kind, value = exchange.outbox.get(timeout=self.timeout)
+                except queue.Empty:
+                    # Headers are already sent; all that is left is to cut the response short
+                    return
+                if kind == _BODY:
+                    yield value
+                elif kind == _END:
+                    return
+                else:
+                    raise value[1].with_traceback(value[2])
+        finally:
+            # Runs when the response is done and when the WSGI server closes
+            # the iterable early because the client went away
+            exchange.disconnect()
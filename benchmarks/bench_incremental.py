@@ -0,0 +1,51 @@
+"""Re-render time after a one-lesson edit, with and without day-row tiles.
+
+Each step moves or renames one lesson (workloads.edit_one_lesson) and
+renders the edited schedule, the way a user re-submits a form. With tiles
+only the days the edit touched are drawn; without them (a tile budget of
+0) every block is. The first render of each run fills the tile cache and
+is not timed.
+
+Usage: python benchmarks/bench_incremental.py [edits]
+"""
+
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import main
+from workloads import WORKLOADS, edit_one_lesson
+
+
+def measure(lessons, edits: int, tile_bytes: int):
+    main.TILE_CACHE_BYTES = tile_bytes
+    main._TILE_CACHE.clear()
+    main._TILE_STATS["bytes"] = 0
+    main.render_chart_image(lessons)
+    timings = []
+    for seed in range(edits):
+        lessons = edit_one_lesson(lessons, seed)
+        started = time.perf_counter()
+        main.render_chart_image(lessons)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def run(edits: int = 10, workloads=("typical", "pathological")):
+    main.init_renderer()
+    budget = main.TILE_CACHE_BYTES
+    print(f"{'workload':<14}{'full':>10}{'tiles':>10}{'saved':>9}")
+    for name in workloads:
+        lessons = WORKLOADS[name](1)
+        full = measure(lessons, edits, 0)
+        tiled = measure(lessons, edits, budget)
+        print(f"{name:<14}{full * 1000:8.0f}ms{tiled * 1000:8.0f}ms{1 - tiled / full:8.0%}")
+    main.TILE_CACHE_BYTES = budget
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
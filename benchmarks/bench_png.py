@@ -0,0 +1,63 @@
+"""PNG encode time vs. size for the encoder settings a profile can choose.
+
+Rasterizes each workload once, then encodes the same pixels with each
+setting. "rgba" is what charts were written as before png_encoder.py: Pillow
+defaults on the RGBA canvas. Savings are against it.
+
+Usage: python benchmarks/bench_png.py [iterations]
+"""
+
+import io
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import main
+from png_encoder import PngProfile, encode_png
+from workloads import WORKLOADS
+
+SETTINGS = {
+    "truecolor level=6": PngProfile("bench", colors=0),
+    "palette level=1": PngProfile("bench", level=1),
+    "palette level=6": PngProfile("bench"),
+    "palette level=9": PngProfile("bench", level=9),
+    "palette level=6 rle": PngProfile("bench", strategy="rle"),
+    "palette optimize": PngProfile("bench", optimize=True),
+}
+
+
+def rgba_png(pixels) -> bytes:
+    from PIL import Image
+
+    buf = io.BytesIO()
+    Image.fromarray(pixels, "RGBA").save(buf, format="PNG", dpi=(main.CHART_DPI,) * 2)
+    return buf.getvalue()
+
+
+def measure(encode, iterations: int):
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        data = encode()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings), len(data)
+
+
+def run(iterations: int = 3, workloads=("typical", "pathological")):
+    main.init_renderer()
+    print(f"{'workload':<14}{'setting':<22}{'encode':>10}{'bytes':>12}{'saved':>9}")
+    for name in workloads:
+        pixels = main.render_chart_image(WORKLOADS[name](1))
+        base_s, base_bytes = measure(lambda: rgba_png(pixels), iterations)
+        print(f"{name:<14}{'rgba':<22}{base_s * 1000:8.0f}ms{base_bytes:12d}{'':>9}")
+        for label, profile in SETTINGS.items():
+            seconds, size = measure(lambda: encode_png(pixels, profile, dpi=main.CHART_DPI), iterations)
+            print(f"{'':<14}{label:<22}{seconds * 1000:8.0f}ms{size:12d}{1 - size / base_bytes:8.0%}")
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
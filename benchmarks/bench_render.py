@@ -0,0 +1,75 @@
+"""Chart render latency: full figure redraw vs. composited background, and the
+SVG/PDF writers that bypass matplotlib.
+
+Usage: python benchmarks/bench_render.py [iterations]
+"""
+
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import main
+from main import Lesson, LessonSchedule, create_schedule_chart
+
+LESSONS = [
+    Lesson(name="ریاضی عمومی ۱", units=3, schedules=[
+        LessonSchedule(day="شنبه", start_time="08:00", end_time="10:00"),
+        LessonSchedule(day="دوشنبه", start_time="08:00", end_time="10:00"),
+    ]),
+    Lesson(name="فیزیک پایه یک و آزمایشگاه", units=3, schedules=[
+        LessonSchedule(day="یکشنبه", start_time="10:00", end_time="12:00"),
+    ]),
+    Lesson(name="برنامه‌سازی پیشرفته", units=3, schedules=[
+        LessonSchedule(day="سه‌شنبه", start_time="13:00", end_time="16:00"),
+    ]),
+    Lesson(name="زبان عمومی", units=2, schedules=[
+        LessonSchedule(day="چهارشنبه", start_time="14:00", end_time="16:00"),
+    ]),
+    Lesson(name="اندیشه اسلامی", units=2, schedules=[
+        LessonSchedule(day="پنج‌شنبه", start_time="09:00", end_time="11:00"),
+    ]),
+    Lesson(name="ادبیات فارسی", units=3, schedules=[
+        LessonSchedule(day="شنبه", start_time="16:00", end_time="18:00"),
+    ]),
+]
+
+
+def measure(composite: bool, iterations: int):
+    timings = []
+    for i in range(iterations):
+        started = time.perf_counter()
+        create_schedule_chart(LESSONS, filename=f"bench_{i}.png", composite=composite)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def measure_vector(fmt: str, iterations: int):
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        main.render_chart_document(LESSONS, fmt)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def report(label, timings):
+    print(f"{label:<10} first {timings[0] * 1000:8.1f} ms   "
+          f"median {statistics.median(timings[1:] or timings) * 1000:8.1f} ms   "
+          f"min {min(timings) * 1000:8.1f} ms")
+
+
+def run(iterations: int = 5):
+    with tempfile.TemporaryDirectory() as out_dir:
+        main.CHARTS_DIR = out_dir
+        report("full", measure(False, iterations))
+        report("composite", measure(True, iterations))
+        report("svg", measure_vector("svg", iterations))
+        report("pdf", measure_vector("pdf", iterations))
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,170 @@
+"""Throughput of the preloaded server from 1 to N workers, and its memory.
+
+For each worker count the app is started with server.py and loaded with
+cache-busting form posts from two clients per worker, so every request
+renders a preview. The report gives throughput, the speedup over one
+worker and the scaling efficiency (speedup / workers). Scaling tops out at
+the number of CPUs the machine actually has.
+
+Memory is read from /proc after the load; a worker's figures include its
+render process. RSS counts the pages a worker shares with the preloaded
+parent in every worker; PSS splits them between the processes sharing them,
+so the PSS total is what the whole server costs. ``--compare`` runs ``uvicorn --workers`` at the highest count too,
+where every worker imports and warms up on its own.
+
+Each run finally checks the shared chart index: charts are rendered once,
+then fetched again over fresh connections, which land on any worker. Every
+one should be a cache hit.
+
+Usage: python benchmarks/bench_scaling.py [--workers 1 2 4] [--duration 20] [--compare]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from loadgen import Connection, LoadGenerator, lesson_dicts, serve
+from workloads import typical
+
+
+def _proc_children(pid: int) -> List[int]:
+    children = []
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat") as f:
+                # The command name may contain spaces; fields resume after its ")"
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            with open(f"/proc/{name}/cmdline", "rb") as f:
+                cmdline = f.read()
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid and b"resource_tracker" not in cmdline:
+            children.append(int(name))
+    return children
+
+
+def _listener_pid(port: int) -> int:
+    needle = f"--port\0{port}\0".encode()
+    for name in os.listdir("/proc"):
+        if name.isdigit():
+            try:
+                with open(f"/proc/{name}/cmdline", "rb") as f:
+                    if needle in f.read():
+                        return int(name)
+            except OSError:
+                continue
+    raise RuntimeError(f"no server process for port {port}")
+
+
+def _memory(pid: int) -> Dict[str, int]:
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            if name in ("Rss", "Pss"):
+                fields[name.lower()] = int(value.split()[0]) * 1024
+    return fields
+
+
+def _tree_memory(pid: int) -> Dict[str, int]:
+    """Memory of ``pid`` and its descendants (a worker and its render processes)."""
+    total = _memory(pid)
+    for child in _proc_children(pid):
+        for name, value in _tree_memory(child).items():
+            total[name] += value
+    return total
+
+
+def server_memory(port: int, supervised: bool = True) -> Dict[str, Any]:
+    parent = _listener_pid(port)
+    if supervised:
+        own = _memory(parent)
+        workers = [_tree_memory(pid) for pid in _proc_children(parent)]
+    else:
+        # uvicorn serves a single worker from the process it started in
+        own = {"rss": 0, "pss": 0}
+        workers = [_tree_memory(parent)]
+    return {
+        "parent_rss": own["rss"],
+        "worker_rss": max(w["rss"] for w in workers),
+        "worker_pss": max(w["pss"] for w in workers),
+        "total_rss": own["rss"] + sum(w["rss"] for w in workers),
+        "total_pss": own["pss"] + sum(w["pss"] for w in workers),
+    }
+
+
+async def shared_cache_hits(url: str, charts: int) -> float:
+    """Share of repeat chart requests, on fresh connections, served from the cache."""
+    port = int(url.rsplit(":", 1)[1])
+    bodies = [json.dumps(lesson_dicts(typical(9000 + i)), ensure_ascii=False).encode() for i in range(charts)]
+    headers = {"Content-Type": "application/json"}
+
+    async def post(body):
+        connection = Connection("127.0.0.1", port)
+        try:
+            _, response_headers, _ = await connection.request("POST", "/api/chart?format=svg", body, headers)
+            return response_headers.get("x-cache")
+        finally:
+            connection.close()
+
+    for body in bodies:
+        await post(body)
+    repeats = [await post(body) for body in bodies for _ in range(3)]
+    return repeats.count("hit") / len(repeats)
+
+
+def measure(workers: int, duration: float, warmup: float, app_server: str = "prefork") -> Dict[str, Any]:
+    corpus = [{"workload": "typical", "lessons_data": lesson_dicts(typical(seed))} for seed in range(50)]
+    # One render process per worker, as server.py runs by default
+    env = {"HAFTESOOZ_RENDER_WORKERS": "1", "HAFTESOOZ_SERVER_WORKERS": str(workers)}
+    with serve("uvicorn", workers, env=env, app_server=app_server) as url:
+        generator = LoadGenerator(url, corpus, cache_bust=True)
+        step = asyncio.run(generator.ramp([2 * workers], duration, warmup))[0]
+        memory = server_memory(int(url.rsplit(":", 1)[1]), supervised=app_server == "prefork" or workers > 1)
+        hits = asyncio.run(shared_cache_hits(url, 8))
+    return {"app_server": app_server, "workers": workers, "throughput_rps": step["throughput_rps"],
+            "p50_s": step["p50_s"], "error_rate": step["error_rate"], "shared_hit_rate": hits, **memory}
+
+
+def format_run(run: Dict[str, Any], base_rps: float) -> str:
+    mb = 1024 * 1024
+    speedup = run["throughput_rps"] / base_rps if base_rps else 0.0
+    return (f"{run['app_server']:<9}{run['workers']:>3}{run['throughput_rps']:9.2f}{speedup:9.2f}x"
+            f"{speedup / run['workers']:8.0%}{run['worker_rss'] / mb:10.0f}{run['worker_pss'] / mb:10.0f}"
+            f"{run['total_pss'] / mb:11.0f}{run['shared_hit_rate']:8.0%}")
+
+
+def main_cli(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({1, 2, os.cpu_count() or 1}))
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of load per worker count")
+    parser.add_argument("--warmup", type=float, default=5.0)
+    parser.add_argument("--compare", action="store_true", help="also run uvicorn --workers at the highest count")
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args(argv)
+
+    runs = [measure(n, args.duration, args.warmup) for n in args.workers]
+    if args.compare:
+        runs.append(measure(max(args.workers), args.duration, args.warmup, app_server="uvicorn"))
+
+    base = runs[0]["throughput_rps"]
+    print(f"\n{os.cpu_count()} CPUs")
+    print(f"{'server':<9}{'n':>3}{'req/s':>9}{'speedup':>10}{'eff.':>8}{'RSS MB':>10}{'PSS MB':>10}"
+          f"{'total PSS':>11}{'hits':>8}")
+    for run in runs:
+        print(format_run(run, base))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(runs, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
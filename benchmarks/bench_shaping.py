@@ -0,0 +1,58 @@
+"""Persian shaping cost per chart label: uncached vs. memoized vs. fallback.
+
+Usage: python benchmarks/bench_shaping.py [rounds]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from shaping import PersianShaper, _fallback_bidi_approx, shape_line_uncached
+
+NAMES = [
+    "ریاضی عمومی ۱", "فیزیک پایه یک و آزمایشگاه", "برنامه‌سازی پیشرفته",
+    "زبان عمومی", "اندیشه اسلامی", "ادبیات فارسی", "مدارهای الکتریکی",
+    "ساختمان داده‌ها و الگوریتم‌ها",
+]
+DAYS = ["شنبه", "یکشنبه", "دوشنبه", "سه‌شنبه", "چهارشنبه", "پنج‌شنبه", "جمعه"]
+
+
+def chart_strings():
+    """Roughly what one render shapes: days, title and candidate labels."""
+    strings = DAYS + ["برنامه هفتگی دروس"]
+    for name in NAMES:
+        words = name.split()
+        strings.append(f"{name}\n(3 واحد)")
+        for i in range(1, len(words)):
+            strings.append(f"{' '.join(words[:i])}\n{' '.join(words[i:])}\n(3 واحد)")
+    return strings
+
+
+def per_label(fn, strings, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        fn(strings)
+    return (time.perf_counter() - started) / (rounds * len(strings)) * 1e6
+
+
+def run(rounds: int = 200):
+    strings = chart_strings()
+    shaper = PersianShaper()
+    shaper.preload(DAYS + ["برنامه هفتگی دروس", "(3 واحد)"])
+
+    uncached = per_label(
+        lambda ss: [shape_line_uncached(s) for s in ss], strings, rounds)
+    cached = per_label(shaper.shape_many, strings, rounds)
+    fallback = per_label(
+        lambda ss: [_fallback_bidi_approx(s) for s in ss], strings, rounds)
+
+    print(f"{len(strings)} strings per chart, {rounds} rounds")
+    print(f"uncached reshape+bidi  {uncached:9.2f} us/label")
+    print(f"memoized shaper        {cached:9.2f} us/label  (hit rate {shaper.stats()['hit_rate']:.1%})")
+    print(f"fallback approximation {fallback:9.2f} us/label")
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
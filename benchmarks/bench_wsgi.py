@@ -0,0 +1,194 @@
+"""Cost of the WSGI entry points used on shared hosting.
+
+Starts the app under uvicorn (standing in for Daphne) and times the same
+requests sent:
+
+* direct: over one keep-alive connection straight to the server;
+* proxy: through passenger_wsgi's ``ProxyApp``, called in-process with a
+  WSGI environ, over its pooled connections;
+* per-request connection: a new connection per request, body read whole,
+  which is what the old ``requests.request`` forwarding did;
+* bridge: bridge_wsgi's ``AsgiBridge`` serving the app in this process;
+* wsgi.py: the generic adapter wsgi.py picks, when one is installed.
+
+The difference to "direct" is the overhead an entry point adds. Each mode
+is then run from several threads at once, the way Passenger calls a WSGI
+app, for its throughput.
+
+Usage: python benchmarks/bench_wsgi.py [requests] [threads]
+"""
+
+import http.client
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.util import setup_testing_defaults
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from loadgen import ROOT, free_port, lesson_dicts, wait_ready
+from workloads import typical
+from wsgi_proxy import ProxyApp
+
+
+def environ(method, path, body=b"", content_type=None):
+    env = {"REQUEST_METHOD": method, "PATH_INFO": path, "wsgi.input": io.BytesIO(body),
+           "CONTENT_LENGTH": str(len(body)) if body else "", "REMOTE_ADDR": "127.0.0.1"}
+    if content_type:
+        env["CONTENT_TYPE"] = content_type
+    setup_testing_defaults(env)
+    return env
+
+
+def call_wsgi(app, method, path, body=b"", content_type=None):
+    status = []
+    result = app(environ(method, path, body, content_type), lambda s, h, exc_info=None: status.append(s))
+    try:
+        size = sum(len(chunk) for chunk in result)
+    finally:
+        getattr(result, "close", lambda: None)()
+    assert status[0].startswith("2"), status[0]
+    return size
+
+
+def direct(conn):
+    def request(method, path, body=b"", content_type=None):
+        conn.request(method, path, body or None, {"Content-Type": content_type} if content_type else {})
+        response = conn.getresponse()
+        data = response.read()
+        assert 200 <= response.status < 300, response.status
+        return len(data)
+    return request
+
+
+def per_connection(port):
+    def request(method, path, body=b"", content_type=None):
+        conn = http.client.HTTPConnection("127.0.0.1", port)
+        try:
+            return direct(conn)(method, path, body, content_type)
+        finally:
+            conn.close()
+    return request
+
+
+def via_wsgi(app):
+    def request(method, path, body=b"", content_type=None):
+        return call_wsgi(app, method, path, body, content_type)
+    return request
+
+
+def keepalive(port):
+    local = threading.local()
+
+    def request(method, path, body=b"", content_type=None):
+        if not hasattr(local, "conn"):
+            local.conn = http.client.HTTPConnection("127.0.0.1", port)
+        return direct(local.conn)(method, path, body, content_type)
+    return request
+
+
+def time_requests(request, method, path, body, content_type, n):
+    request(method, path, body, content_type)
+    timings = []
+    for _ in range(n):
+        started = time.perf_counter()
+        request(method, path, body, content_type)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return statistics.median(timings), timings[int(0.95 * (len(timings) - 1))]
+
+
+def throughput(request, method, path, body, content_type, n, threads):
+    """Requests per second with ``threads`` threads issuing ``n`` requests in total."""
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(lambda _: request(method, path, body, content_type), range(threads)))
+        started = time.perf_counter()
+        list(pool.map(lambda _: request(method, path, body, content_type), range(n)))
+        return n / (time.perf_counter() - started)
+
+
+def wsgi_py_application():
+    """wsgi.py's application, or None when it found no adapter to wrap the app with."""
+    import wsgi
+
+    try:
+        call_wsgi(wsgi.application, "GET", "/health")
+    except AssertionError:
+        return None
+    return wsgi.application
+
+
+def cases(port):
+    """(label, method, path, body, content type): a cheap request, a multi-MB chart and a form post."""
+    lessons = lesson_dicts(typical(1))
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    conn.request("POST", "/api/chart", json.dumps(lessons).encode(), {"Content-Type": "application/json"})
+    response = conn.getresponse()
+    response.read()
+    chart = response.getheader("Content-Location")
+    conn.close()
+    form = "lessons_data=" + json.dumps(lessons)
+    return [
+        ("GET /health", "GET", "/health", b"", None),
+        ("GET chart png", "GET", chart, b"", None),
+        ("POST /generate_chart", "POST", "/generate_chart", form.encode(), "application/x-www-form-urlencoded"),
+    ]
+
+
+def report(results, rates, threads):
+    print(f"{'':<24}{'mode':<26}{'median':>10}{'p95':>10}{'overhead':>10}{f'req/s x{threads}':>14}")
+    for label, modes in results.items():
+        base = modes["direct"][0]
+        for mode, (median, p95) in modes.items():
+            print(f"{label:<24}{mode:<26}{median * 1000:8.2f}ms{p95 * 1000:8.2f}ms"
+                  f"{(median - base) * 1000:+8.2f}ms{rates[label][mode]:14.1f}")
+
+
+def run(n: int = 200, threads: int = 8):
+    # main.py finds static/ and templates/ relative to the working directory
+    os.chdir(ROOT)
+    os.environ.setdefault("HAFTESOOZ_REQUEST_LOG", "0")
+    from asgi_bridge import AsgiBridge
+    from main import app
+
+    port = free_port()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+                               "--port", str(port), "--log-level", "warning", "--no-access-log"],
+                              cwd=ROOT, env=dict(os.environ, HAFTESOOZ_REQUEST_LOG="0"))
+    bridge = AsgiBridge(app)
+    try:
+        wait_ready(f"http://127.0.0.1:{port}/health")
+        modes = {
+            "direct": keepalive(port),
+            "proxy": via_wsgi(ProxyApp("127.0.0.1", port, pool_size=threads)),
+            "per-request connection": per_connection(port),
+            "bridge": via_wsgi(bridge),
+        }
+        adapter = wsgi_py_application()
+        if adapter is not None:
+            modes["wsgi.py"] = via_wsgi(adapter)
+        else:
+            print("wsgi.py found no ASGI->WSGI adapter installed; skipping it")
+        results, rates = {}, {}
+        for label, method, path, body, content_type in cases(port):
+            results[label] = {mode: time_requests(request, method, path, body, content_type, n)
+                              for mode, request in modes.items()}
+            rates[label] = {mode: throughput(request, method, path, body, content_type, n, threads)
+                            for mode, request in modes.items()}
+        report(results, rates, threads)
+        return results, rates
+    finally:
+        bridge.stop()
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 200, int(sys.argv[2]) if len(sys.argv) > 2 else 8)
@@ -0,0 +1,456 @@
+"""HTTP load test: replay form submissions against a running app.
+
+Posts ``lessons_data`` payloads to ``/generate_chart`` the way the browser
+form does, over keep-alive connections, with closed-loop clients. The
+concurrency is ramped step by step and each step reports throughput, error
+rate and p50/p95/p99 latency. The point where p99 collapses is the capacity
+of the deployment under test.
+
+Payloads come from a JSONL corpus, one object per line with a
+``lessons_data`` list (or the JSON string the form sends). The ``corpus``
+command writes one from the generators in workloads.py. Captured traffic in
+the same shape can be replayed as it is.
+
+The app can be started for the run: ``--serve uvicorn`` runs it under
+uvicorn, and ``--serve nginx`` also puts nginx in front of it, using
+nginx.conf rewritten for local ports and paths. ``--app-server prefork``
+runs the app with server.py instead of ``uvicorn --workers``. The same run can instead be
+pointed at any address with ``--url``.
+
+Usage:
+    python benchmarks/loadgen.py corpus --count 500 --output corpus.jsonl
+    python benchmarks/loadgen.py run --corpus corpus.jsonl --serve uvicorn --concurrency 1 2 4 8 16
+    python benchmarks/loadgen.py run --corpus corpus.jsonl --serve nginx --app-workers 2
+    python benchmarks/loadgen.py run --corpus corpus.jsonl --url http://127.0.0.1:8000 --output load.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import math
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlencode, urlsplit
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Share of each workload in a generated corpus
+CORPUS_MIX = {"typical": 0.8, "small": 0.15, "pathological": 0.05}
+
+
+def lesson_dicts(lessons) -> List[Dict[str, Any]]:
+    return [{"name": lesson.name, "units": lesson.units,
+             "schedules": [{"day": s.day, "start_time": s.start_time, "end_time": s.end_time}
+                           for s in lesson.schedules]}
+            for lesson in lessons]
+
+
+def write_corpus(path: str, count: int, seed: int, mix: Dict[str, float] = CORPUS_MIX):
+    from workloads import WORKLOADS
+
+    rng = random.Random(seed)
+    names, weights = zip(*mix.items())
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(count):
+            workload = rng.choices(names, weights)[0]
+            line = {"workload": workload, "lessons_data": lesson_dicts(WORKLOADS[workload](seed + i))}
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+
+def load_corpus(path: str) -> List[Dict[str, Any]]:
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                if isinstance(entry.get("lessons_data"), str):
+                    entry["lessons_data"] = json.loads(entry["lessons_data"])
+                entries.append(entry)
+    if not entries:
+        raise SystemExit(f"{path}: empty corpus")
+    return entries
+
+
+def form_body(entry: Dict[str, Any], bust: Optional[str] = None) -> bytes:
+    """The urlencoded form the browser posts. ``bust`` is appended to the first
+    lesson's name, making the schedule (and so its cache key) unique."""
+    lessons = entry["lessons_data"]
+    if bust and lessons:
+        lessons = [dict(lessons[0], name=f"{lessons[0]['name']} {bust}")] + lessons[1:]
+    return urlencode({"lessons_data": json.dumps(lessons, ensure_ascii=False)}).encode()
+
+
+class Connection:
+    """One keep-alive HTTP/1.1 connection; enough of the protocol for this app."""
+
+    def __init__(self, host: str, port: int):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+
+    async def _connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+    async def request(self, method: str, path: str, body: bytes = b"",
+                      headers: Optional[Dict[str, str]] = None) -> Tuple[int, Dict[str, str], bytes]:
+        if self.writer is None:
+            await self._connect()
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}",
+                 f"Content-Length: {len(body)}"]
+        lines += [f"{k}: {v}" for k, v in (headers or {}).items()]
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        try:
+            await self.writer.drain()
+            status, response_headers, data = await self._read_response()
+        except BaseException:
+            self.close()
+            raise
+        if response_headers.get("connection", "").lower() == "close":
+            self.close()
+        return status, response_headers, data
+
+    async def _read_response(self):
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("connection closed by server")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await self.reader.readline()
+                    break
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readline()
+            return status, headers, b"".join(chunks)
+        if "content-length" in headers:
+            return status, headers, await self.reader.readexactly(int(headers["content-length"]))
+        data = await self.reader.read()
+        self.close()
+        return status, headers, data
+
+
+def percentile(ordered: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+@dataclass
+class StepResult:
+    concurrency: int
+    duration: float = 0.0
+    latencies: List[float] = field(default_factory=list)
+    statuses: Dict[str, int] = field(default_factory=dict)
+    errors: int = 0
+    chart_fetches: int = 0
+
+    def record(self, outcome: str, latency: Optional[float], ok: bool):
+        self.statuses[outcome] = self.statuses.get(outcome, 0) + 1
+        if ok:
+            self.latencies.append(latency)
+        else:
+            self.errors += 1
+
+    def summary(self) -> Dict[str, Any]:
+        requests = sum(self.statuses.values())
+        ordered = sorted(self.latencies)
+        return {
+            "concurrency": self.concurrency,
+            "requests": requests,
+            "ok": len(ordered),
+            "errors": self.errors,
+            "error_rate": self.errors / requests if requests else 0.0,
+            "statuses": dict(sorted(self.statuses.items())),
+            "throughput_rps": len(ordered) / self.duration if self.duration else 0.0,
+            "p50_s": percentile(ordered, 50),
+            "p95_s": percentile(ordered, 95),
+            "p99_s": percentile(ordered, 99),
+            "max_s": ordered[-1] if ordered else None,
+            "duration_s": self.duration,
+        }
+
+
+class LoadGenerator:
+    def __init__(self, url: str, corpus: List[Dict[str, Any]], path: str = "/generate_chart",
+                 timeout: float = 60.0, cache_bust: bool = False, fetch_chart: bool = False, seed: int = 0):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.path = path
+        self.corpus = corpus
+        self.timeout = timeout
+        self.cache_bust = cache_bust
+        self.fetch_chart = fetch_chart
+        self._rng = random.Random(seed)
+        self._sequence = 0
+        self._run = f"{seed:x}{int(time.time()) % 100000:x}"
+
+    def _next_body(self) -> bytes:
+        self._sequence += 1
+        entry = self.corpus[self._rng.randrange(len(self.corpus))]
+        return form_body(entry, f"{self._run}-{self._sequence}" if self.cache_bust else None)
+
+    async def _client(self, result: StepResult, deadline: float):
+        connection = Connection(self.host, self.port)
+        try:
+            while time.perf_counter() < deadline:
+                body = self._next_body()
+                started = time.perf_counter()
+                try:
+                    status, _, page = await asyncio.wait_for(connection.request(
+                        "POST", self.path, body, {"Content-Type": "application/x-www-form-urlencoded"}),
+                        self.timeout)
+                    # The form answers 200 with an error message when rendering fails
+                    ok = status == 200 and b'src="/chart/' in page
+                    if ok and self.fetch_chart:
+                        ok = await self._fetch_chart(connection, page, result)
+                    outcome = str(status) if status != 200 or ok else "200-error"
+                except asyncio.TimeoutError:
+                    connection.close()
+                    ok, outcome = False, "timeout"
+                except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError) as exc:
+                    connection.close()
+                    ok, outcome = False, type(exc).__name__
+                result.record(outcome, time.perf_counter() - started, ok)
+                if outcome == "503":
+                    # Shed by admission control; back off like a browser user would
+                    await asyncio.sleep(0.1)
+        finally:
+            connection.close()
+
+    async def _fetch_chart(self, connection: Connection, page: bytes, result: StepResult) -> bool:
+        start = page.index(b'src="/chart/') + 5
+        src = page[start:page.index(b'"', start)].decode()
+        status, _, _ = await asyncio.wait_for(connection.request("GET", src), self.timeout)
+        result.chart_fetches += 1
+        return status == 200
+
+    async def step(self, concurrency: int, duration: float) -> StepResult:
+        result = StepResult(concurrency)
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(self._client(result, deadline) for _ in range(concurrency)))
+        result.duration = time.perf_counter() - started
+        return result
+
+    async def ramp(self, levels: List[int], duration: float, warmup: float = 0.0) -> List[Dict[str, Any]]:
+        if warmup:
+            await self.step(max(1, min(levels)), warmup)
+        steps = []
+        for concurrency in levels:
+            summary = (await self.step(concurrency, duration)).summary()
+            print(format_step(summary), flush=True)
+            steps.append(summary)
+        return steps
+
+
+def format_step(step: Dict[str, Any]) -> str:
+    def ms(value):
+        return f"{value * 1000:8.0f}" if value is not None else "       -"
+
+    return (f"c={step['concurrency']:<4} {step['requests']:6d} req  {step['throughput_rps']:7.2f} req/s  "
+            f"err {step['error_rate']:6.1%}  p50 {ms(step['p50_s'])}  p95 {ms(step['p95_s'])}  "
+            f"p99 {ms(step['p99_s'])} ms")
+
+
+def capacity(steps: List[Dict[str, Any]], p99_limit: float, max_error_rate: float) -> Optional[Dict[str, Any]]:
+    """The step with the best throughput that still met the p99 and error limits."""
+    good = [s for s in steps
+            if s["p99_s"] is not None and s["p99_s"] <= p99_limit and s["error_rate"] <= max_error_rate]
+    return max(good, key=lambda s: s["throughput_rps"]) if good else None
+
+
+# --- Local servers -----------------------------------------------------------
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(url: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with urllib.request.urlopen(url, timeout=5):
+                return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+            time.sleep(0.25)
+
+
+def nginx_config(source: str, prefix: str, listen_port: int, upstream_port: int) -> str:
+    """nginx.conf rewritten to run unprivileged on this machine against the local app."""
+    with open(source) as f:
+        config = f.read()
+    replacements = {
+        "server app:8000;": f"server 127.0.0.1:{upstream_port};\n        keepalive 32;",
+        "listen 80;": f"listen 127.0.0.1:{listen_port};",
+        "/app/static/": f"{os.path.join(ROOT, 'static')}/",
+        "/app/generated_charts": os.path.join(ROOT, "generated_charts"),
+        "/var/log/nginx/access.log": os.path.join(prefix, "access.log"),
+        "/var/log/nginx/error.log": os.path.join(prefix, "error.log"),
+    }
+    for old, new in replacements.items():
+        if old not in config:
+            raise ValueError(f"nginx.conf no longer contains {old!r}; update nginx_config()")
+        config = config.replace(old, new)
+    if not os.path.exists("/etc/nginx/mime.types"):
+        config = config.replace("include       /etc/nginx/mime.types;", "")
+    temp_paths = "".join(f"    {name}_temp_path {os.path.join(prefix, name)};\n"
+                         for name in ("client_body", "proxy", "fastcgi", "uwsgi", "scgi"))
+    # Upstream keep-alive needs HTTP/1.1 and an empty Connection header
+    config = config.replace("proxy_pass http://app;",
+                            'proxy_pass http://app;\n            proxy_http_version 1.1;\n'
+                            '            proxy_set_header Connection "";')
+    config = config.replace("http {\n", "http {\n" + temp_paths, 1)
+    return f"pid {os.path.join(prefix, 'nginx.pid')};\n" + config
+
+
+APP_SERVERS = {
+    "uvicorn": [sys.executable, "-m", "uvicorn", "main:app"],
+    # Workers forked from one preloaded parent (server.py)
+    "prefork": [sys.executable, "server.py"],
+}
+
+
+@contextlib.contextmanager
+def serve(mode: str, app_workers: int, env: Optional[Dict[str, str]] = None,
+          app_server: str = "uvicorn") -> Iterator[str]:
+    """Start the app (and nginx in front of it for "nginx"); yield the base URL."""
+    app_port = free_port()
+    app_env = dict(os.environ, HAFTESOOZ_REQUEST_LOG="0", **(env or {}))
+    processes = [subprocess.Popen(
+        APP_SERVERS[app_server] + ["--host", "127.0.0.1", "--port", str(app_port),
+                                   "--workers", str(app_workers), "--no-access-log", "--log-level", "warning"],
+        cwd=ROOT, env=app_env)]
+    prefix = tempfile.mkdtemp(prefix="haftesooz-nginx-")
+    try:
+        url = f"http://127.0.0.1:{app_port}"
+        wait_ready(url + "/")
+        if mode == "nginx":
+            nginx = shutil.which("nginx")
+            if nginx is None:
+                raise SystemExit("nginx is not installed")
+            listen_port = free_port()
+            conf = os.path.join(prefix, "nginx.conf")
+            with open(conf, "w") as f:
+                f.write(nginx_config(os.path.join(ROOT, "nginx.conf"), prefix, listen_port, app_port))
+            processes.append(subprocess.Popen([nginx, "-p", prefix, "-c", conf, "-g", "daemon off;"]))
+            url = f"http://127.0.0.1:{listen_port}"
+            wait_ready(url + "/")
+        yield url
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        shutil.rmtree(prefix, ignore_errors=True)
+
+
+def run_load(args) -> Dict[str, Any]:
+    corpus = load_corpus(args.corpus)
+
+    def run_against(url):
+        generator = LoadGenerator(url, corpus, path=args.path, timeout=args.timeout, cache_bust=args.cache_bust,
+                                  fetch_chart=args.fetch_chart, seed=args.seed)
+        return asyncio.run(generator.ramp(args.concurrency, args.duration, args.warmup))
+
+    if args.url:
+        target = args.url
+        steps = run_against(args.url)
+    else:
+        with serve(args.serve, args.app_workers, app_server=args.app_server) as url:
+            target = f"{args.serve} ({args.app_server}, {url})"
+            steps = run_against(url)
+    best = capacity(steps, args.p99_limit, args.max_error_rate)
+    return {
+        "target": target,
+        "corpus": {"path": args.corpus, "entries": len(corpus)},
+        "config": {"concurrency": args.concurrency, "duration_s": args.duration, "cache_bust": args.cache_bust,
+                   "fetch_chart": args.fetch_chart, "p99_limit_s": args.p99_limit,
+                   "max_error_rate": args.max_error_rate},
+        "steps": steps,
+        "capacity": best,
+    }
+
+
+def main_cli(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    corpus = commands.add_parser("corpus", help="write a synthetic JSONL corpus")
+    corpus.add_argument("--count", type=int, default=500)
+    corpus.add_argument("--seed", type=int, default=1)
+    corpus.add_argument("--output", default="corpus.jsonl")
+
+    run = commands.add_parser("run", help="ramp concurrency against the app")
+    run.add_argument("--corpus", required=True)
+    target = run.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="an already running app, e.g. http://127.0.0.1:8000")
+    target.add_argument("--serve", choices=["uvicorn", "nginx"], help="start the app locally for the run")
+    run.add_argument("--app-workers", type=int, default=1, help="app worker processes (--serve)")
+    run.add_argument("--app-server", choices=sorted(APP_SERVERS), default="uvicorn",
+                     help="how --serve runs the app: uvicorn, or server.py's preloaded workers")
+    run.add_argument("--path", default="/generate_chart")
+    run.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    run.add_argument("--duration", type=float, default=20.0, help="seconds per concurrency step")
+    run.add_argument("--warmup", type=float, default=5.0, help="seconds of unmeasured load first")
+    run.add_argument("--timeout", type=float, default=60.0, help="per-request timeout")
+    run.add_argument("--cache-bust", action="store_true", help="make every schedule unique (no cache hits)")
+    run.add_argument("--fetch-chart", action="store_true", help="also GET the chart image, like a browser")
+    run.add_argument("--p99-limit", type=float, default=5.0, help="p99 seconds a step may take to count")
+    run.add_argument("--max-error-rate", type=float, default=0.01)
+    run.add_argument("--seed", type=int, default=0)
+    run.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args(argv)
+
+    if args.command == "corpus":
+        write_corpus(args.output, args.count, args.seed)
+        print(f"{args.count} payloads written to {args.output}")
+        return 0
+
+    results = run_load(args)
+    best = results["capacity"]
+    if best:
+        print(f"Capacity: {best['throughput_rps']:.2f} req/s at concurrency {best['concurrency']} "
+              f"(p99 {best['p99_s']:.2f}s)")
+    else:
+        print(f"No step kept p99 under {args.p99_limit}s with under {args.max_error_rate:.0%} errors")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,252 @@
+"""Reproducible chart generation benchmarks.
+
+For every workload (see workloads.py) and output format this measures:
+
+* cold latency: the first render in a fresh process, renderer setup included;
+* warm latency: median and p95 over renders of distinct schedules once warm;
+* peak memory: peak RSS of that process before and after rendering;
+* output size: median encoded size;
+* throughput: charts per second rendered by N worker processes.
+
+Each case runs in its own spawned process, so one format's caches and peak
+memory do not leak into the next. Results go to a JSON file; given a
+baseline file from an earlier run, any metric that got worse by more than
+the threshold is reported and the exit status is 1, so the suite can gate
+merges.
+
+Usage:
+    python benchmarks/suite.py --output bench.json
+    python benchmarks/suite.py --baseline bench.json --threshold 0.15
+    python benchmarks/suite.py --quick --workloads typical --formats png svg
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from workloads import WORKLOADS
+
+FORMATS = ("png", "png-full", "svg", "pdf", "json")
+
+# Metric, and whether a larger value is better
+COMPARED_METRICS = (
+    ("cold_s", False),
+    ("warm_median_s", False),
+    ("warm_p95_s", False),
+    ("peak_rss_bytes", False),
+    ("output_bytes", False),
+    ("throughput", True),
+)
+
+
+def render(lessons, fmt: str) -> int:
+    """Render ``lessons`` in ``fmt`` the way the app does; return the output size."""
+    import main
+
+    if fmt == "png":
+        return len(main.render_chart_png(lessons))
+    if fmt == "png-full":
+        # The reference path that draws the whole figure and calls savefig
+        filename = main.create_schedule_chart(lessons, composite=False)
+        path = os.path.join(main.CHARTS_DIR, filename)
+        size = os.path.getsize(path)
+        os.remove(path)
+        return size
+    return len(main.render_chart_document(lessons, fmt))
+
+
+def _peak_rss() -> Optional[int]:
+    from instrumentation import peak_rss_bytes
+
+    return peak_rss_bytes()
+
+
+def _use_scratch_dir():
+    import main
+
+    main.CHARTS_DIR = tempfile.mkdtemp(prefix="haftesooz-bench-")
+
+
+def measure_case(workload: str, fmt: str, iterations: int, seed: int) -> Dict[str, Any]:
+    """Run in a fresh process: one cold render, then ``iterations`` warm ones."""
+    started = time.perf_counter()
+    import main
+    import_s = time.perf_counter() - started
+    _use_scratch_dir()
+    rss_before = _peak_rss()
+
+    generate = WORKLOADS[workload]
+    started = time.perf_counter()
+    sizes = [render(generate(seed), fmt)]
+    cold = time.perf_counter() - started
+
+    timings = []
+    for i in range(1, iterations + 1):
+        lessons = generate(seed + i)
+        started = time.perf_counter()
+        sizes.append(render(lessons, fmt))
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return {
+        "workload": workload,
+        "format": fmt,
+        "import_s": import_s,
+        "cold_s": cold,
+        "warm_median_s": statistics.median(timings),
+        "warm_p95_s": timings[min(len(timings) - 1, int(round(0.95 * (len(timings) - 1))))],
+        "warm_min_s": timings[0],
+        "iterations": iterations,
+        "output_bytes": int(statistics.median(sizes)),
+        "rss_before_bytes": rss_before,
+        "peak_rss_bytes": _peak_rss(),
+        "blocks": sum(len(lesson.schedules) for lesson in generate(seed)),
+    }
+
+
+def _warm_worker():
+    import main
+
+    _use_scratch_dir()
+    main.warm_up_renderer()
+
+
+def _render_task(workload: str, fmt: str, seed: int) -> int:
+    return render(WORKLOADS[workload](seed), fmt)
+
+
+def measure_throughput(workload: str, fmt: str, workers: int, charts: int, seed: int) -> float:
+    """Charts per second for ``charts`` distinct schedules over ``workers`` warm processes."""
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=_warm_worker) as pool:
+        # Make sure every worker is up and warm before the clock starts
+        list(pool.map(_render_task, [workload] * workers, [fmt] * workers, range(seed - workers, seed)))
+        started = time.perf_counter()
+        list(pool.map(_render_task, [workload] * charts, [fmt] * charts, range(seed, seed + charts)))
+        return charts / (time.perf_counter() - started)
+
+
+def run_isolated(fn, *args):
+    """Run ``fn(*args)`` in a freshly spawned process and return its result."""
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(1, mp_context=context) as pool:
+        return pool.submit(fn, *args).result()
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(workloads: List[str], formats: List[str], iterations: int, workers: List[int],
+              charts: int, seed: int, throughput_formats: List[str]) -> Dict[str, Any]:
+    results = {}
+    for workload in workloads:
+        for fmt in formats:
+            case = run_isolated(measure_case, workload, fmt, iterations, seed)
+            if fmt in throughput_formats:
+                case["throughput"] = {str(n): measure_throughput(workload, fmt, n, charts, seed + 1000)
+                                      for n in workers}
+            results[f"{workload}/{fmt}"] = case
+            print(format_case(case), flush=True)
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "config": {"iterations": iterations, "workers": workers, "charts": charts, "seed": seed},
+        },
+        "results": results,
+    }
+
+
+def format_case(case: Dict[str, Any]) -> str:
+    line = (f"{case['workload'] + '/' + case['format']:<22} cold {case['cold_s'] * 1000:8.1f} ms  "
+            f"warm {case['warm_median_s'] * 1000:8.1f} ms (p95 {case['warm_p95_s'] * 1000:8.1f})  "
+            f"{case['output_bytes'] / 1024:8.1f} KiB")
+    if case.get("peak_rss_bytes"):
+        line += f"  peak {case['peak_rss_bytes'] / 2 ** 20:6.0f} MiB"
+    for n, rate in case.get("throughput", {}).items():
+        line += f"  {n}w {rate:6.2f}/s"
+    return line
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[str]:
+    """Metrics of cases present in both runs that got worse by more than ``threshold``."""
+    regressions = []
+    for name, case in current["results"].items():
+        old = baseline.get("results", {}).get(name)
+        if old is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS:
+            before, after = old.get(metric), case.get(metric)
+            if before is None or after is None:
+                continue
+            if isinstance(before, dict):
+                pairs = [(f"{metric}[{k}]", before[k], after[k]) for k in before if k in after]
+            else:
+                pairs = [(metric, before, after)]
+            for label, b, a in pairs:
+                if not b:
+                    continue
+                change = (b - a) / b if higher_is_better else (a - b) / b
+                if change > threshold:
+                    regressions.append(f"{name} {label}: {b:.6g} -> {a:.6g} ({change:+.1%} worse)")
+    return regressions
+
+
+def main_cli(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workloads", nargs="+", default=list(WORKLOADS), choices=list(WORKLOADS))
+    parser.add_argument("--formats", nargs="+", default=list(FORMATS), choices=FORMATS)
+    parser.add_argument("--iterations", type=int, default=10, help="warm renders per case")
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({1, 2, os.cpu_count() or 1}))
+    parser.add_argument("--charts", type=int, default=24, help="charts per throughput run")
+    parser.add_argument("--throughput-formats", nargs="*", default=["png", "svg"], choices=FORMATS)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="earlier results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="allowed relative regression per metric (0.15 = 15%%)")
+    parser.add_argument("--quick", action="store_true", help="few iterations, one worker count")
+    args = parser.parse_args(argv)
+
+    if args.quick:
+        args.iterations, args.workers, args.charts = 3, [min(2, os.cpu_count() or 1)], 6
+
+    results = run_suite(args.workloads, args.formats, args.iterations, args.workers, args.charts,
+                        args.seed, [f for f in args.throughput_formats if f in args.formats])
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, args.threshold)
+        for regression in regressions:
+            print("REGRESSION", regression)
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,126 @@
+"""Synthetic, reproducible timetables for benchmarks and load tests.
+
+Every generator takes a seed and always returns the same conflict-free lesson
+list for it:
+
+* ``small``: two short lessons, the smoke-test case;
+* ``typical``: 6-8 lessons of 2-3 units, one or two meetings each, the way a
+  semester usually looks;
+* ``pathological``: every hour of every day taken by a one-hour block of a
+  lesson with a long Persian name, which maximizes blocks, label fitting and
+  shaping work.
+
+``edit_one_lesson`` derives the next submission of a user iterating on a
+timetable from one of them: one lesson edited, everything else the same.
+"""
+
+import os
+import random
+import sys
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from models import CHART_HOURS, DAY_NAMES, Lesson, LessonSchedule
+
+SUBJECTS = [
+    "ریاضی عمومی", "فیزیک پایه", "برنامه‌سازی پیشرفته", "زبان عمومی", "اندیشه اسلامی",
+    "ادبیات فارسی", "آمار و احتمال", "معادلات دیفرانسیل", "مدار الکتریکی", "ساختمان داده",
+    "شیمی عمومی", "تربیت بدنی", "مبانی کامپیوتر", "ریاضیات گسسته", "طراحی الگوریتم",
+]
+
+LONG_WORDS = [
+    "آزمایشگاه", "پیشرفته", "مهندسی", "کاربردی", "تحلیلی", "سیستم‌های", "نرم‌افزار",
+    "محاسباتی", "بین‌رشته‌ای", "اصول", "مبانی", "نظری", "عملی", "توزیع‌شده",
+]
+
+# Meeting days of a typical week; Friday stays free
+TEACHING_DAYS = DAY_NAMES[:6]
+
+
+def _time(hour: int) -> str:
+    return f"{hour:02d}:00"
+
+
+def small(seed: int = 0) -> List[Lesson]:
+    rng = random.Random(seed)
+    days = rng.sample(TEACHING_DAYS, 2)
+    start = rng.randint(8, 14)
+    return [
+        Lesson(name="ریاضی", units=3, schedules=[LessonSchedule(day=days[0], start_time=_time(start),
+                                                               end_time=_time(start + 2))]),
+        Lesson(name="فیزیک", units=2, schedules=[LessonSchedule(day=days[1], start_time=_time(start),
+                                                               end_time=_time(start + 2))]),
+    ]
+
+
+def typical(seed: int = 0) -> List[Lesson]:
+    rng = random.Random(seed)
+    taken = {day: set() for day in TEACHING_DAYS}
+    lessons = []
+    for name in rng.sample(SUBJECTS, rng.randint(6, 8)):
+        units = rng.choice([2, 3, 3])
+        schedules = []
+        for _ in range(rng.choice([1, 2])):
+            length = rng.choice([1, 2, 2])
+            for _attempt in range(50):
+                day = rng.choice(TEACHING_DAYS)
+                start = rng.randint(8, 18 - length)
+                hours = set(range(start, start + length))
+                if not hours & taken[day]:
+                    taken[day] |= hours
+                    schedules.append(LessonSchedule(day=day, start_time=_time(start),
+                                                    end_time=_time(start + length)))
+                    break
+        if schedules:
+            lessons.append(Lesson(name=f"{name} {rng.randint(1, 2)}", units=units, schedules=schedules))
+    return lessons
+
+
+def pathological(seed: int = 0) -> List[Lesson]:
+    rng = random.Random(seed)
+    slots = [(day, hour) for day in DAY_NAMES for hour in CHART_HOURS[:-1]]
+    rng.shuffle(slots)
+    lessons = []
+    per_lesson = 4
+    for i in range(0, len(slots), per_lesson):
+        words = rng.sample(SUBJECTS, 1) + rng.sample(LONG_WORDS, rng.randint(3, 5))
+        lessons.append(Lesson(
+            name=" ".join(words) + f" {i // per_lesson + 1}",
+            units=rng.randint(1, 4),
+            schedules=[LessonSchedule(day=day, start_time=_time(hour), end_time=_time(hour + 1))
+                       for day, hour in slots[i:i + per_lesson]],
+        ))
+    return lessons
+
+
+def _minutes(value: str) -> int:
+    hours, minutes = value.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def edit_one_lesson(lessons: List[Lesson], seed: int = 0) -> List[Lesson]:
+    """``lessons`` with one lesson edited: a meeting moved by half an hour
+    where its day has room, or else the lesson renamed. Stays conflict-free."""
+    rng = random.Random(seed)
+    edited = [lesson.model_copy(deep=True) for lesson in lessons]
+    lesson = rng.choice(edited)
+    meeting = rng.choice(lesson.schedules)
+    start, end = _minutes(meeting.start_time), _minutes(meeting.end_time)
+    busy = [(_minutes(s.start_time), _minutes(s.end_time)) for other in edited for s in other.schedules
+            if s.day == meeting.day and s is not meeting]
+    for shift in rng.sample([-30, 30], 2):
+        moved = (start + shift, end + shift)
+        if (CHART_HOURS[0] * 60 <= moved[0] and moved[1] <= CHART_HOURS[-1] * 60
+                and all(moved[1] <= b_start or b_end <= moved[0] for b_start, b_end in busy)):
+            meeting.start_time, meeting.end_time = (f"{m // 60:02d}:{m % 60:02d}" for m in moved)
+            return edited
+    lesson.name = f"{lesson.name} ({rng.randint(2, 9)})"
+    return edited
+
+
+WORKLOADS: Dict[str, Callable[[int], List[Lesson]]] = {
+    "small": small,
+    "typical": typical,
+    "pathological": pathological,
+}
@@ -0,0 +1,21 @@
+"""WSGI entry point running the app in-process through asgi_bridge.
+
+Set this file as the "Application startup file" in cPanel's Python App
+settings (entry point: ``application``). Each Passenger process keeps one
+event loop and one warm render pool for its whole life, with no Daphne
+next to it and no HTTP hop; see asgi_bridge.py.
+
+``HAFTESOOZ_BRIDGE_TIMEOUT`` bounds how many seconds a request waits for
+the app (120).
+"""
+
+import os
+import sys
+
+# Add project directory to sys.path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from asgi_bridge import AsgiBridge
+from main import app
+
+application = AsgiBridge(app, timeout=float(os.environ.get("HAFTESOOZ_BRIDGE_TIMEOUT", "120")))
@@ -0,0 +1,124 @@
+"""Index of the chart cache, shared by every server process.
+
+``ChartCache`` keeps its entries (file name, size and recency) in this index
+rather than in a per-process dict. A chart that one worker rendered is then
+a hit in all the others, and the entry and byte limits hold for the cache
+directory as a whole rather than once per worker.
+
+The index is a small SQLite table next to the charts. It runs in WAL mode,
+so lookups from several processes do not block one another, and the file
+is memory-mapped: a hit is a lookup and a recency bump in shared pages, not
+a round trip to another process. SQLite needs the processes on one host
+and the file on a local filesystem, which is how the bundled deployment
+runs them (one container, one volume).
+
+Each process opens its own connection on first use. A connection inherited
+across ``fork`` (the server preloads the app before forking its workers) is
+never used by the child.
+"""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+from typing import Iterable, List, Optional, Tuple
+
+MMAP_BYTES = 16 * 1024 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS charts (
+    filename TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    used INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS charts_used ON charts (used);
+"""
+# Recency is a counter rather than a clock, so ties never reorder entries
+_NEXT_USED = "(SELECT IFNULL(MAX(used), 0) + 1 FROM charts)"
+
+
+class ChartIndex:
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _db(self) -> sqlite3.Connection:
+        if self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # The index can be rebuilt from the directory, so commits need not reach the disk
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA mmap_size={MMAP_BYTES}")
+            conn.executescript(_SCHEMA)
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def touch(self, filename: str) -> bool:
+        """Mark ``filename`` as the most recently used entry; False if it is not indexed."""
+        with self._lock:
+            cursor = self._db().execute(f"UPDATE charts SET used = {_NEXT_USED} WHERE filename = ?", (filename,))
+            return cursor.rowcount == 1
+
+    def add(self, filename: str, size: int):
+        """Record ``filename`` (again) as the most recently used entry."""
+        with self._lock:
+            self._db().execute(f"INSERT OR REPLACE INTO charts (filename, size, used) VALUES (?, ?, {_NEXT_USED})",
+                               (filename, size))
+
+    def remove(self, filename: str):
+        with self._lock:
+            self._db().execute("DELETE FROM charts WHERE filename = ?", (filename,))
+
+    def totals(self) -> Tuple[int, int]:
+        """Number of entries and their total size in bytes."""
+        with self._lock:
+            count, size = self._db().execute("SELECT COUNT(*), IFNULL(SUM(size), 0) FROM charts").fetchone()
+            return count, size
+
+    def evict(self, max_entries: int, max_bytes: int, keep: Optional[str] = None) -> List[str]:
+        """Drop the least recently used entries until both limits hold and
+        return their file names; ``keep`` is never dropped."""
+        evicted = []
+        with self._lock:
+            db = self._db()
+            # One writer at a time, so two processes never evict on the same totals
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                count, size = db.execute("SELECT COUNT(*), IFNULL(SUM(size), 0) FROM charts").fetchone()
+                rows = db.execute("SELECT filename, size FROM charts ORDER BY used")
+                for filename, entry_size in rows.fetchall():
+                    if count <= max_entries and size <= max_bytes or filename == keep:
+                        break
+                    evicted.append(filename)
+                    count -= 1
+                    size -= entry_size
+                db.executemany("DELETE FROM charts WHERE filename = ?", [(f,) for f in evicted])
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        return evicted
+
+    def sync(self, found: Iterable[Tuple[str, int]]):
+        """Match the index to the files in the directory, given oldest first
+        as (name, size): forget entries whose file is gone and add files the
+        index does not know yet as the most recent."""
+        found = list(found)
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.execute("CREATE TEMP TABLE IF NOT EXISTS present (filename TEXT PRIMARY KEY)")
+                db.execute("DELETE FROM present")
+                db.executemany("INSERT OR IGNORE INTO present VALUES (?)", [(name,) for name, _ in found])
+                db.execute("DELETE FROM charts WHERE filename NOT IN (SELECT filename FROM present)")
+                for name, size in found:
+                    db.execute(f"INSERT INTO charts (filename, size, used) VALUES (?, ?, {_NEXT_USED}) "
+                               "ON CONFLICT (filename) DO UPDATE SET size = excluded.size", (name, size))
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
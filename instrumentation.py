@@ -0,0 +1,372 @@
+"""Per-stage timings, counters and sampling profiles for the render path.
+
+Each request gets a ``Trace``; code anywhere below it records time with
+``span("stage")`` and counts with ``count("name")``. Both are no-ops when
+no trace is active, so library code can be instrumented unconditionally.
+Renders run in worker processes, so jobs trace themselves (``traced``) and
+return the trace with their result, to be merged into the request's.
+
+Finished traces feed a small Prometheus-text registry (``Metrics``) and are
+logged as one JSON line per request.
+
+``SamplingProfiler`` profiles a configurable fraction of requests by
+sampling the stack of the thread doing the work every few milliseconds.
+Samples are kept as folded stacks ("outer;inner;leaf count"), the input
+format of common flame graph tools. The rate can be changed at runtime.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """Peak resident set size of this process, if the platform reports it."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Trace:
+    """Seconds per stage and counters for one request (or one render job)."""
+
+    def __init__(self, name: str, profile: bool = False):
+        self.name = name
+        self.profile = profile
+        self.started = time.perf_counter()
+        self.spans: Dict[str, float] = defaultdict(float)
+        self.counts: Dict[str, float] = defaultdict(float)
+        self.fields: Dict[str, Any] = {}
+        self.samples: Counter = Counter()
+
+    @contextmanager
+    def span(self, stage: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans[stage] += time.perf_counter() - started
+
+    def count(self, name: str, value: float = 1):
+        self.counts[name] += value
+
+    def merge(self, data: Optional[Dict[str, Any]]):
+        """Add a trace sent back by a render job (``to_dict`` form)."""
+        if not data:
+            return
+        for stage, seconds in data.get("spans", {}).items():
+            self.spans[stage] += seconds
+        for name, value in data.get("counts", {}).items():
+            self.counts[name] += value
+        self.samples.update(data.get("samples", {}))
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {"spans": dict(self.spans), "counts": dict(self.counts)}
+        if self.samples:
+            data["samples"] = dict(self.samples)
+        return data
+
+
+_current: ContextVar[Optional[Trace]] = ContextVar("haftesooz_trace", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+@contextmanager
+def tracing(trace: Trace):
+    """Make ``trace`` the current trace for the duration of the block."""
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def span(stage: str):
+    """Time a stage of the current trace, if there is one."""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    with trace.span(stage):
+        yield
+
+
+def count(name: str, value: float = 1):
+    trace = _current.get()
+    if trace is not None:
+        trace.count(name, value)
+
+
+def traced(fn: Callable, *args, profile: bool = False, interval: float = 0.005) -> Tuple[Any, Dict[str, Any]]:
+    """Run ``fn(*args)`` under a fresh trace; return its result and the trace.
+
+    Meant for the worker side of a render job. With ``profile`` the calling
+    thread is sampled while ``fn`` runs.
+    """
+    trace = Trace(getattr(fn, "__name__", "job"), profile=profile)
+    with tracing(trace):
+        if profile:
+            with sample_thread(threading.get_ident(), interval) as samples:
+                result = fn(*args)
+            trace.samples.update(samples)
+        else:
+            result = fn(*args)
+    return result, trace.to_dict()
+
+
+# -- sampling profiler -------------------------------------------------------
+
+def _folded(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+@contextmanager
+def sample_thread(ident: int, interval: float = 0.005):
+    """Sample thread ``ident``'s stack every ``interval`` seconds from a helper
+    thread; the yielded Counter maps folded stacks to sample counts."""
+    samples: Counter = Counter()
+    stop = threading.Event()
+
+    def sampler():
+        while not stop.wait(interval):
+            frame = sys._current_frames().get(ident)
+            if frame is not None:
+                samples[_folded(frame)] += 1
+
+    thread = threading.Thread(target=sampler, name="haftesooz-sampler", daemon=True)
+    thread.start()
+    try:
+        yield samples
+    finally:
+        stop.set()
+        thread.join()
+
+
+class SamplingProfiler:
+    """Decides which requests to profile and accumulates their samples."""
+
+    def __init__(self, rate: float = 0.0, interval: float = 0.005, max_stacks: int = 5000):
+        self.rate = rate
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.profiled = 0
+        self._stacks: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def configure(self, rate: Optional[float] = None, interval: Optional[float] = None):
+        if rate is not None:
+            self.rate = min(1.0, max(0.0, rate))
+        if interval is not None:
+            self.interval = max(0.001, interval)
+
+    def should_profile(self) -> bool:
+        return self.rate > 0 and random.random() < self.rate
+
+    def add(self, samples: Dict[str, int]):
+        if not samples:
+            return
+        with self._lock:
+            self.profiled += 1
+            self._stacks.update(samples)
+            if len(self._stacks) > self.max_stacks:
+                self._stacks = Counter(dict(self._stacks.most_common(self.max_stacks)))
+
+    def folded(self) -> str:
+        with self._lock:
+            return "".join(f"{stack} {n}\n" for stack, n in self._stacks.most_common())
+
+    def reset(self):
+        with self._lock:
+            self._stacks.clear()
+            self.profiled = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"rate": self.rate, "interval": self.interval, "profiled": self.profiled,
+                    "stacks": len(self._stacks), "samples": sum(self._stacks.values())}
+
+
+# -- metrics -----------------------------------------------------------------
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in sorted(labels.items())) + "}"
+
+
+def _number(value: float) -> str:
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class Metrics:
+    """Counters, histograms and gauges rendered in the Prometheus text format."""
+
+    def __init__(self, prefix: str = "haftesooz", buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.prefix = prefix
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._counters: Dict[Tuple[str, tuple], float] = defaultdict(float)
+        # name, labels -> [bucket counts..., sum, count]
+        self._histograms: Dict[Tuple[str, tuple], List[float]] = {}
+        self._gauges: List[Callable[[], Iterable[Tuple[str, Dict[str, str], float]]]] = []
+
+    def describe(self, name: str, kind: str, help_text: str):
+        self._help[name] = (kind, help_text)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        with self._lock:
+            self._counters[(name, tuple(sorted(labels.items())))] += value
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    hist[i] += 1
+            hist[-2] += value
+            hist[-1] += 1
+
+    def gauge(self, collect: Callable[[], Iterable[Tuple[str, Dict[str, str], float]]]):
+        """Register a callback returning (name, labels, value) triples at scrape time."""
+        self._gauges.append(collect)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        seen = set()
+
+        def header(name: str, default_kind: str):
+            if name in seen:
+                return
+            seen.add(name)
+            kind, help_text = self._help.get(name, (default_kind, ""))
+            if help_text:
+                lines.append(f"# HELP {self.prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {self.prefix}_{name} {kind}")
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((k, list(v)) for k, v in self._histograms.items())
+        for (name, labels), value in counters:
+            header(name, "counter")
+            lines.append(f"{self.prefix}_{name}{_labels(dict(labels))} {_number(value)}")
+        for (name, labels), hist in histograms:
+            header(name, "histogram")
+            labels = dict(labels)
+            for bound, n in zip(self.buckets, hist):
+                lines.append(f"{self.prefix}_{name}_bucket{_labels({**labels, 'le': _number(bound)})} {_number(n)}")
+            lines.append(f"{self.prefix}_{name}_bucket{_labels({**labels, 'le': '+Inf'})} {_number(hist[-1])}")
+            lines.append(f"{self.prefix}_{name}_sum{_labels(labels)} {_number(round(hist[-2], 6))}")
+            lines.append(f"{self.prefix}_{name}_count{_labels(labels)} {_number(hist[-1])}")
+        for collect in self._gauges:
+            for name, labels, value in collect():
+                header(name, "gauge")
+                lines.append(f"{self.prefix}_{name}{_labels(labels)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+    def record(self, trace: Trace, **labels):
+        """Fold a finished request trace into the metrics."""
+        for stage, seconds in trace.spans.items():
+            self.observe("stage_seconds", seconds, stage=stage)
+        for name, value in trace.counts.items():
+            self.inc(f"{name}_total", value)
+
+
+def log_line(trace: Trace, **fields) -> str:
+    """The structured log record of a finished request."""
+    record = {
+        **fields,
+        **trace.fields,
+        "duration_ms": round(trace.elapsed * 1000, 2),
+        "stages_ms": {stage: round(seconds * 1000, 2) for stage, seconds in trace.spans.items()},
+        "counts": {name: value for name, value in trace.counts.items()},
+    }
+    return json.dumps(record, ensure_ascii=False)
+
+
+class InstrumentationMiddleware:
+    """ASGI middleware that traces each HTTP request.
+
+    The trace is current while the request (including a streamed body) is
+    handled; afterwards it goes into ``metrics`` with the request's duration
+    and status and is logged as one JSON line. ``endpoint(scope)`` gives the
+    low-cardinality label to file a request under; requests whose path starts
+    with one of ``skip`` are passed through untraced.
+    """
+
+    def __init__(self, app, metrics: Metrics, profiler: SamplingProfiler, logger,
+                 endpoint: Callable[[dict], str], skip: Iterable[str] = ()):
+        self.app = app
+        self.metrics = metrics
+        self.profiler = profiler
+        self.logger = logger
+        self.endpoint = endpoint
+        self.skip = tuple(skip)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.skip):
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace(scope["path"], profile=self.profiler.should_profile())
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            with tracing(trace):
+                await self.app(scope, receive, send_with_status)
+        finally:
+            endpoint = self.endpoint(scope)
+            labels = {"endpoint": endpoint, "method": scope["method"]}
+            self.metrics.observe("request_seconds", trace.elapsed, **labels)
+            self.metrics.inc("requests_total", **labels, status=str(status))
+            self.metrics.record(trace)
+            self.profiler.add(trace.samples)
+            if self.logger.isEnabledFor(logging.INFO):
+                self.logger.info(log_line(trace, method=scope["method"], path=scope["path"], endpoint=endpoint,
+                                          status=status, profiled=trace.profile))
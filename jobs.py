@@ -0,0 +1,275 @@
+"""Background render jobs.
+
+A job is submitted, gets an id straight away and is rendered by one of a few
+worker tasks on the event loop (which hand the actual drawing to the render
+pool). Clients follow it by polling or over server-sent events, so no HTTP
+request has to stay open for the length of a render and a slow one can no
+longer run into a proxy's read timeout.
+
+Job state lives in a ``JobStore``. ``MemoryJobStore`` keeps it in this
+process, which is all a single server process needs; a deployment running
+several processes behind one address plugs in a shared store by naming its
+class in ``HAFTESOOZ_JOB_STORE`` ("package.module:ClassName").
+``SqliteJobStore`` is one for processes on the same host (server.py uses
+it when it runs more than one worker): a job is still rendered by the
+process it was submitted to, but any process can answer for it.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import importlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field, replace
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+FINISHED = (DONE, FAILED)
+
+
+class QueueFull(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class Job:
+    id: str
+    status: str = QUEUED
+    stage: str = QUEUED
+    created: float = field(default_factory=time.time)
+    updated: float = field(default_factory=time.time)
+    # Bumped on every change, so followers can tell what they have already seen
+    version: int = 0
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[Dict[str, Any]] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class JobStore:
+    """Where job state is kept. Subclasses implement ``save`` and ``get``;
+    ``wait`` may be overridden to wake followers sooner than polling does."""
+
+    poll_interval = 0.5
+
+    async def save(self, job: Job) -> None:
+        raise NotImplementedError
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        raise NotImplementedError
+
+    async def update(self, job_id: str, **changes) -> Optional[Job]:
+        job = await self.get(job_id)
+        if job is None:
+            return None
+        job = replace(job, version=job.version + 1, updated=time.time(), **changes)
+        await self.save(job)
+        return job
+
+    async def wait(self, job_id: str, version: int, timeout: float) -> None:
+        """Return once the job may have moved past ``version``, or after ``timeout``."""
+        await asyncio.sleep(min(timeout, self.poll_interval))
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+
+class MemoryJobStore(JobStore):
+    """Jobs in a dict, dropped oldest first beyond ``max_jobs`` or after ``ttl`` seconds."""
+
+    def __init__(self, max_jobs: int = 10000, ttl: float = 3600.0):
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._changed: Dict[str, asyncio.Event] = {}
+
+    async def save(self, job: Job) -> None:
+        self._jobs[job.id] = job
+        self._jobs.move_to_end(job.id)
+        changed = self._changed.pop(job.id, None)
+        if changed is not None:
+            changed.set()
+        self._expire()
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        self._expire()
+        return self._jobs.get(job_id)
+
+    async def wait(self, job_id: str, version: int, timeout: float) -> None:
+        job = self._jobs.get(job_id)
+        if job is None or job.version != version:
+            return
+        changed = self._changed.setdefault(job_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        while self._jobs:
+            job_id, job = next(iter(self._jobs.items()))
+            if len(self._jobs) <= self.max_jobs and job.updated >= cutoff:
+                break
+            del self._jobs[job_id]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"jobs": len(self._jobs)}
+
+
+class SqliteJobStore(JobStore):
+    """Jobs in a SQLite file that every process on the host opens.
+
+    Followers poll, as other processes cannot wake them. Jobs are dropped
+    oldest first beyond ``max_jobs`` or after ``ttl`` seconds. The file is
+    ``path``, or ``HAFTESOOZ_JOB_DB`` when not given, or ``.jobs.sqlite3`` in
+    the charts directory.
+    """
+
+    poll_interval = 0.2
+
+    def __init__(self, path: Optional[str] = None, max_jobs: int = 10000, ttl: float = 3600.0):
+        self.path = path or os.environ.get("HAFTESOOZ_JOB_DB") or os.path.join(
+            os.environ.get("HAFTESOOZ_CHARTS_DIR", "generated_charts"), ".jobs.sqlite3")
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _db(self) -> sqlite3.Connection:
+        # Connections are per process; one inherited across fork is never reused
+        if self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, updated REAL NOT NULL, job TEXT NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_updated ON jobs (updated)")
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    # SQLite calls block (up to the busy timeout while another process
+    # writes), so they run on the default executor rather than the loop
+
+    async def save(self, job: Job) -> None:
+        await asyncio.get_running_loop().run_in_executor(None, self._save, job)
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        return await asyncio.get_running_loop().run_in_executor(None, self._get, job_id)
+
+    def _save(self, job: Job):
+        with self._lock:
+            db = self._db()
+            db.execute("INSERT OR REPLACE INTO jobs (id, updated, job) VALUES (?, ?, ?)",
+                       (job.id, job.updated, json.dumps(job.to_dict())))
+            db.execute("DELETE FROM jobs WHERE updated < ?", (time.time() - self.ttl,))
+            db.execute("DELETE FROM jobs WHERE id IN (SELECT id FROM jobs ORDER BY updated DESC LIMIT -1 OFFSET ?)",
+                       (self.max_jobs,))
+
+    def _get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._db().execute("SELECT job FROM jobs WHERE id = ? AND updated >= ?",
+                                     (job_id, time.time() - self.ttl)).fetchone()
+        return Job(**json.loads(row[0])) if row else None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"jobs": self._db().execute("SELECT COUNT(*) FROM jobs").fetchone()[0]}
+
+
+def load_job_store(spec: Optional[str], **kwargs) -> JobStore:
+    """``MemoryJobStore(**kwargs)``, or the class named by ``spec`` ("module:Class")
+    constructed with the same keyword arguments."""
+    if not spec:
+        return MemoryJobStore(**kwargs)
+    module, _, name = spec.partition(":")
+    return getattr(importlib.import_module(module), name)(**kwargs)
+
+
+class JobQueue:
+    """A bounded queue of jobs worked off by ``workers`` tasks.
+
+    Workers are started lazily on the loop of the first submission, so the
+    queue works the same whether or not the app's lifespan ran.
+    """
+
+    def __init__(self, store: JobStore, workers: int = 2, max_queued: int = 1000):
+        self.store = store
+        self.workers = max(1, workers)
+        self.max_queued = max_queued
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+        self._loop = None
+        self.completed = 0
+        self.failed = 0
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue(self.max_queued)
+        self._tasks = [loop.create_task(self._work()) for _ in range(self.workers)]
+
+    async def submit(self, run: Callable[[str], Awaitable[Dict[str, Any]]]) -> Job:
+        """Queue ``run(job_id)``; its return value becomes the job's result.
+
+        Raises ``QueueFull`` when ``max_queued`` jobs are already waiting.
+        """
+        self._ensure_started()
+        if self._queue.full():
+            raise QueueFull()
+        job = Job(id=uuid.uuid4().hex)
+        await self.store.save(job)
+        self._queue.put_nowait((job.id, run))
+        return job
+
+    async def finished(self, result: Dict[str, Any]) -> Job:
+        """Record a job that needed no rendering (e.g. a cache hit) as done."""
+        job = Job(id=uuid.uuid4().hex, status=DONE, stage=DONE, result=result)
+        await self.store.save(job)
+        return job
+
+    async def _work(self):
+        while True:
+            job_id, run = await self._queue.get()
+            try:
+                await self.store.update(job_id, status=RUNNING, stage=RUNNING)
+                result = await run(job_id)
+                await self.store.update(job_id, status=DONE, stage=DONE, result=result)
+                self.completed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                await self.store.update(job_id, status=FAILED, stage=FAILED,
+                                        error={"error": f"{type(exc).__name__}: {exc}"})
+                self.failed += 1
+            finally:
+                self._queue.task_done()
+
+    async def shutdown(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._loop = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "completed": self.completed,
+            "failed": self.failed,
+            **self.store.stats(),
+        }
@@ -0,0 +1,285 @@
+"""Chart layout, computed once and shared by every renderer.
+
+``LayoutEngine.layout`` turns a lesson list into a ``ChartLayout``: the page
+size, grid and frame lines, and per lesson block its rectangle, color, fitted
+font size, line breaks and shaped text. No drawing happens here. The raster
+renderer places matplotlib artists from it, the vector writers serialize it,
+and clients can fetch it as JSON and draw it themselves.
+
+All lengths are in points with y pointing down, already cropped to the chart
+content plus the savefig padding, so the layout matches the PNG produced by
+``savefig(bbox_inches="tight")``. Blocks also carry their position in chart
+units (fractional hours after the first hour, day index) for renderers that
+draw in data coordinates.
+
+A layout is a few kilobytes of plain data: ``to_dict``/``from_dict`` give a
+JSON-safe form that is stable for identical input, so it can be cached next
+to (or instead of) the images.
+"""
+
+from __future__ import annotations
+
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Sequence, Tuple
+
+from matplotlib import font_manager as fm
+
+from instrumentation import count, span
+from models import CHART_HOURS, CHART_TITLE, DAY_NAMES, LESSON_COLORS, PERSIAN_DAYS, Lesson, label_candidates
+from schedule import parse_minutes
+from shaping import PersianShaper
+from text_metrics import TextMetrics
+
+# matplotlib defaults the PNG is drawn with, in points
+LINE_WIDTH = 0.8
+TICK_LENGTH = 3.5
+TICK_PAD = 12
+GRID_COLOR = "#b0b0b0"
+GRID_ALPHA = 0.3
+SAVEFIG_PAD = 7.2
+# Font sizes as they come out on the PNG (the title's fontproperties override
+# its fontsize, leaving it at the 10pt default)
+HOUR_FONT_SIZE = 18
+DAY_FONT_SIZE = 24
+TITLE_FONT_SIZE = 10
+TITLE_PAD = 30
+# Day labels hang off a spine placed at 1.06 axes widths
+DAY_SPINE_POSITION = 1.06
+# Blocks almost cover the vertical day cell, leaving a small gap
+BLOCK_HEIGHT = 0.92
+BLOCK_ALPHA = 0.85
+BLOCK_EDGE_WIDTH = 2
+# Label font size range and the padding kept inside a block (FIT_DPI pixels)
+LABEL_MAX_SIZE = 32
+LABEL_MIN_SIZE = 10
+LABEL_MIN_PAD = 6
+LABEL_PAD_FRACTION = 0.06
+
+_PRECISION = 3
+
+Line = Tuple[float, float, float, float]
+
+
+@dataclass
+class TextLine:
+    """One line of text anchored at its baseline ``y``.
+
+    ``text`` is in logical order for renderers that shape text themselves;
+    ``shaped`` is the reshaped, visually ordered form for those that do not.
+    ``align`` is "center" or "right" (``x`` is then the right edge).
+    """
+    x: float
+    y: float
+    text: str
+    shaped: str
+    size: float
+    weight: str = "normal"
+    align: str = "center"
+
+
+@dataclass
+class Block:
+    """A lesson block: its rectangle, color and fitted label."""
+    lesson: int
+    day: int
+    start: float
+    duration: float
+    x: float
+    y: float
+    width: float
+    height: float
+    color: str
+    font_size: int
+    label: List[TextLine]
+
+    @property
+    def shaped_label(self) -> str:
+        return "\n".join(line.shaped for line in self.label)
+
+
+@dataclass
+class ChartLayout:
+    width: float
+    height: float
+    grid: List[Line]
+    frame: List[Line]
+    texts: List[TextLine]
+    blocks: List[Block]
+
+    def all_texts(self) -> List[TextLine]:
+        """Static labels followed by the block labels, in drawing order."""
+        return self.texts + [line for block in self.blocks for line in block.label]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-safe form with lengths rounded to a fixed precision."""
+        return _rounded(asdict(self))
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ChartLayout":
+        return cls(
+            width=data["width"],
+            height=data["height"],
+            grid=[tuple(line) for line in data["grid"]],
+            frame=[tuple(line) for line in data["frame"]],
+            texts=[TextLine(**text) for text in data["texts"]],
+            blocks=[Block(**{**block, "label": [TextLine(**line) for line in block["label"]]})
+                    for block in data["blocks"]],
+        )
+
+
+def _rounded(value):
+    if isinstance(value, float):
+        value = round(value, _PRECISION)
+        return 0.0 if value == 0 else value
+    if isinstance(value, dict):
+        return {k: _rounded(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_rounded(v) for v in value]
+    return value
+
+
+class LayoutEngine:
+    """Compute chart layouts for a fixed page geometry and set of fonts.
+
+    ``font_paths`` maps "normal" and "bold" to TrueType files. ``figsize``,
+    ``margins``, ``dpi`` and ``fit_dpi`` are the values the PNG is drawn with;
+    text is measured at ``dpi`` so the crop matches the PNG's, and labels are
+    fitted at ``fit_dpi`` so their sizes do not depend on the output DPI.
+    """
+
+    def __init__(self, font_paths: Dict[str, str], shaper: PersianShaper, figsize=(22, 12),
+                 margins=None, dpi: float = 300, fit_dpi: float = 100):
+        margins = margins or dict(left=0.04, right=0.86, top=0.94, bottom=0.06)
+        self.font_paths = dict(font_paths)
+        self.shaper = shaper
+        self.metrics = {weight: TextMetrics(fm.FontProperties(fname=path), dpi=dpi)
+                        for weight, path in self.font_paths.items()}
+        self.scale = 72.0 / dpi
+        # The PNG pins block labels to the regular font file, so "bold" labels
+        # are measured (and drawn) with the regular face
+        self.fit_metrics = TextMetrics(fm.FontProperties(fname=self.font_paths["normal"]), dpi=fit_dpi)
+        self.fit_scale = fit_dpi / 72.0
+
+        fig_w, fig_h = figsize[0] * 72.0, figsize[1] * 72.0
+        self.axes_w = (margins["right"] - margins["left"]) * fig_w
+        self.axes_h = (margins["top"] - margins["bottom"]) * fig_h
+        self.col_w = self.axes_w / len(CHART_HOURS)
+        self.row_h = self.axes_h / len(DAY_NAMES)
+
+    def _measure(self, shaped: str, size: float, weight: str = "normal"):
+        """``TextMetrics.layout`` in points: (height, [(line, baseline offset)])."""
+        _, height, lines = self.metrics[weight].layout(shaped, size)
+        return height * self.scale, [(line, baseline * self.scale) for line, _, baseline in lines]
+
+    def _single_line(self, text: str, size: float, x: float, y: float, align: str, valign: str,
+                     weight: str = "normal") -> Tuple[TextLine, float]:
+        """Place a one-line label the way matplotlib aligns it; also return its top."""
+        shaped = self.shaper.shape(text)
+        height, lines = self._measure(shaped, size, weight)
+        _, top_to_baseline = lines[0]
+        if valign == "bottom":
+            baseline = y - (height - top_to_baseline)
+        elif valign == "center_baseline":
+            baseline = y + top_to_baseline / 2.0
+        else:
+            baseline = y
+        return TextLine(x, baseline, text, shaped, size, weight, align), baseline - top_to_baseline
+
+    def fit_label(self, candidates: Sequence[str], width: float, height: float) -> Tuple[int, int]:
+        """Index of the best (shaped) candidate and its font size for a block
+        of ``width`` x ``height`` points."""
+        w_px, h_px = width * self.fit_scale, height * self.fit_scale
+        pad_px = max(LABEL_MIN_PAD, w_px * LABEL_PAD_FRACTION)
+        text, size = self.fit_metrics.fit(candidates, w_px - pad_px, h_px - pad_px,
+                                          max_size=LABEL_MAX_SIZE, min_size=LABEL_MIN_SIZE, weight="bold")
+        return candidates.index(text), size
+
+    def layout(self, lessons: Sequence[Lesson]) -> ChartLayout:
+        axes_w, axes_h, col_w, row_h = self.axes_w, self.axes_h, self.col_w, self.row_h
+        # Axes coordinates first (origin at the axes' top left), shifted at the end
+        grid, frame, texts, blocks = [], [], [], []
+
+        hour_top = 0.0
+        for i, hour in enumerate(CHART_HOURS):
+            x = axes_w - i * col_w
+            grid.append((x, 0.0, x, axes_h))
+            frame.append((x, -TICK_LENGTH, x, 0.0))
+            text, top = self._single_line(f"{hour:02d}:00", HOUR_FONT_SIZE, x, -TICK_LENGTH - TICK_PAD,
+                                          "center", "bottom")
+            texts.append(text)
+            hour_top = min(hour_top, top)
+
+        day_spine = DAY_SPINE_POSITION * axes_w
+        for i, day in enumerate(DAY_NAMES):
+            y = i * row_h
+            grid.append((0.0, y, axes_w, y))
+            frame.append((-TICK_LENGTH, y, 0.0, y))
+            frame.append((day_spine, y, day_spine + TICK_LENGTH, y))
+            text, _ = self._single_line(day, DAY_FONT_SIZE, day_spine + TICK_LENGTH + TICK_PAD, y,
+                                        "right", "center_baseline", weight="bold")
+            texts.append(text)
+
+        title, title_top = self._single_line(CHART_TITLE, TITLE_FONT_SIZE, axes_w / 2.0, hour_top - TITLE_PAD,
+                                             "center", "baseline")
+        texts.append(title)
+
+        # Axes frame, drawn over the blocks
+        frame.extend([(0.0, 0.0, axes_w, 0.0), (0.0, axes_h, axes_w, axes_h),
+                      (0.0, 0.0, 0.0, axes_h), (axes_w, 0.0, axes_w, axes_h)])
+
+        # Shape every candidate label of the request in one batch
+        raw_candidates = [label_candidates(lesson) for lesson in lessons]
+        with span("shaping"):
+            shaped = iter(self.shaper.shape_many(t for texts_ in raw_candidates for t in texts_))
+            shaped_candidates = [[next(shaped) for _ in texts_] for texts_ in raw_candidates]
+
+        for lesson_index, lesson in enumerate(lessons):
+            color = LESSON_COLORS[lesson_index % len(LESSON_COLORS)]
+            for schedule in lesson.schedules:
+                if schedule.day not in PERSIAN_DAYS:
+                    continue
+                try:
+                    start_minute = parse_minutes(schedule.start_time)
+                    end_minute = parse_minutes(schedule.end_time)
+                except ValueError:
+                    continue
+                # Hours after the first chart hour, to the minute
+                start = start_minute / 60.0 - CHART_HOURS[0]
+                duration = (end_minute - start_minute) / 60.0
+                if not (0 <= start < len(CHART_HOURS) and duration > 0):
+                    continue
+
+                day = PERSIAN_DAYS[schedule.day]
+                # The hour axis runs right to left
+                x = axes_w - (start + duration) * col_w
+                y = (day + (1.0 - BLOCK_HEIGHT) / 2.0) * row_h
+                width, height = duration * col_w, BLOCK_HEIGHT * row_h
+
+                # Pick the line split and the largest font size that keeps
+                # the label inside the block, then center it
+                with span("fitting"):
+                    choice, size = self.fit_label(shaped_candidates[lesson_index], width, height)
+                count("fit_candidates", len(shaped_candidates[lesson_index]))
+                label_h, lines = self._measure(shaped_candidates[lesson_index][choice], size)
+                top = y + height / 2.0 - label_h / 2.0
+                label = [TextLine(x + width / 2.0, top + baseline, text, line, size)
+                         for text, (line, baseline) in zip(raw_candidates[lesson_index][choice].split("\n"), lines)]
+                blocks.append(Block(lesson_index, day, start, duration,
+                                    x, y, width, height, color, size, label))
+
+        left = -TICK_LENGTH - SAVEFIG_PAD
+        top = title_top - SAVEFIG_PAD
+        page_w = day_spine + TICK_LENGTH + TICK_PAD + SAVEFIG_PAD - left
+        page_h = axes_h + SAVEFIG_PAD - top
+
+        def shift(line):
+            x1, y1, x2, y2 = line
+            return (x1 - left, y1 - top, x2 - left, y2 - top)
+
+        for text in texts + [line for block in blocks for line in block.label]:
+            text.x -= left
+            text.y -= top
+        for block in blocks:
+            block.x -= left
+            block.y -= top
+        return ChartLayout(page_w, page_h, [shift(l) for l in grid], [shift(l) for l in frame], texts, blocks)
@@ -1,45 +1,79 @@
 from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi.responses import HTMLResponse, FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+import asyncio
+import functools
+import io
 import json
+import logging
+import time
 import uuid
 import os
-from typing import List, Optional
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Dict, List, Literal, Mapping, Optional
 import re
 
-# Optional shaping deps: attempt import once at module load so we can use in functions
-try:
-    import arabic_reshaper as _arabic_reshaper
-    from bidi.algorithm import get_display as _bidi_get_display
-    BIDI_AVAILABLE = True
-except Exception:
-    _arabic_reshaper = None
-    _bidi_get_display = None
-    BIDI_AVAILABLE = False
-from pydantic import BaseModel
+from pydantic import ValidationError
+from starlette.background import BackgroundTask
+from starlette.routing import Match
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib import font_manager as fm
+
+from admission import AdmissionController, Overloaded
+from chart_index import ChartIndex
+from instrumentation import (InstrumentationMiddleware, Metrics, SamplingProfiler, count, current_trace,
+                             peak_rss_bytes, span, traced)
+from jobs import Job, JobQueue, QueueFull, load_job_store
+from layout import BLOCK_ALPHA, BLOCK_EDGE_WIDTH, BLOCK_HEIGHT, Block, ChartLayout, LayoutEngine
+from png_encoder import PngProfile, prepare_image, write_png
+from models import (CHART_HOURS, CHART_TITLE, DAY_NAMES, LESSON_COLORS, PERSIAN_DAYS,  # noqa: F401
+                    CourseSections, Lesson, LessonSchedule, Section, units_line)
+from render_pool import RenderPool
+from schedule import ScheduleConflict, WeekSchedule
+from solver import TimetableSolver
+from shaping import BIDI_AVAILABLE, PersianShaper, _fallback_bidi_approx  # noqa: F401
+from vector_render import VectorChartRenderer
+from zipstream import ZipStream
 
 font_dir = os.path.join(os.path.dirname(__file__), 'static', 'fonts')
+VAZIRMATN_FONT_FILES = ('Vazirmatn-Light.ttf', 'Vazirmatn-Regular.ttf', 'Vazirmatn-Medium.ttf',
+                        'Vazirmatn-SemiBold.ttf', 'Vazirmatn-Bold.ttf')
 regular_font_path = os.path.join(font_dir, 'Vazirmatn-Regular.ttf')
+bold_font_path = os.path.join(font_dir, 'Vazirmatn-Bold.ttf')
 if os.path.exists(regular_font_path):
     PERSIAN_FONT = fm.FontProperties(fname=regular_font_path)
 else:
     PERSIAN_FONT = fm.FontProperties(family="sans-serif")
 
-def _maybe_shape_persian(text: str) -> str:
-    """Return Persian text reshaped if libraries exist, else return as-is."""
-    if not text:
-        return text
-    if _arabic_reshaper and _bidi_get_display:
-        try:
-            reshaped = _arabic_reshaper.reshape(text)
-            return _bidi_get_display(reshaped)
-        except Exception:
-            return text
-    return text
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Prepare the renderer once per process before serving requests."""
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    await loop.run_in_executor(None, init_renderer)
+    STARTUP_TIMINGS["renderer_init_s"] = time.perf_counter() - started
+
+    pool_started = time.perf_counter()
+    # Worker processes warm themselves up; with workers=0 this warms this process
+    warmups = await loop.run_in_executor(None, render_pool.start, _render_worker_warmup_seconds)
+    STARTUP_TIMINGS["render_pool_start_s"] = time.perf_counter() - pool_started
+    STARTUP_TIMINGS["warmup_s"] = max((w for w in warmups if w is not None), default=0.0)
+    STARTUP_TIMINGS["total_s"] = time.perf_counter() - started
+    try:
+        yield
+    finally:
+        await job_queue.shutdown()
+        render_pool.shutdown()
 
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -47,147 +81,266 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 # Set up templates
 templates = Jinja2Templates(directory="templates")
 
-# Persian day names
-PERSIAN_DAYS = {
-    "شنبه": 0,
-    "یکشنبه": 1,
-    "دوشنبه": 2,
-    "سه‌شنبه": 3,
-    "چهارشنبه": 4,
-    "پنج‌شنبه": 5,
-    "جمعه": 6
+# Rendered charts live here and are served from /chart/{filename}
+CHARTS_DIR = os.environ.get("HAFTESOOZ_CHARTS_DIR", "generated_charts")
+
+# Chart geometry: one column per hour (see models.CHART_HOURS)
+CHART_FIGSIZE = (22, 12)
+CHART_DPI = 300
+CHART_MARGINS = dict(left=0.04, right=0.86, top=0.94, bottom=0.06)
+# Reference DPI at which label sizes are fitted
+FIT_DPI = 100
+
+# How PNGs are encoded (see png_encoder.py), as key=value settings per output:
+# the on-screen preview and the full-resolution print download
+PNG_PROFILES = {
+    "preview": PngProfile.parse("preview", os.environ.get("HAFTESOOZ_PNG_PREVIEW", "level=9,optimize=1")),
+    "print": PngProfile.parse("print", os.environ.get("HAFTESOOZ_PNG_PRINT", "level=6")),
 }
 
-DAY_NAMES = ["شنبه", "یکشنبه", "دوشنبه", "سه‌شنبه", "چهارشنبه", "پنج‌شنبه", "جمعه"]
 
+shaper = PersianShaper(maxsize=int(os.environ.get("HAFTESOOZ_SHAPING_CACHE_SIZE", "4096")))
+
+# Strings that appear on (almost) every chart are shaped once, at import
+shaper.preload(DAY_NAMES + [CHART_TITLE] + [units_line(u) for u in range(11)])
 
-class LessonSchedule(BaseModel):
-    day: str
-    start_time: str
-    end_time: str
+
+def _maybe_shape_persian(text: str) -> str:
+    """Shape and bidi-reorder Persian text for display (memoized, see shaping.py)."""
+    return shaper.shape(text)
 
 
-class Lesson(BaseModel):
-    name: str
-    units: int
-    schedules: List[LessonSchedule]
+@dataclass(frozen=True)
+class RenderProfile:
+    """Fonts and matplotlib style every chart is drawn with, fixed at startup."""
+    font: fm.FontProperties
+    font_name: str
+    registered_fonts: tuple
+    rc: Mapping[str, Any]
 
 
-def _fallback_bidi_approx(text: str) -> str:
-    """A conservative bidi fallback for when python-bidi/arabic_reshaper are missing.
+_RENDER_PROFILE: Optional[RenderProfile] = None
+_RENDER_PROFILE_LOCK = threading.Lock()
 
-    This does not do real shaping. It reverses the order of Arabic/RTL groups while
-    leaving numbers and punctuation in place. It's a visual approximation so the
-    text appears right-to-left instead of fully garbled.
+# Time spent in each startup phase, reported by /stats
+STARTUP_TIMINGS: Dict[str, float] = {}
+
+
+def init_renderer() -> RenderProfile:
+    """Register the Vazirmatn fonts and build the chart style, once per process.
+
+    Later calls return the existing profile. Processes forked after this ran
+    inherit the registered fonts. The style is applied to each figure as it
+    is built (``_figure_style``), never to the global rcParams.
     """
-    # Split text into runs of Arabic (letters) and non-Arabic
-    parts = re.findall(r"[\u0600-\u06FF\u0750-\u077F\u08A0-\u08FF\uFB50-\uFDFF\uFE70-\uFEFF]+|[^\u0600-\u06FF\u0750-\u077F\u08A0-\u08FF\uFB50-\uFDFF\uFE70-\uFEFF]+", text)
-    # Reverse the order of runs so RTL runs appear first
-    parts = parts[::-1]
-    joined = "".join(parts)
-    # Prepend RLM mark to hint rendering direction
-    return "\u200F" + joined
+    global _RENDER_PROFILE
+    if _RENDER_PROFILE is not None:
+        return _RENDER_PROFILE
 
+    with _RENDER_PROFILE_LOCK:
+        if _RENDER_PROFILE is not None:
+            return _RENDER_PROFILE
 
-def _maybe_shape_persian(text: str) -> str:
-    """Shape and bidi-reorder Persian text when possible; otherwise use a fallback.
+        # Register all TTF files we downloaded (if present)
+        registered = []
+        for fname in VAZIRMATN_FONT_FILES:
+            fp = os.path.join(font_dir, fname)
+            if os.path.exists(fp):
+                try:
+                    fm.fontManager.addfont(fp)
+                    registered.append(fname)
+                except Exception as e:
+                    print(f"Warning: could not register font {fname}: {e}")
+
+        # Use the regular font as the global default family when present,
+        # otherwise fall back to generic sans-serif
+        font_name = "sans-serif"
+        if os.path.exists(regular_font_path):
+            try:
+                font_name = PERSIAN_FONT.get_name()
+            except Exception:
+                font_name = "Vazirmatn"
+
+        rc = MappingProxyType({
+            "font.family": [font_name],
+            "font.size": 16,
+            # Ensure minus sign renders correctly
+            "axes.unicode_minus": False,
+        })
+
+        _RENDER_PROFILE = RenderProfile(
+            font=PERSIAN_FONT,
+            font_name=font_name,
+            registered_fonts=tuple(registered),
+            rc=rc,
+        )
+        return _RENDER_PROFILE
+
+
+# rc_context swaps the global rcParams, so figures are styled one at a time
+_FIGURE_STYLE_LOCK = threading.RLock()
 
-    - If arabic_reshaper + python-bidi are available, use them for correct shaping and bidi.
-    - Otherwise use a conservative approximation that reverses RTL groups and adds RLM.
+
+@contextmanager
+def _figure_style():
+    """Build a figure with the chart style in effect.
+
+    matplotlib reads rcParams when artists are created, so the scaffold is
+    built inside this context and keeps its style afterwards. Lesson artists
+    set their font, size and colors explicitly and need no context, which
+    lets renders in other threads add them while a scaffold is being built.
     """
-    if not text:
-        return text
+    profile = init_renderer()
+    with _FIGURE_STYLE_LOCK, matplotlib.rc_context(profile.rc):
+        yield
+
+
+_WARMUP_LESSONS = [
+    Lesson(name="گرم کردن", units=1, schedules=[
+        LessonSchedule(day="شنبه", start_time="08:00", end_time="10:00"),
+    ]),
+]
 
-    if BIDI_AVAILABLE and _arabic_reshaper and _bidi_get_display:
-        try:
-            reshaped = _arabic_reshaper.reshape(text)
-            return _bidi_get_display(reshaped)
-        except Exception:
-            # Fall through to approximation
-            return _fallback_bidi_approx(text)
-    else:
-        return _fallback_bidi_approx(text)
 
+def warm_up_renderer() -> float:
+    """Render and encode a throwaway chart so the first real request is not
+    the one paying for font caches, the background and the encoder.
 
-def create_schedule_chart(lessons: List[Lesson]) -> str:
+    Returns the seconds it took.
+    """
+    started = time.perf_counter()
+    render_chart_png(_WARMUP_LESSONS)
+    return time.perf_counter() - started
+
+
+# Geometry, label fitting and shaping for every output format (see layout.py)
+layout_engine = LayoutEngine({"normal": regular_font_path, "bold": bold_font_path}, shaper,
+                             figsize=CHART_FIGSIZE, margins=CHART_MARGINS, dpi=CHART_DPI, fit_dpi=FIT_DPI)
+
+_LAYOUT_CACHE: "OrderedDict[str, ChartLayout]" = OrderedDict()
+_LAYOUT_CACHE_SIZE = int(os.environ.get("HAFTESOOZ_LAYOUT_CACHE_SIZE", "256"))
+_LAYOUT_CACHE_LOCK = threading.Lock()
+_LAYOUT_STATS = {"hits": 0, "misses": 0}
+
+
+def chart_layout(lessons: List[Lesson]) -> ChartLayout:
+    """Layout for ``lessons``, memoized per process on the lesson content.
+
+    The returned layout is shared; renderers must not modify it.
+    """
+    key = schedule_cache_key(lessons)
+    with _LAYOUT_CACHE_LOCK:
+        layout = _LAYOUT_CACHE.get(key)
+        if layout is not None:
+            _LAYOUT_CACHE.move_to_end(key)
+            _LAYOUT_STATS["hits"] += 1
+            count("layout_cache_hits")
+            return layout
+        _LAYOUT_STATS["misses"] += 1
+    with span("layout"):
+        layout = layout_engine.layout(lessons)
+    with _LAYOUT_CACHE_LOCK:
+        _LAYOUT_CACHE[key] = layout
+        while len(_LAYOUT_CACHE) > _LAYOUT_CACHE_SIZE:
+            _LAYOUT_CACHE.popitem(last=False)
+    return layout
+
+
+def create_schedule_chart(lessons: List[Lesson], filename: Optional[str] = None,
+                          composite: bool = True) -> str:
     """Create a schedule chart and return the filename.
 
+    When ``filename`` is omitted a random one is generated. The image is written
+    to a temporary file first and moved into place, so readers never observe a
+    partially written chart.
+
+    By default only the lesson blocks are drawn, onto a cached raster of the
+    static chart scaffold. ``composite=False`` draws the whole figure from
+    scratch instead; it produces the same chart and is kept as a reference.
+
     Rectangles occupy most of the vertical day cell to match the example image.
     Persian shaping (arabic_reshaper + python-bidi) is used when available.
     """
 
-    import matplotlib
-    matplotlib.use('Agg')
-    import matplotlib.pyplot as plt
-    import matplotlib.patches as patches
-    from matplotlib import font_manager
-
-    # Optional RTL shaping libraries
-    try:
-        import arabic_reshaper
-        from bidi.algorithm import get_display
-        bidi_available = True
-    except Exception:
-        arabic_reshaper = None
-        get_display = None
-        bidi_available = False
-
-    # Configure matplotlib to use our downloaded Vazirmatn fonts
-    # We'll register the local TTF files and create a FontProperties pointing
-    # to Vazirmatn-Regular.ttf so we can set it globally and also pass it
-    # explicitly to individual text calls when needed.
-    try:
-        import os
-        from matplotlib import rcParams
-        from matplotlib import font_manager as fm
+    init_renderer()
 
-        font_dir = os.path.join(os.path.dirname(__file__), 'static', 'fonts')
-        regular_font_path = os.path.join(font_dir, 'Vazirmatn-Regular.ttf')
+    os.makedirs(CHARTS_DIR, exist_ok=True)
 
-        # Register all TTF files we downloaded (if present)
-        for fname in ('Vazirmatn-Light.ttf', 'Vazirmatn-Regular.ttf', 'Vazirmatn-Medium.ttf',
-                      'Vazirmatn-SemiBold.ttf', 'Vazirmatn-Bold.ttf'):
-            fp = os.path.join(font_dir, fname)
-            if os.path.exists(fp):
-                fm.fontManager.addfont(fp)
+    # Generate unique filename
+    if filename is None:
+        filename = f"schedule_{uuid.uuid4().hex[:8]}.png"
+    filepath = os.path.join(CHARTS_DIR, filename)
+    tmp_path = f"{filepath}.{uuid.uuid4().hex[:8]}.tmp"
 
-        # Create a FontProperties object for the regular font
-        if os.path.exists(regular_font_path):
-            persian_font = fm.FontProperties(fname=regular_font_path)
-            # Set global default font family to the registered font name
-            try:
-                rcParams['font.family'] = persian_font.get_name()
-            except Exception:
-                # Fallback: use the file name if get_name() fails
-                rcParams['font.family'] = ['Vazirmatn']
+    # Save the chart
+    try:
+        if composite:
+            with open(tmp_path, "wb") as f:
+                render_chart_png(lessons, out=f)
         else:
-            # If the regular font isn't present, fall back to generic sans-serif
-            rcParams['font.family'] = ['sans-serif']
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            from matplotlib.figure import Figure
+
+            with _figure_style():
+                fig = Figure(figsize=CHART_FIGSIZE)
+                FigureCanvasAgg(fig)
+                ax = _build_chart_axes(fig)
+                _add_lesson_artists(ax, chart_layout(lessons).blocks)
+                with span("draw_encode"):
+                    fig.savefig(tmp_path, format="png", dpi=CHART_DPI, bbox_inches="tight", facecolor="white")
+            count("canvas_draws")
+            count("bytes_written", os.path.getsize(tmp_path))
+        with span("write"):
+            os.replace(tmp_path, filepath)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return filename
 
-        # Ensure minus sign renders correctly
-        rcParams['axes.unicode_minus'] = False
 
-        # Expose persian_font for use in local scope (optional)
-        _PERSIAN_FONT_PROP = persian_font if 'persian_font' in locals() else None
+@contextmanager
+def rendered_chart(lessons: List[Lesson], dpi: int = CHART_DPI):
+    """Rasterize the chart for ``lessons`` and lend out its pixels.
 
-    except Exception as e:
-        # If anything goes wrong, use matplotlib defaults but don't crash
-        print(f"Warning: could not configure Vazirmatn fonts for matplotlib: {e}")
+    Yields a read-only RGBA view of the scaffold's canvas, valid only inside
+    the ``with`` block: the canvas is reused by the next render, so nothing
+    is allocated or copied per render. Safe to use from several threads at
+    once, each render drawing on a scaffold of its own (see
+    ``_checkout_scaffold``).
+    """
+    layout = chart_layout(lessons)
+    count("lessons", len(lessons))
+    count("blocks", len(layout.blocks))
+    with _checkout_scaffold(CHART_FIGSIZE, dpi) as scaffold:
         try:
-            from matplotlib import rcParams
-            rcParams['font.family'] = ['sans-serif']
-            rcParams['axes.unicode_minus'] = False
-        except Exception:
-            pass
+            with span("draw"):
+                pixels = _draw_blocks(scaffold, layout)
+            yield pixels
+        finally:
+            scaffold.reset()
 
-    plt.rcParams["font.size"] = 16
-    plt.rcParams["axes.unicode_minus"] = False
 
-    # Make the figure wider so the schedule is more horizontally stretched
-    fig, ax = plt.subplots(figsize=(22, 12))
+def render_chart_image(lessons: List[Lesson], dpi: int = CHART_DPI):
+    """Rasterize the chart for ``lessons``; returns an RGBA array the caller owns."""
+    with rendered_chart(lessons, dpi) as pixels:
+        return pixels.copy()
+
+
+def _build_chart_axes(fig):
+    """Draw the static scaffold (grid, hour axis, day labels, title) on ``fig``.
+
+    Returns the main axes, in which lesson blocks are placed in data
+    coordinates: x is hours after 06:00, y is the day index.
+    """
+    ax = fig.add_subplot()
+    # Use explicit subplots_adjust (tight_layout can override manual margins and clip the right labels)
+    # For a wider figure give more room on the right for day labels and more plotting space on the left.
+    # Applied up front so label fitting measures against the final rectangle sizes.
+    fig.subplots_adjust(**CHART_MARGINS)
 
     # Time slots (6 AM to 10 PM)
-    hours = list(range(6, 23))
+    hours = CHART_HOURS
     hour_labels = [f"{h:02d}:00" for h in hours]
 
     # Days
@@ -242,142 +395,14 @@ def create_schedule_chart(lessons: List[Lesson]) -> str:
             lbl.set_fontsize(24)
         except Exception:
             pass
-    # We'll adjust layout later once all styling is applied (final subplots_adjust below)
 
-    # Add grid
+    # Add grid; keep it below the lesson blocks so a block composited onto a
+    # pre-rendered background looks the same as one drawn with the full figure
     ax.grid(True, alpha=0.3)
-
-    # Colors for different lessons
-    colors = ["#FF6B6B", "#4ECDC4", "#45B7D1", "#96CEB4", "#FECA57", "#FF9FF3", "#54A0FF", "#FD79A8"]
-    color_index = 0
-
-    # Process each lesson
-    for lesson in lessons:
-        color = colors[color_index % len(colors)]
-
-        for schedule in lesson.schedules:
-            day_name = schedule.day
-            if day_name not in PERSIAN_DAYS:
-                continue
-
-            day_index = PERSIAN_DAYS[day_name]
-
-            try:
-                # Parse time
-                start_hour = int(schedule.start_time.split(":")[0])
-                end_hour = int(schedule.end_time.split(":")[0])
-
-                # Calculate position
-                # Note: because x-axis is reversed, we compute x from left but then rectangles will plot correctly
-                start_pos = start_hour - 6  # Offset from 6 AM
-                duration = end_hour - start_hour
-
-                # Rectangle should almost cover the vertical day cell (leave a small gap)
-                rect_height = 0.92
-                rect_y = day_index + (1.0 - rect_height) / 2.0
-
-                if start_pos >= 0 and start_pos < len(hours) and duration > 0:
-                    # Create rectangle for the lesson
-                    # When x-axis is reversed, patch placement is the same (matplotlib flips view)
-                    rect = patches.Rectangle((start_pos, rect_y), duration, rect_height,
-                                             linewidth=2, edgecolor="black", facecolor=color, alpha=0.85)
-                    ax.add_patch(rect)
-
-                    # Add lesson name and units text. For Persian we may need to reshape and reorder.
-                    text_x = start_pos + duration / 2
-                    text_y = day_index + 0.5
-
-                    lesson_text = f"{lesson.name}\n({lesson.units} واحد)"
-                    display_text = _maybe_shape_persian(lesson_text)
-
-                    # Smart font sizing: measure text in pixels and reduce size until it fits
-                    # Make text black and bold. This approach uses the renderer to get
-                    # exact extents so we can ensure the label doesn't overflow.
-                    # Start with a generous max font size and shrink to fit.
-                    max_font = 32
-                    min_font = 10
-
-                    # Try to create a sensible multi-line text (split long names reasonably)
-                    words = lesson.name.split()
-                    if len(words) > 1 and len(lesson.name) > 20 and duration >= 2:
-                        mid = len(words) // 2
-                        line1 = " ".join(words[:mid])
-                        line2 = " ".join(words[mid:])
-                        candidate_text = f"{line1}\n{line2}\n({lesson.units} واحد)"
-                    else:
-                        candidate_text = f"{lesson.name}\n({lesson.units} واحد)"
-
-                    # Place a Text object with an initial large fontsize, then measure
-                    txt = ax.text(text_x, text_y, _maybe_shape_persian(candidate_text),
-                                  ha="center", va="center", fontsize=max_font,
-                                  fontweight="bold", color="black", zorder=3,
-                                  fontproperties=PERSIAN_FONT)
-
-                    # Ensure canvas has a renderer available
-                    try:
-                        fig.canvas.draw()
-                        renderer = fig.canvas.get_renderer()
-
-                        # Rectangle bounds in display (pixel) coordinates
-                        p0 = ax.transData.transform((start_pos, rect_y))
-                        p1 = ax.transData.transform((start_pos + duration, rect_y + rect_height))
-                        rect_w_px = abs(p1[0] - p0[0])
-                        rect_h_px = abs(p1[1] - p0[1])
-
-                        # Padding inside the rectangle (pixels)
-                        pad_px = max(6, rect_w_px * 0.06)
-
-                        # Iteratively reduce fontsize until text fits width and height
-                        bbox = txt.get_window_extent(renderer=renderer)
-                        current_font = max_font
-                        attempts = 0
-                        while (bbox.width > (rect_w_px - pad_px) or bbox.height > (rect_h_px - pad_px)) and current_font > min_font and attempts < 10:
-                            # Scale font proportionally to available width (conservative)
-                            scale = (rect_w_px - pad_px) / max(bbox.width, 1)
-                            new_font = max(min_font, int(current_font * scale * 0.95))
-                            if new_font >= current_font:
-                                new_font = current_font - 1
-                            current_font = new_font
-                            txt.set_fontsize(current_font)
-                            fig.canvas.draw()
-                            bbox = txt.get_window_extent(renderer=renderer)
-                            attempts += 1
-
-                        # If text still doesn't fit and we used a single-line name, try splitting words again
-                        if (bbox.width > (rect_w_px - pad_px) or bbox.height > (rect_h_px - pad_px)) and len(words) > 1:
-                            mid = len(words) // 2
-                            line1 = " ".join(words[:mid])
-                            line2 = " ".join(words[mid:])
-                            candidate_text = f"{line1}\n{line2}\n({lesson.units} واحد)"
-                            txt.set_text(_maybe_shape_persian(candidate_text))
-                            # Reset font and try shrinking again
-                            current_font = min(max_font, current_font)
-                            txt.set_fontsize(current_font)
-                            fig.canvas.draw()
-                            bbox = txt.get_window_extent(renderer=renderer)
-                            attempts = 0
-                            while (bbox.width > (rect_w_px - pad_px) or bbox.height > (rect_h_px - pad_px)) and current_font > min_font and attempts < 10:
-                                scale = (rect_w_px - pad_px) / max(bbox.width, 1)
-                                new_font = max(min_font, int(current_font * scale * 0.95))
-                                if new_font >= current_font:
-                                    new_font = current_font - 1
-                                current_font = new_font
-                                txt.set_fontsize(current_font)
-                                fig.canvas.draw()
-                                bbox = txt.get_window_extent(renderer=renderer)
-                                attempts += 1
-
-                    except Exception:
-                        # If renderer-based sizing fails for any reason, fallback to a readable default
-                        txt.set_fontsize(14)
-
-            except (ValueError, IndexError):
-                continue
-
-        color_index += 1
+    ax.set_axisbelow(True)
 
     # Styling with larger fonts
-    title = _maybe_shape_persian("برنامه هفتگی دروس")
+    title = _maybe_shape_persian(CHART_TITLE)
 
     ax.set_title(title, fontsize=30, fontweight="bold", pad=30, fontproperties=PERSIAN_FONT)
 
@@ -402,28 +427,863 @@ def create_schedule_chart(lessons: List[Lesson]) -> str:
         except Exception:
             pass
 
-    # Use explicit subplots_adjust (tight_layout can override manual margins and clip the right labels)
-    # For a wider figure give more room on the right for day labels and more plotting space on the left
-    fig.subplots_adjust(left=0.04, right=0.86, top=0.94, bottom=0.06)
-
     # Slightly increase xtick font size to improve readability now that there's more horizontal room
     for lbl in ax.get_xticklabels():
         lbl.set_fontsize(18)
 
-    # Ensure output dir exists
-    os.makedirs("generated_charts", exist_ok=True)
+    return ax
 
-    # Generate unique filename
-    filename = f"schedule_{uuid.uuid4().hex[:8]}.png"
-    filepath = os.path.join("generated_charts", filename)
 
-    # Save the chart
-    plt.savefig(filepath, dpi=300, bbox_inches="tight", facecolor="white")
-    plt.close()
+def _add_lesson_artists(ax, blocks: List[Block]) -> list:
+    """Add a rectangle and its fitted label per lesson block; return the
+    artists, two per block in the order of ``blocks``.
+
+    Blocks are placed in data coordinates: x is hours after 06:00, y is the
+    day index.
+    """
+    import matplotlib.patches as patches
+
+    artists = []
+    for block in blocks:
+        rect = patches.Rectangle((block.start, block.day + (1.0 - BLOCK_HEIGHT) / 2.0), block.duration,
+                                 BLOCK_HEIGHT, linewidth=BLOCK_EDGE_WIDTH, edgecolor="black",
+                                 facecolor=block.color, alpha=BLOCK_ALPHA)
+        ax.add_patch(rect)
+        artists.append(rect)
+
+        txt = ax.text(block.start + block.duration / 2, block.day + 0.5, block.shaped_label,
+                      ha="center", va="center", fontsize=block.font_size,
+                      fontweight="bold", color="black", zorder=3,
+                      fontproperties=PERSIAN_FONT)
+        artists.append(txt)
+    return artists
+
+
+class _ChartScaffold:
+    """The static part of the chart, rasterized once and reused as a background.
+
+    Per render only the lesson artists and the axes frame (which is drawn over
+    the blocks) are drawn on top of a copy of the background pixels. The tight bounding box does not depend on the lessons
+    (blocks stay inside the axes), so it is applied once to the figure itself.
+    """
+
+    def __init__(self, figsize, dpi):
+        with _figure_style():
+            self._build(figsize, dpi)
+
+    def _build(self, figsize, dpi):
+        import matplotlib
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        self.key = (tuple(figsize), dpi)
+        self.fig = Figure(figsize=figsize, dpi=dpi, facecolor="white")
+        self.canvas = FigureCanvasAgg(self.fig)
+        self.ax = _build_chart_axes(self.fig)
+
+        # Reproduce savefig(bbox_inches="tight"): the title pokes out above the
+        # nominal figure, so grow the figure to the padded tight box and move
+        # the axes so that they keep their absolute size and relative offsets.
+        tight = self.fig.get_tightbbox(self.canvas.get_renderer())
+        tight = tight.padded(matplotlib.rcParams["savefig.pad_inches"])
+        fig_w, fig_h = figsize
+        self.fig.set_size_inches(tight.width, tight.height)
+        self.fig.subplots_adjust(
+            left=(CHART_MARGINS["left"] * fig_w - tight.x0) / tight.width,
+            right=(CHART_MARGINS["right"] * fig_w - tight.x0) / tight.width,
+            bottom=(CHART_MARGINS["bottom"] * fig_h - tight.y0) / tight.height,
+            top=(CHART_MARGINS["top"] * fig_h - tight.y0) / tight.height,
+        )
+
+        # The frame is drawn over the blocks, so keep it out of the background
+        spines = list(self.ax.spines.values())
+        for spine in spines:
+            spine.set_visible(False)
+        self.canvas.draw()
+        count("canvas_draws")
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        for spine in spines:
+            spine.set_visible(True)
+
+        # Pixel rows of each day's cell, top to bottom (the y axis is inverted)
+        height = self.canvas.get_width_height()[1]
+        edges = [round(height - self.ax.transData.transform((0, day))[1]) for day in range(len(DAY_NAMES) + 1)]
+        self.day_rows = list(zip(edges, edges[1:]))
+
+    def footprint(self, day: int, artists):
+        """The pixel rows and columns ``artists`` can touch, as slices of the
+        canvas array, or None if that reaches outside the cell of ``day``."""
+        import math
+
+        renderer = self.canvas.get_renderer()
+        width, height = self.canvas.get_width_height()
+        scale = self.fig.dpi / 72.0
+        x0 = y0 = math.inf
+        x1 = y1 = -math.inf
+        for artist in artists:
+            box = artist.get_window_extent(renderer)
+            # Pixel snapping and antialiasing, and for blocks half the edge
+            # line, reach past the extent
+            if hasattr(artist, "get_fontsize"):
+                pad = 0.1 * artist.get_fontsize() * scale + 1
+            else:
+                pad = artist.get_linewidth() * scale / 2 + 1
+            x0, x1 = min(x0, box.x0 - pad), max(x1, box.x1 + pad)
+            y0, y1 = min(y0, box.y0 - pad), max(y1, box.y1 + pad)
+        top, bottom = math.floor(height - y1), math.ceil(height - y0)
+        first, last = self.day_rows[day]
+        if top < first or bottom > last:
+            return None
+        return slice(top, bottom), slice(max(0, math.floor(x0)), min(width, math.ceil(x1)))
+
+    def reset(self):
+        """Remove the lesson artists of the last render, including a failed one's."""
+        for artist in [*self.ax.patches, *self.ax.texts]:
+            artist.remove()
+
+    def composite(self, artists):
+        """Draw ``artists`` over the background; return the canvas pixels (RGBA, read-only view)."""
+        import numpy as np
+
+        self.canvas.restore_region(self.background)
+        # Same stacking as a full draw: blocks, then the frame, then labels
+        layers = list(artists) + list(self.ax.spines.values())
+        for artist in sorted(layers, key=lambda a: a.get_zorder()):
+            self.fig.draw_artist(artist)
+        count("artist_draws", len(layers))
+        pixels = np.asarray(self.canvas.buffer_rgba())
+        pixels.flags.writeable = False
+        return pixels
+
+
+# Idle scaffolds per (figsize, dpi); one is built for each render running at once
+_CHART_SCAFFOLDS: Dict[tuple, List[_ChartScaffold]] = {}
+_CHART_SCAFFOLDS_LOCK = threading.Lock()
+
+
+@contextmanager
+def _checkout_scaffold(figsize, dpi):
+    """Lend a scaffold for a figure size and DPI to one render.
+
+    A scaffold is a figure with its own canvas and artists, so renders in
+    different threads never draw on the same one. A new scaffold is built
+    only when every existing one is lent out; it is kept for reuse, so a
+    process holds as many as it has run renders concurrently.
+    """
+    key = (tuple(figsize), dpi)
+    with _CHART_SCAFFOLDS_LOCK:
+        idle = _CHART_SCAFFOLDS.setdefault(key, [])
+        scaffold = idle.pop() if idle else None
+    if scaffold is None:
+        scaffold = _ChartScaffold(figsize, dpi)
+    try:
+        yield scaffold
+    finally:
+        with _CHART_SCAFFOLDS_LOCK:
+            _CHART_SCAFFOLDS[key].append(scaffold)
+
+
+# Rasterized day rows of recent charts, keyed on the blocks of the day. A
+# re-submitted schedule usually differs in a day or two; the other days are
+# pasted from here instead of drawn. 0 turns it off.
+TILE_CACHE_BYTES = int(os.environ.get("HAFTESOOZ_TILE_CACHE_MB", "64")) * 1024 * 1024
+_TILE_CACHE: "OrderedDict[tuple, tuple]" = OrderedDict()
+_TILE_CACHE_LOCK = threading.Lock()
+_TILE_STATS = {"hits": 0, "misses": 0, "spills": 0, "bytes": 0}
+
+
+def _tile_key(scaffold: _ChartScaffold, day: int, blocks: List[Block]) -> tuple:
+    return (scaffold.key, day, tuple((b.start, b.duration, b.color, b.font_size, b.shaped_label) for b in blocks))
+
+
+def _store_tile(key: tuple, tile: tuple):
+    size = tile[2].nbytes
+    with _TILE_CACHE_LOCK:
+        if key in _TILE_CACHE or size > TILE_CACHE_BYTES:
+            return
+        _TILE_CACHE[key] = tile
+        _TILE_STATS["bytes"] += size
+        while _TILE_STATS["bytes"] > TILE_CACHE_BYTES:
+            _, (_, _, old) = _TILE_CACHE.popitem(last=False)
+            _TILE_STATS["bytes"] -= old.nbytes
+
+
+def _draw_blocks(scaffold: _ChartScaffold, layout: ChartLayout):
+    """Draw the lesson blocks of ``layout`` on ``scaffold``; returns its pixels
+    like ``_ChartScaffold.composite``.
+
+    Days whose blocks were drawn before are pasted from the tile cache and
+    only the others are drawn. Within a day's cell the pixels depend on
+    nothing but the background, the frame and that day's blocks, so the
+    result is the same as drawing them all, as long as every day stays in
+    its cell; when one does not, everything is drawn and nothing is kept.
+    """
+    import numpy as np
+
+    if not TILE_CACHE_BYTES:
+        return scaffold.composite(_add_lesson_artists(scaffold.ax, layout.blocks))
+
+    days: Dict[int, List[Block]] = {}
+    for block in layout.blocks:
+        days.setdefault(block.day, []).append(block)
+    keys = {day: _tile_key(scaffold, day, blocks) for day, blocks in days.items()}
+    with _TILE_CACHE_LOCK:
+        tiles = {day: _TILE_CACHE[key] for day, key in keys.items() if key in _TILE_CACHE}
+        for day in tiles:
+            _TILE_CACHE.move_to_end(keys[day])
+        _TILE_STATS["hits"] += len(tiles)
+        _TILE_STATS["misses"] += len(days) - len(tiles)
+    count("tile_hits", len(tiles))
+    count("tile_misses", len(days) - len(tiles))
+
+    # Drawn in layout order, so with no tiles this is exactly a full draw
+    drawn = [block for block in layout.blocks if block.day not in tiles]
+    artists = _add_lesson_artists(scaffold.ax, drawn)
+    pixels = scaffold.composite(artists)
+    by_day: Dict[int, list] = {}
+    for block, pair in zip(drawn, zip(artists[::2], artists[1::2])):
+        by_day.setdefault(block.day, []).extend(pair)
+    footprints = {day: scaffold.footprint(day, day_artists) for day, day_artists in by_day.items()}
+
+    if any(footprint is None for footprint in footprints.values()):
+        with _TILE_CACHE_LOCK:
+            _TILE_STATS["spills"] += 1
+        if tiles:
+            scaffold.reset()
+            pixels = scaffold.composite(_add_lesson_artists(scaffold.ax, layout.blocks))
+        return pixels
+
+    if tiles:
+        canvas = np.asarray(scaffold.canvas.buffer_rgba())
+        for rows, cols, tile in tiles.values():
+            canvas[rows, cols] = tile
+    for day, (rows, cols) in footprints.items():
+        tile = pixels[rows, cols].copy()
+        tile.flags.writeable = False
+        _store_tile(keys[day], (rows, cols, tile))
+    return pixels
+
+
+def render_chart_png(lessons: List[Lesson], out=None):
+    """Render the chart for ``lessons`` as a PNG with the print profile.
+
+    Returns the PNG bytes, or with ``out`` (a binary file, file descriptor
+    or socket) writes them straight into it and returns their number. The
+    canvas is only held until the pixels are quantized; deflating happens
+    after it is handed back.
+    """
+    init_renderer()
+    profile = PNG_PROFILES["print"]
+    with rendered_chart(lessons) as pixels, span("encode"):
+        image = prepare_image(pixels, profile)
+    with span("encode"):
+        result = write_png(image, profile, CHART_DPI, out)
+    count("bytes_written", result if out is not None else len(result))
+    return result
+
+
+# Width in pixels of the on-screen preview; the full chart is about 6900 wide
+PREVIEW_WIDTH = int(os.environ.get("HAFTESOOZ_PREVIEW_WIDTH", "1600"))
+try:
+    # Registers an AVIF encoder with Pillow where the plugin is installed
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+
+
+def preview_formats() -> List[str]:
+    """Preview encodings this Pillow can write, best first, PNG always last."""
+    from PIL import Image
+
+    Image.init()
+    return [fmt for fmt in ("avif", "webp") if fmt.upper() in Image.SAVE] + ["png"]
+
+
+def _downscale(rgba, factor: int, rows: int = 256):
+    """``rgba`` shrunk by ``factor`` with Pillow's box ``reduce``, as an RGB image.
+
+    Reduced in stripes of whole blocks, which gives the same pixels as one
+    ``reduce`` of the full image without Pillow holding its own copy of it.
+    The chart is drawn on opaque white, so alpha is dropped.
+    """
+    from PIL import Image
+
+    height, width = rgba.shape[:2]
+    step = max(1, rows // factor) * factor
+    small = Image.new("RGB", (-(-width // factor), -(-height // factor)))
+    for top in range(0, height, step):
+        small.paste(Image.fromarray(rgba[top:top + step], "RGBA").reduce(factor).convert("RGB"),
+                    (0, top // factor))
+    return small
+
+
+def encode_previews(small, factor: int, formats: Optional[List[str]] = None) -> Dict[str, bytes]:
+    """Encode a chart downscaled by ``factor`` (see ``_downscale``) in each preview format.
+
+    PNG and WebP are written losslessly from the same quantized image (see
+    png_encoder.py), so they show identical pixels; at a few hundred colors
+    lossless WebP is smaller than lossy.
+    """
+    import numpy as np
+
+    profile = PNG_PROFILES["preview"]
+    quantized = prepare_image(np.asarray(small), profile)
+    previews = {}
+    for fmt in formats or preview_formats():
+        buf = io.BytesIO()
+        with span(f"preview_{fmt}_encode"):
+            if fmt == "png":
+                buf.write(write_png(quantized, profile, dpi=CHART_DPI / factor))
+            elif fmt == "webp":
+                quantized.convert("RGB").save(buf, format="WEBP", lossless=True, quality=100, method=4)
+            else:
+                small.save(buf, format=fmt.upper(), quality=75)
+        previews[fmt] = buf.getvalue()
+        count("bytes_written", len(previews[fmt]))
+    return previews
+
+
+def render_chart_previews(lessons: List[Lesson]) -> Dict[str, bytes]:
+    """Rasterize the chart for ``lessons`` once and return its preview encodings.
+
+    The full-resolution PNG is not encoded here; see ``get_chart``.
+    """
+    init_renderer()
+    # Only the downscale needs the canvas; it is handed back before encoding
+    with rendered_chart(lessons) as pixels, span("downscale"):
+        factor = max(1, -(-pixels.shape[1] // PREVIEW_WIDTH))
+        small = _downscale(pixels, factor)
+    return encode_previews(small, factor)
+
+
+# SVG and PDF are written directly from the layout, without matplotlib
+vector_renderer = VectorChartRenderer({"normal": regular_font_path, "bold": bold_font_path})
+
+
+def layout_json(layout: ChartLayout) -> bytes:
+    return json.dumps(layout.to_dict(), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def render_chart_document(lessons: List[Lesson], fmt: str) -> bytes:
+    """Render the chart for ``lessons`` as "svg", "pdf" or its "json" layout.
+
+    These take milliseconds and run in-process rather than in the render pool.
+    """
+    layout = chart_layout(lessons)
+    count("lessons", len(lessons))
+    count("blocks", len(layout.blocks))
+    with span(f"{fmt}_encode"):
+        if fmt == "svg":
+            data = vector_renderer.svg(layout)
+        elif fmt == "pdf":
+            data = vector_renderer.pdf(layout)
+        else:
+            data = layout_json(layout)
+    count("bytes_written", len(data))
+    return data
+
+
+# Bump when the chart drawing changes so stale cached images are not reused.
+CHART_RENDER_VERSION = "5"
+
+_DIGIT_TABLE = str.maketrans("۰۱۲۳۴۵۶۷۸۹٠١٢٣٤٥٦٧٨٩", "01234567890123456789")
+_LETTER_TABLE = str.maketrans({"ي": "ی", "ى": "ی", "ك": "ک"})
+_DAY_LOOKUP = {re.sub(r"[\s\u200c]", "", d): d for d in DAY_NAMES}
+
 
+def _normalize_text(text: str) -> str:
+    """Unify digits and Arabic/Persian letter variants and collapse whitespace."""
+    text = (text or "").translate(_DIGIT_TABLE).translate(_LETTER_TABLE)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _normalize_day(day: str) -> str:
+    """Map spelling variants such as "سه شنبه" onto the canonical day name."""
+    day = _normalize_text(day)
+    return _DAY_LOOKUP.get(re.sub(r"[\s\u200c]", "", day), day)
+
+
+def _normalize_time(value: str) -> str:
+    """Normalize "8:0", "۰۸:۰۰" or "8" to zero-padded "HH:MM"."""
+    value = _normalize_text(value)
+    match = re.fullmatch(r"(\d{1,2})(?::(\d{1,2}))?", value)
+    if not match:
+        return value
+    return f"{int(match.group(1)):02d}:{int(match.group(2) or 0):02d}"
+
+
+def canonicalize_lessons(lessons: List[Lesson]) -> List[Lesson]:
+    """Return an equivalent lesson list in a stable, normalized form.
+
+    Two submissions describing the same week (different lesson order, spacing or
+    digit style) canonicalize to the same list. The chart is rendered from the
+    canonical list so the colors assigned by position are stable as well.
+    """
+    canonical = []
+    for lesson in lessons:
+        schedules = {
+            (_normalize_day(s.day), _normalize_time(s.start_time), _normalize_time(s.end_time))
+            for s in lesson.schedules
+        }
+        ordered = sorted(schedules, key=lambda s: (PERSIAN_DAYS.get(s[0], len(DAY_NAMES)), s[1], s[2], s[0]))
+        canonical.append(Lesson(
+            name=_normalize_text(lesson.name),
+            units=lesson.units,
+            schedules=[LessonSchedule(day=d, start_time=st, end_time=et) for d, st, et in ordered]
+        ))
+
+    canonical.sort(key=lambda l: (l.name, l.units, [(s.day, s.start_time, s.end_time) for s in l.schedules]))
+    return canonical
+
+
+def check_schedule_overlaps(lessons: List[Lesson]) -> List[ScheduleConflict]:
+    """Every pair of meetings that overlap in time; meetings that only touch
+    (one ends when the other starts) are fine. Empty when the week is valid."""
+    return WeekSchedule(canonicalize_lessons(lessons)).conflicts()
+
+
+def _conflicts_response(conflicts: List[ScheduleConflict]) -> JSONResponse:
+    return JSONResponse({"error": "Schedule has overlapping lessons",
+                         "conflicts": [c.to_dict() for c in conflicts]}, status_code=409)
+
+
+def schedule_cache_key(lessons: List[Lesson]) -> str:
+    """Stable content hash of an already canonicalized lesson list."""
+    payload = {
+        "version": CHART_RENDER_VERSION,
+        "lessons": [
+            {
+                "name": lesson.name,
+                "units": lesson.units,
+                "schedules": [[s.day, s.start_time, s.end_time] for s in lesson.schedules],
+            }
+            for lesson in lessons
+        ],
+    }
+    encoded = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+CHART_MEDIA_TYPES = {"png": "image/png", "svg": "image/svg+xml", "pdf": "application/pdf",
+                     "json": "application/json", "webp": "image/webp", "avif": "image/avif"}
+
+
+@contextmanager
+def atomic_write(path: str):
+    """Binary file that replaces ``path`` once the block completes, and is
+    discarded if it fails, so readers never observe a partial file."""
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            yield f
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class ChartCache:
+    """Bounded on-disk LRU of rendered charts, keyed by schedule hash.
+
+    Entries and their recency are kept in a ``ChartIndex`` next to the
+    charts, shared by every server process and persistent across restarts;
+    entries are evicted oldest-first once either the entry count or the
+    total size exceeds its limit. Each output format of a schedule is its
+    own entry, named by the schedule hash and the extension. Hit, miss and
+    eviction counts are this process's own.
+
+    Lookups write to the index too (recency), and any index write can wait
+    on another process's lock, so the app calls these methods on the default
+    executor rather than on the event loop.
+    """
+
+    def __init__(self, directory: str, max_entries: int = 500, max_bytes: int = 512 * 1024 * 1024,
+                 index_path: Optional[str] = None):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._index = ChartIndex(index_path or os.path.join(directory, ".index.sqlite3"))
+        self._load()
+
+    def _load(self):
+        found = []
+        for name in os.listdir(self.directory):
+            if name.rsplit(".", 1)[-1] not in CHART_MEDIA_TYPES:
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            found.append((st.st_mtime, name, st.st_size))
+        self._index.sync((name, size) for _, name, size in sorted(found))
+        self._evict()
+
+    @staticmethod
+    def filename_for(key: str, fmt: str = "png") -> str:
+        return f"schedule_{key[:16]}.{fmt}"
+
+    def path_for(self, key: str, fmt: str = "png") -> str:
+        return os.path.join(self.directory, self.filename_for(key, fmt))
+
+    def get(self, key: str, fmt: str = "png") -> Optional[str]:
+        """Return the cached filename for ``key`` or None, updating counters."""
+        filename = self.filename_for(key, fmt)
+        indexed = self._index.touch(filename)
+        if indexed and os.path.exists(os.path.join(self.directory, filename)):
+            with self._lock:
+                self.hits += 1
+            return filename
+        if indexed:
+            # File was removed behind our back
+            self._index.remove(filename)
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def store_bytes(self, key: str, data: bytes, fmt: str = "png") -> str:
+        """Write an already encoded chart for ``key`` and record it."""
+        with atomic_write(self.path_for(key, fmt)) as f:
+            f.write(data)
+        return self.put(key, fmt)
+
+    def put(self, key: str, fmt: str = "png") -> str:
+        """Record a chart for ``key`` written to ``path_for(key, fmt)`` and enforce the bounds."""
+        filename = self.filename_for(key, fmt)
+        self._index.add(filename, os.path.getsize(os.path.join(self.directory, filename)))
+        self._evict(keep=filename)
+        return filename
+
+    def _evict(self, keep: Optional[str] = None):
+        evicted = self._index.evict(self.max_entries, self.max_bytes, keep=keep)
+        for filename in evicted:
+            try:
+                os.remove(os.path.join(self.directory, filename))
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self.evictions += len(evicted)
+
+    def stats(self) -> Dict[str, int]:
+        entries, total_bytes = self._index.totals()
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": entries,
+                "bytes": total_bytes,
+            }
+
+
+chart_cache = ChartCache(
+    CHARTS_DIR,
+    max_entries=int(os.environ.get("HAFTESOOZ_CACHE_MAX_ENTRIES", "500")),
+    max_bytes=int(os.environ.get("HAFTESOOZ_CACHE_MAX_MB", "512")) * 1024 * 1024,
+    index_path=os.environ.get("HAFTESOOZ_CACHE_INDEX") or None,
+)
+
+
+_worker_warmup_seconds: Optional[float] = None
+
+
+def _init_render_worker():
+    """Pre-warm a render worker so its first render is as fast as later ones."""
+    global _worker_warmup_seconds
+    _worker_warmup_seconds = warm_up_renderer()
+
+
+def _render_worker_warmup_seconds() -> Optional[float]:
+    return _worker_warmup_seconds
+
+
+render_pool = RenderPool(
+    workers=int(os.environ.get("HAFTESOOZ_RENDER_WORKERS", str(os.cpu_count() or 1))),
+    timeout=float(os.environ.get("HAFTESOOZ_RENDER_TIMEOUT", "30")),
+    initializer=_init_render_worker,
+    start_method=os.environ.get("HAFTESOOZ_RENDER_START_METHOD") or None,
+    # With HAFTESOOZ_RENDER_WORKERS=0, renders run on this many threads in-process
+    threads=int(os.environ.get("HAFTESOOZ_RENDER_THREADS", "1")),
+)
+
+# Estimated peak memory of one render: the RGBA canvas dominates a PNG
+PNG_RENDER_COST = int(CHART_FIGSIZE[0] * CHART_DPI) * int(CHART_FIGSIZE[1] * CHART_DPI) * 4
+VECTOR_RENDER_COST = 4 * 1024 * 1024
+
+admission = AdmissionController(
+    max_in_flight=int(os.environ.get("HAFTESOOZ_MAX_RENDERS", "0")) or render_pool.capacity,
+    memory_budget=int(os.environ.get("HAFTESOOZ_RENDER_MEMORY_MB", "0")) * 1024 * 1024,
+    max_queued=int(os.environ.get("HAFTESOOZ_RENDER_QUEUE", "32")),
+    max_queued_per_client=int(os.environ.get("HAFTESOOZ_RENDER_QUEUE_PER_CLIENT", "0")),
+    max_wait=float(os.environ.get("HAFTESOOZ_RENDER_QUEUE_TIMEOUT", "20")),
+    fair=os.environ.get("HAFTESOOZ_FAIR_QUEUING", "1") == "1",
+)
+# Behind the bundled nginx or the Passenger proxy (wsgi_proxy.py) every
+# connection comes from the proxy; the client address is then taken from
+# X-Real-IP
+TRUST_PROXY = os.environ.get("HAFTESOOZ_TRUST_PROXY", "0") == "1"
+
+
+def client_id(request: Request) -> str:
+    """The address renders are queued under for fair queuing."""
+    if TRUST_PROXY:
+        forwarded = request.headers.get("x-real-ip")
+        if forwarded:
+            return forwarded.strip()
+    return request.client.host if request.client else ""
+
+
+def _render_stats_snapshot() -> Dict[str, Any]:
+    """Counters that live in the rendering process."""
+    return {"pid": os.getpid(), "shaping": shaper.stats(), "peak_rss": peak_rss_bytes()}
+
+
+def _render_preview_job(lessons: List[Lesson], profile: float = 0) -> Dict[str, Any]:
+    """Pool job: rasterize a chart once and return its preview encodings, with
+    the worker's counters and trace. ``profile`` is the sampling interval, 0 to
+    not profile."""
+    previews, trace = traced(render_chart_previews, lessons, profile=bool(profile), interval=profile)
+    return {"previews": previews, "stats": _render_stats_snapshot(), "trace": trace}
+
+
+def _render_png_job(lessons: List[Lesson], profile: float = 0) -> Dict[str, Any]:
+    """Pool job: render a chart in memory and return the PNG bytes."""
+    png, trace = traced(render_chart_png, lessons, profile=bool(profile), interval=profile)
+    return {"png": png, "stats": _render_stats_snapshot(), "trace": trace}
+
+
+def _write_chart_png(lessons: List[Lesson], path: str) -> int:
+    with atomic_write(path) as f:
+        return render_chart_png(lessons, out=f)
+
+
+def _render_png_file_job(lessons: List[Lesson], path: str, profile: float = 0) -> Dict[str, Any]:
+    """Pool job: render a chart's PNG straight into the file at ``path``, so
+    the encoded image never travels back to the server process."""
+    size, trace = traced(_write_chart_png, lessons, path, profile=bool(profile), interval=profile)
+    return {"bytes": size, "stats": _render_stats_snapshot(), "trace": trace}
+
+
+# Latest counters reported by each render process, by pid
+_WORKER_STATS: Dict[int, Dict[str, Any]] = {}
+
+
+def _aggregate_shaping_stats() -> Dict[str, Any]:
+    snapshots = dict(_WORKER_STATS)
+    snapshots[os.getpid()] = _render_stats_snapshot()
+    hits = sum(s["shaping"]["hits"] for s in snapshots.values())
+    misses = sum(s["shaping"]["misses"] for s in snapshots.values())
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+        "processes": len(snapshots),
+    }
+
+
+metrics = Metrics()
+metrics.describe("request_seconds", "histogram", "Request duration by endpoint, including streamed bodies.")
+metrics.describe("stage_seconds", "histogram", "Time per request spent in each stage.")
+metrics.describe("queue_wait_seconds", "histogram", "Time renders waited for an admission slot.")
+metrics.describe("render_seconds", "histogram", "Time renders took once admitted.")
+profiler = SamplingProfiler(rate=float(os.environ.get("HAFTESOOZ_PROFILE_RATE", "0")),
+                            interval=float(os.environ.get("HAFTESOOZ_PROFILE_INTERVAL", "0.005")))
+
+request_log = logging.getLogger("haftesooz.requests")
+if os.environ.get("HAFTESOOZ_REQUEST_LOG", "1") == "1" and not request_log.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    request_log.addHandler(_handler)
+    request_log.setLevel(logging.INFO)
+    request_log.propagate = False
+
+
+def _profile_interval() -> float:
+    """Sampling interval for a render of the current request, 0 when it is not profiled."""
+    trace = current_trace()
+    return profiler.interval if trace is not None and trace.profile else 0.0
+
+
+def _record_render(timings: Dict[str, float], trace: Optional[Dict[str, Any]]):
+    """Account a finished render to the metrics and the current request's trace."""
+    metrics.observe("queue_wait_seconds", timings["queue"])
+    metrics.observe("render_seconds", timings["render"])
+    request_trace = current_trace()
+    if request_trace is not None:
+        request_trace.spans["queue_wait"] += timings["queue"]
+        request_trace.merge(trace)
+
+
+# Renders currently running, by (kind, cache key), so concurrent identical
+# submissions wait for one render instead of starting their own.
+_renders_in_progress: Dict[tuple, "asyncio.Future[Any]"] = {}
+
+
+async def _render_once(flight_key: tuple, job, *args, client: str = "", fail_fast: bool = True) -> Dict[str, Any]:
+    """Run a pool job, sharing the result with concurrent callers of the same key.
+
+    Only the first caller takes an admission slot (and may get ``Overloaded``);
+    ``result["timings"]`` has its queue wait and render time in seconds.
+    """
+    pending = _renders_in_progress.get(flight_key)
+    if pending is not None:
+        return await asyncio.shield(pending)
+
+    pending = asyncio.get_running_loop().create_future()
+    _renders_in_progress[flight_key] = pending
+    try:
+        async with admission.slot(client, PNG_RENDER_COST, fail_fast) as ticket:
+            started = time.perf_counter()
+            result = await render_pool.run(job, *args, _profile_interval())
+            result = {**result, "timings": {"queue": ticket.wait, "render": time.perf_counter() - started}}
+        _WORKER_STATS[result["stats"]["pid"]] = result["stats"]
+        _record_render(result["timings"], result.get("trace"))
+        pending.set_result(result)
+        return result
+    except Exception as exc:
+        pending.set_exception(exc)
+        # Nobody may be waiting on it; avoid "exception was never retrieved"
+        pending.exception()
+        raise
+    finally:
+        if not pending.done():
+            pending.cancel()
+        del _renders_in_progress[flight_key]
+
+
+# Cache entries of a chart's preview, and of the lessons its full-resolution
+# PNG is rendered from when it is first downloaded
+PREVIEW_EXT = "preview"
+LESSONS_EXT = "lessons.json"
+
+
+def _lessons_json(lessons: List[Lesson]) -> bytes:
+    return json.dumps([{"name": lesson.name, "units": lesson.units,
+                        "schedules": [{"day": sc.day, "start_time": sc.start_time, "end_time": sc.end_time}
+                                      for sc in lesson.schedules]}
+                       for lesson in lessons], ensure_ascii=False).encode("utf-8")
+
+
+async def _render_previews(lessons: List[Lesson], key: str, client: str = "", fail_fast: bool = True):
+    """Render and store the preview variants of canonical ``lessons``.
+
+    Returns the PNG preview's filename and the render's timings.
+    """
+    result = await _render_once(("preview", key), _render_preview_job, lessons, client=client, fail_fast=fail_fast)
+    loop = asyncio.get_running_loop()
+    for fmt, data in result["previews"].items():
+        await loop.run_in_executor(None, chart_cache.store_bytes, key, data, f"{PREVIEW_EXT}.{fmt}")
+    await loop.run_in_executor(None, chart_cache.store_bytes, key, _lessons_json(lessons), LESSONS_EXT)
+    return chart_cache.filename_for(key, f"{PREVIEW_EXT}.png"), result["timings"]
+
+
+def _cached_preview(key: str, lessons: List[Lesson]) -> Optional[str]:
+    """The cached PNG preview's filename, making sure its lessons are still stored too."""
+    cached = chart_cache.get(key, f"{PREVIEW_EXT}.png")
+    if cached and not chart_cache.get(key, LESSONS_EXT):
+        chart_cache.store_bytes(key, _lessons_json(lessons), LESSONS_EXT)
+    return cached
+
+
+async def get_or_create_chart(lessons: List[Lesson], client: str = "") -> str:
+    """Return the preview filename for ``lessons``, rendering only on a cache miss.
+
+    Only the preview is rendered; ``chart_cache.filename_for(key)`` names the
+    full-resolution PNG, which is encoded when it is first requested.
+    """
+    lessons = canonicalize_lessons(lessons)
+    key = schedule_cache_key(lessons)
+    cached = await asyncio.get_running_loop().run_in_executor(None, _cached_preview, key, lessons)
+    if cached:
+        return cached
+    filename, _ = await _render_previews(lessons, key, client)
     return filename
 
 
+_CHART_FILENAME_RE = re.compile(r"schedule_([0-9a-f]+)\.((?:preview\.)?(png|webp|avif)|svg|pdf|json)")
+
+
+def _chart_headers(filename: str) -> Dict[str, str]:
+    """Caching headers for a chart image.
+
+    Charts are write-once and named after the schedule hash, so the hash is a
+    strong validator and the response never needs revalidation. Formats other
+    than the full PNG (previews included) carry their extension in the tag, as
+    they are different representations of the same schedule.
+    """
+    match = _CHART_FILENAME_RE.fullmatch(filename)
+    etag = match.group(1) if match.group(2) == "png" else f"{match.group(1)}-{match.group(2)}"
+    return {
+        "ETag": f'"{etag}"',
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "Content-Location": f"/chart/{filename}",
+    }
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match check (weak comparison, as RFC 9110 requires for GET/HEAD)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    tags = [t.strip() for t in header.split(",")]
+    return any(t[2:] == etag if t.startswith("W/") else t == etag for t in tags)
+
+
+_first_request_recorded = False
+
+
+def _record_first_request(seconds: float):
+    """Keep the latency of the first chart request apart from steady state."""
+    global _first_request_recorded
+    if not _first_request_recorded:
+        _first_request_recorded = True
+        STARTUP_TIMINGS["first_request_s"] = seconds
+
+
+def _endpoint_label(scope) -> str:
+    """The route pattern a request matched, so /chart/{filename} is one series."""
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", scope["path"])
+    return "unmatched"
+
+
+app.add_middleware(InstrumentationMiddleware, metrics=metrics, profiler=profiler, logger=request_log,
+                   endpoint=_endpoint_label, skip=("/static", "/metrics", "/health"))
+
+
+def _collect_gauges():
+    yield "render_in_flight", {}, admission.in_flight
+    yield "render_queued", {}, admission.stats()["queued"]
+    yield "render_memory_in_use_bytes", {}, admission.memory_in_use
+    yield "render_pool_in_flight", {}, render_pool.stats()["in_flight"]
+    yield "job_queue_length", {}, job_queue.stats()["queued"]
+    cache = chart_cache.stats()
+    yield "chart_cache_entries", {}, cache["entries"]
+    yield "chart_cache_bytes", {}, cache["bytes"]
+    rss = {str(os.getpid()): peak_rss_bytes()}
+    rss.update({str(pid): stats.get("peak_rss") for pid, stats in _WORKER_STATS.items()})
+    for pid, value in rss.items():
+        if value is not None:
+            yield "peak_rss_bytes", {"pid": pid}, value
+
+
+metrics.gauge(_collect_gauges)
+
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    return JSONResponse({"error": str(exc), "retry_after": exc.retry_after},
+                        status_code=503, headers={"Retry-After": str(exc.retry_after)})
+
+
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
@@ -431,44 +1291,69 @@ async def read_root(request: Request):
 
 @app.post("/generate_chart")
 async def generate_chart(request: Request):
-    form_data = await request.form()
-    # Keep the raw lessons JSON so we can return it to the template for client-side
-    # restoration of the form even if chart generation fails.
-    lessons_json = form_data.get("lessons_data", "[]")
+    request_started = time.perf_counter()
+    with span("form_parse"):
+        form_data = await request.form()
+        # Keep the raw lessons JSON so we can return it to the template for client-side
+        # restoration of the form even if chart generation fails.
+        lessons_json = form_data.get("lessons_data", "[]")
 
-    try:
-        lessons_data = json.loads(lessons_json)
-    except Exception:
-        lessons_data = []
+        try:
+            lessons_data = json.loads(lessons_json)
+        except Exception:
+            lessons_data = []
 
     try:
         # Build validated Lesson objects from the parsed data
         lessons: List[Lesson] = []
-        for lesson_data in lessons_data:
-            schedules = []
-            for schedule_data in lesson_data.get("schedules", []):
-                schedules.append(LessonSchedule(
-                    day=schedule_data["day"],
-                    start_time=schedule_data["start_time"],
-                    end_time=schedule_data["end_time"]
+        with span("validation"):
+            for lesson_data in lessons_data:
+                schedules = []
+                for schedule_data in lesson_data.get("schedules", []):
+                    schedules.append(LessonSchedule(
+                        day=schedule_data["day"],
+                        start_time=schedule_data["start_time"],
+                        end_time=schedule_data["end_time"]
+                    ))
+
+                lessons.append(Lesson(
+                    name=lesson_data.get("name", ""),
+                    units=int(lesson_data.get("units", 0)),
+                    schedules=schedules
                 ))
 
-            lessons.append(Lesson(
-                name=lesson_data.get("name", ""),
-                units=int(lesson_data.get("units", 0)),
-                schedules=schedules
-            ))
-
-        # Generate the chart
-        chart_filename = create_schedule_chart(lessons)
-
+        # Overlapping lessons are sent back to the form instead of being drawn
+        with span("conflict_check"):
+            conflicts = check_schedule_overlaps(lessons)
+        if conflicts:
+            return templates.TemplateResponse("index.html", {
+                "request": request,
+                "error": "؛ ".join(str(c) for c in conflicts),
+                "lessons_data": lessons_data
+            })
+
+        # Generate the chart (or reuse an identical one rendered earlier)
+        with span("chart"):
+            preview_filename = await get_or_create_chart(lessons, client_id(request))
+        _record_first_request(time.perf_counter() - request_started)
+
+        with span("template"):
+            return templates.TemplateResponse("index.html", {
+                "request": request,
+                "chart_generated": True,
+                "chart_filename": preview_filename,
+                # Full resolution, encoded when the download link is first followed
+                "download_filename": _full_chart_filename(preview_filename),
+                # Pass the original lessons JSON back so the client can restore form inputs
+                "lessons_data": lessons_data
+            })
+
+    except Overloaded as e:
         return templates.TemplateResponse("index.html", {
             "request": request,
-            "chart_generated": True,
-            "chart_filename": chart_filename,
-            # Pass the original lessons JSON back so the client can restore form inputs
+            "error": "سرور در حال حاضر مشغول است؛ لطفاً چند لحظه بعد دوباره تلاش کنید.",
             "lessons_data": lessons_data
-        })
+        }, status_code=503, headers={"Retry-After": str(e.retry_after)})
 
     except Exception as e:
         # On error, include the lessons data so the form can be rehydrated for fixes
@@ -479,14 +1364,496 @@ async def generate_chart(request: Request):
         })
 
 
-@app.get("/chart/{filename}")
-async def get_chart(filename: str):
-    """Serve generated chart images"""
-    filepath = os.path.join("generated_charts", filename)
-    if os.path.exists(filepath):
-        return FileResponse(filepath)
+@app.post("/api/chart")
+async def api_chart(lessons: List[Lesson], request: Request, format: Literal["png", "svg", "pdf"] = "png"):
+    """Render a chart and return the image itself rather than an HTML page.
+
+    ``format`` selects PNG (default), SVG or PDF. A fresh render is streamed
+    from memory; it is written to the chart cache only after the response has
+    been sent. ``Content-Location`` gives the URL the same image can later be
+    fetched from.
+    """
+    return await _chart_response(lessons, request, format)
+
+
+@app.post("/api/layout")
+async def api_layout(lessons: List[Lesson], request: Request):
+    """The chart's layout as JSON (see layout.py), for clients that draw it themselves.
+
+    Cached and validated like the images; a layout is a few kilobytes.
+    """
+    return await _chart_response(lessons, request, "json")
+
+
+async def _render_chart_bytes(lessons: List[Lesson], key: str, fmt: str, client: str = "",
+                              fail_fast: bool = True):
+    """Render canonical ``lessons`` in ``fmt`` (no cache lookup).
+
+    Returns the data and the render's timings (queue wait, render time).
+    """
+    if fmt == "png":
+        result = await _render_once(("png", key), _render_png_job, lessons, client=client, fail_fast=fail_fast)
+        return result["png"], result["timings"]
+    # Vector charts and layouts take milliseconds; the process pool would only add overhead
+    async with admission.slot(client, VECTOR_RENDER_COST, fail_fast) as ticket:
+        started = time.perf_counter()
+        interval = _profile_interval()
+        run = functools.partial(traced, render_chart_document, lessons, fmt, profile=bool(interval), interval=interval)
+        data, trace = await asyncio.get_running_loop().run_in_executor(None, run)
+        timings = {"queue": ticket.wait, "render": time.perf_counter() - started}
+    _record_render(timings, trace)
+    return data, timings
+
+
+def _server_timing(timings: Dict[str, float]) -> str:
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items())
+
+
+async def _chart_response(lessons: List[Lesson], request: Request, fmt: str) -> Response:
+    with span("canonicalize"):
+        lessons = canonicalize_lessons(lessons)
+    # Rejected before any cache or render work; 409 with the conflicting pairs
+    with span("conflict_check"):
+        week = WeekSchedule(lessons)
+    if week.has_conflicts():
+        return _conflicts_response(week.conflicts())
+    key = schedule_cache_key(lessons)
+    filename = chart_cache.filename_for(key, fmt)
+    media_type = CHART_MEDIA_TYPES[fmt]
+    headers = _chart_headers(filename)
+    if _etag_matches(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    cached = await asyncio.get_running_loop().run_in_executor(None, chart_cache.get, key, fmt)
+    if cached:
+        headers["X-Cache"] = "hit"
+        return FileResponse(os.path.join(CHARTS_DIR, cached), media_type=media_type, headers=headers)
+
+    data, timings = await _render_chart_bytes(lessons, key, fmt, client_id(request))
+    headers["X-Cache"] = "miss"
+    headers["Server-Timing"] = _server_timing(timings)
+    return Response(data, media_type=media_type, headers=headers,
+                    background=BackgroundTask(chart_cache.store_bytes, key, data, fmt))
+
+
+job_store = load_job_store(
+    os.environ.get("HAFTESOOZ_JOB_STORE"),
+    max_jobs=int(os.environ.get("HAFTESOOZ_JOB_MAX", "10000")),
+    ttl=float(os.environ.get("HAFTESOOZ_JOB_TTL", "3600")),
+)
+job_queue = JobQueue(
+    job_store,
+    workers=int(os.environ.get("HAFTESOOZ_JOB_WORKERS", "0")) or render_pool.capacity,
+    max_queued=int(os.environ.get("HAFTESOOZ_JOB_QUEUE_SIZE", "1000")),
+)
+# Comment lines sent on an idle event stream, well inside proxy read timeouts
+JOB_EVENTS_KEEPALIVE = float(os.environ.get("HAFTESOOZ_JOB_EVENTS_KEEPALIVE", "15"))
+
+
+def _job_body(job: Job) -> Dict[str, Any]:
+    return {**job.to_dict(), "status_url": f"/jobs/{job.id}", "events_url": f"/jobs/{job.id}/events"}
+
+
+def _full_chart_filename(preview_filename: str) -> str:
+    return preview_filename.replace(f".{PREVIEW_EXT}.", ".")
+
+
+def _job_result(filename: str) -> Dict[str, Any]:
+    result = {"filename": filename, "url": f"/chart/{filename}"}
+    if f".{PREVIEW_EXT}." in filename:
+        result["download_url"] = f"/chart/{_full_chart_filename(filename)}"
+    return result
+
+
+@app.post("/jobs", status_code=202)
+async def create_job(lessons: List[Lesson], request: Request,
+                     format: Literal["png", "svg", "pdf", "preview"] = "png"):
+    """Queue a chart render and return its job right away.
+
+    Follow it with ``GET /jobs/{id}`` or the event stream at
+    ``/jobs/{id}/events``; a finished job's ``result`` has the chart URL.
+    ``format=preview`` renders only the on-screen preview; its result also
+    has the ``download_url`` of the full-resolution PNG.
+    Conflicting schedules are refused with 409 as on ``/api/chart``, and a
+    chart already in the cache comes back as a job that is already done.
+    """
+    lessons = canonicalize_lessons(lessons)
+    week = WeekSchedule(lessons)
+    if week.has_conflicts():
+        return _conflicts_response(week.conflicts())
+    key = schedule_cache_key(lessons)
+    client = client_id(request)
+
+    loop = asyncio.get_running_loop()
+    if format == "preview":
+        cached = await loop.run_in_executor(None, _cached_preview, key, lessons)
     else:
-        return {"error": "Chart not found"}
+        cached = await loop.run_in_executor(None, chart_cache.get, key, format)
+    if cached:
+        job = await job_queue.finished(_job_result(cached))
+    else:
+        async def run(job_id: str) -> Dict[str, Any]:
+            await job_store.update(job_id, stage="rendering")
+            if format == "preview":
+                filename, timings = await _render_previews(lessons, key, client, fail_fast=False)
+                return {**_job_result(filename), "timings": timings}
+            # The job queue bounds itself, so jobs wait for a slot rather than fail
+            data, timings = await _render_chart_bytes(lessons, key, format, client, fail_fast=False)
+            await job_store.update(job_id, stage="saving")
+            filename = await loop.run_in_executor(None, chart_cache.store_bytes, key, data, format)
+            return {**_job_result(filename), "timings": timings}
+
+        try:
+            job = await job_queue.submit(run)
+        except QueueFull:
+            return JSONResponse({"error": "Too many charts queued, try again shortly"},
+                                status_code=503, headers={"Retry-After": "5"})
+    return JSONResponse(_job_body(job), status_code=202, headers={"Location": f"/jobs/{job.id}"})
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await job_store.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "Job not found"}, status_code=404)
+    return _job_body(job)
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """Server-sent events for a job: a ``progress`` event per change, then
+    ``done`` or ``failed`` with the final state, after which the stream ends."""
+    if await job_store.get(job_id) is None:
+        return JSONResponse({"error": "Job not found"}, status_code=404)
+
+    async def events():
+        seen = None
+        while True:
+            job = await job_store.get(job_id)
+            if job is None:
+                yield 'event: failed\ndata: {"error": {"error": "Job expired"}}\n\n'
+                return
+            if job.version != seen:
+                seen = job.version
+                name = job.status if job.finished else "progress"
+                yield f"id: {job.version}\nevent: {name}\ndata: {json.dumps(_job_body(job), ensure_ascii=False)}\n\n"
+                if job.finished:
+                    return
+            else:
+                yield ": keep-alive\n\n"
+            await job_store.wait(job_id, seen, JOB_EVENTS_KEEPALIVE)
+
+    # X-Accel-Buffering: nginx would otherwise hold events back in its buffers
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+BATCH_MAX_ITEMS = int(os.environ.get("HAFTESOOZ_BATCH_MAX_ITEMS", "1000"))
+BATCH_CONCURRENCY = int(os.environ.get("HAFTESOOZ_BATCH_CONCURRENCY", "0")) or None
+
+
+def _parse_batch_item(index: int, item: Any):
+    """(id, canonical lessons, error) for one batch entry; exactly one of
+    lessons and error is set."""
+    item_id = str(item.get("id", index)) if isinstance(item, dict) else str(index)
+    if not isinstance(item, dict) or not isinstance(item.get("lessons"), list):
+        return item_id, None, {"error": "Expected an object with a list of lessons"}
+    try:
+        lessons = canonicalize_lessons([Lesson(**lesson) for lesson in item["lessons"]])
+    except (ValidationError, TypeError) as exc:
+        detail = exc.errors() if isinstance(exc, ValidationError) else str(exc)
+        return item_id, None, {"error": "Invalid lessons", "detail": json.loads(json.dumps(detail, default=str))}
+    conflicts = check_schedule_overlaps(lessons)
+    if conflicts:
+        return item_id, None, {"error": "Schedule has overlapping lessons",
+                               "conflicts": [c.to_dict() for c in conflicts]}
+    return item_id, lessons, None
+
+
+async def _batch_charts(groups: "OrderedDict[str, List[Lesson]]", fmt: str, with_data: bool, client: str):
+    """Yield (key, filename, data, cache status, error) per distinct schedule as
+    each finishes. Renders run concurrently, bounded so finished charts do not
+    pile up in memory faster than they are sent."""
+    limit = BATCH_CONCURRENCY or render_pool.capacity * 2
+    semaphore = asyncio.Semaphore(limit)
+    loop = asyncio.get_running_loop()
+
+    async def produce(key: str, lessons: List[Lesson]):
+        async with semaphore:
+            try:
+                filename = await loop.run_in_executor(None, chart_cache.get, key, fmt)
+                if filename:
+                    data = None
+                    if with_data:
+                        data = await loop.run_in_executor(None, _read_chart, filename)
+                    return key, filename, data, "hit", None
+                data, _ = await _render_chart_bytes(lessons, key, fmt, client, fail_fast=False)
+                filename = await loop.run_in_executor(None, chart_cache.store_bytes, key, data, fmt)
+                return key, filename, data, "miss", None
+            except Exception as exc:
+                return key, None, None, None, f"{type(exc).__name__}: {exc}"
+
+    tasks = [asyncio.ensure_future(produce(key, lessons)) for key, lessons in groups.items()]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def _read_chart(filename: str) -> bytes:
+    with open(os.path.join(CHARTS_DIR, filename), "rb") as f:
+        return f.read()
+
+
+@app.post("/api/batch")
+async def api_batch(items: List[Any], request: Request, format: Literal["png", "svg", "pdf"] = "png",
+                    output: Literal["zip", "ndjson"] = "zip"):
+    """Render many timetables in one request.
+
+    Each item is ``{"id": ..., "lessons": [...]}``. Identical schedules are
+    rendered once, renders run in parallel, and results are streamed as they
+    finish: as a ZIP of ``<id>.<format>`` files ending with ``manifest.json``,
+    or (``output=ndjson``) one line per item with the chart URL. An invalid or
+    conflicting item gets an error entry of its own; the rest of the batch
+    carries on.
+    """
+    if len(items) > BATCH_MAX_ITEMS:
+        return JSONResponse({"error": f"At most {BATCH_MAX_ITEMS} items per batch"}, status_code=413)
+
+    results: List[Dict[str, Any]] = []
+    groups: "OrderedDict[str, List[Lesson]]" = OrderedDict()
+    ids_by_key: Dict[str, List[str]] = {}
+    for index, item in enumerate(items):
+        item_id, lessons, error = _parse_batch_item(index, item)
+        if error:
+            results.append({"id": item_id, "status": "error", **error})
+            continue
+        key = schedule_cache_key(lessons)
+        groups.setdefault(key, lessons)
+        ids_by_key.setdefault(key, []).append(item_id)
+    summary = {"items": len(items), "charts": len(groups)}
+
+    def item_results(key, filename, cache, error):
+        for n, item_id in enumerate(ids_by_key[key]):
+            if error:
+                yield {"id": item_id, "status": "error", "error": error}
+            else:
+                yield {"id": item_id, "status": "ok", "url": f"/chart/{filename}",
+                       "cache": cache if n == 0 else "duplicate"}
+
+    if output == "ndjson":
+        async def lines():
+            for result in results:
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+            async for key, filename, _, cache, error in _batch_charts(groups, format, False, client_id(request)):
+                for result in item_results(key, filename, cache, error):
+                    results.append(result)
+                    yield json.dumps(result, ensure_ascii=False) + "\n"
+            errors = sum(1 for r in results if r["status"] == "error")
+            yield json.dumps({"done": True, **summary, "errors": errors}) + "\n"
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    async def archive():
+        archive = ZipStream()
+        async for key, filename, data, cache, error in _batch_charts(groups, format, True, client_id(request)):
+            for result in item_results(key, filename, cache, error):
+                if not error:
+                    result["file"] = archive.entry_name(result["id"], format)
+                    # PNG and PDF are compressed already
+                    yield archive.add(result["file"], data, compress=format == "svg")
+                results.append(result)
+        errors = sum(1 for r in results if r["status"] == "error")
+        manifest = {**summary, "errors": errors, "results": results}
+        yield archive.add("manifest.json", json.dumps(manifest, ensure_ascii=False, indent=2).encode("utf-8"))
+        yield archive.close()
+
+    return StreamingResponse(archive(), media_type="application/zip",
+                             headers={"Content-Disposition": 'attachment; filename="charts.zip"'})
+
+
+SOLVE_TIME_BUDGET = float(os.environ.get("HAFTESOOZ_SOLVE_TIME_BUDGET", "2"))
+SOLVE_MAX_RESULTS = int(os.environ.get("HAFTESOOZ_SOLVE_MAX_RESULTS", "200"))
+
+
+def _canonicalize_course(course: CourseSections) -> CourseSections:
+    sections = []
+    for section in course.sections:
+        lesson, = canonicalize_lessons([Lesson(name=course.name, units=course.units, schedules=section.schedules)])
+        sections.append(Section(label=_normalize_text(section.label), schedules=lesson.schedules))
+    return CourseSections(name=_normalize_text(course.name), units=course.units, sections=sections)
+
+
+def _solve_lines(solver: TimetableSolver, limit: int, rank: str, time_budget: float):
+    """NDJSON lines: one per timetable as it is produced, then a summary."""
+    for number, timetable in enumerate(solver.solve(limit, rank, time_budget), 1):
+        line = {
+            "rank": number,
+            "sections": [course.sections[s].label or str(s + 1)
+                         for course, s in zip(solver.courses, timetable.sections)],
+            "days": timetable.days,
+            "idle_minutes": timetable.idle_minutes,
+            "lessons": [{"name": lesson.name, "units": lesson.units,
+                         "schedules": [{"day": sc.day, "start_time": sc.start_time, "end_time": sc.end_time}
+                                       for sc in lesson.schedules]}
+                        for lesson in solver.lessons(timetable)],
+        }
+        yield json.dumps(line, ensure_ascii=False) + "\n"
+    yield json.dumps({"done": True, **solver.stats}) + "\n"
+
+
+@app.post("/api/solve")
+async def api_solve(courses: List[CourseSections], limit: int = 20,
+                    rank: Literal["first", "compact"] = "first", time_budget: Optional[float] = None):
+    """Find conflict-free timetables given alternative sections per course.
+
+    Streams newline-delimited JSON: each timetable (the section picked per
+    course, its days on campus and idle minutes, and the ``lessons`` to post
+    to ``/api/chart``) as soon as it is found, or ranked by compactness with
+    ``rank=compact``; the last line reports whether the search finished
+    within ``time_budget`` seconds. Nothing is rendered here; only the
+    timetable the student picks is.
+    """
+    limit = max(1, min(limit, SOLVE_MAX_RESULTS))
+    budget = SOLVE_TIME_BUDGET if time_budget is None else max(0.0, min(time_budget, SOLVE_TIME_BUDGET))
+    solver = TimetableSolver([_canonicalize_course(course) for course in courses])
+    # A sync iterator: Starlette runs the search in its thread pool between lines
+    return StreamingResponse(_solve_lines(solver, limit, rank, budget), media_type="application/x-ndjson")
+
+
+def _accepted_images(request: Request) -> List[str]:
+    """Image subtypes the client lists explicitly in Accept (with q > 0)."""
+    accepted = []
+    for part in request.headers.get("accept", "").split(","):
+        media_type, *params = [p.strip() for p in part.split(";")]
+        if any(p.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000") for p in params):
+            continue
+        if media_type.startswith("image/"):
+            accepted.append(media_type[len("image/"):])
+    return accepted
+
+
+def _negotiate_preview(filename: str, request: Request) -> str:
+    """The best stored variant of a PNG preview the client accepts."""
+    accepted = _accepted_images(request)
+    stem = filename[:-len("png")]
+    for fmt in ("avif", "webp"):
+        if fmt in accepted and os.path.exists(os.path.join(CHARTS_DIR, stem + fmt)):
+            return stem + fmt
+    return filename
+
+
+async def _render_full_chart(filename: str, request: Request) -> Optional[str]:
+    """Encode a full-resolution PNG that so far only has a preview, from its
+    stored lessons; None if they are gone."""
+    lessons_path = os.path.join(CHARTS_DIR, filename[:-len("png")] + LESSONS_EXT)
+    try:
+        with open(lessons_path, "rb") as f:
+            lessons = [Lesson(**lesson) for lesson in json.loads(f.read())]
+    except (OSError, ValueError, ValidationError):
+        return None
+    key = schedule_cache_key(lessons)
+    if chart_cache.filename_for(key) != filename:
+        return None
+    await _render_once(("png-file", key), _render_png_file_job, lessons, chart_cache.path_for(key),
+                       client=client_id(request))
+    return await asyncio.get_running_loop().run_in_executor(None, chart_cache.put, key, "png")
+
+
+@app.get("/chart/{filename}")
+async def get_chart(filename: str, request: Request):
+    """Serve generated chart images.
+
+    A PNG preview is answered with its WebP or AVIF variant when the client
+    accepts one. A full-resolution PNG is encoded on its first request.
+    """
+    match = _CHART_FILENAME_RE.fullmatch(filename)
+    if not match:
+        return JSONResponse({"error": "Chart not found"}, status_code=404)
+    served = filename
+    if match.group(2) == f"{PREVIEW_EXT}.png":
+        served = _negotiate_preview(filename, request)
+    elif match.group(2) == "png" and not os.path.exists(os.path.join(CHARTS_DIR, filename)):
+        served = await _render_full_chart(filename, request)
+    if served is None or not os.path.exists(os.path.join(CHARTS_DIR, served)):
+        return JSONResponse({"error": "Chart not found"}, status_code=404)
+
+    headers = _chart_headers(served)
+    if match.group(2) == f"{PREVIEW_EXT}.png":
+        headers["Vary"] = "Accept"
+    if _etag_matches(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    media_type = CHART_MEDIA_TYPES[served.rsplit(".", 1)[1]]
+    return FileResponse(os.path.join(CHARTS_DIR, served), media_type=media_type, headers=headers)
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus text exposition of request, stage and render metrics."""
+    # The cache and job gauges read SQLite, which can block
+    text = await asyncio.get_running_loop().run_in_executor(None, metrics.render)
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
+
+
+ADMIN_TOKEN = os.environ.get("HAFTESOOZ_ADMIN_TOKEN", "")
+
+
+def _is_admin(request: Request) -> bool:
+    """With HAFTESOOZ_ADMIN_TOKEN set the X-Admin-Token header must match it;
+    without one, only requests from this machine are allowed."""
+    if ADMIN_TOKEN:
+        return request.headers.get("x-admin-token") == ADMIN_TOKEN
+    return bool(request.client) and request.client.host in ("127.0.0.1", "::1")
+
+
+@app.get("/debug/profile")
+async def get_profile(request: Request):
+    """Folded stacks ("frame;frame;frame count") sampled from profiled renders."""
+    if not _is_admin(request):
+        return JSONResponse({"error": "Forbidden"}, status_code=403)
+    return PlainTextResponse(profiler.folded())
+
+
+@app.post("/debug/profile")
+async def configure_profile(request: Request, rate: Optional[float] = None,
+                            interval: Optional[float] = None, reset: bool = False):
+    """Change the fraction of requests profiled (0 turns profiling off) or the
+    sampling interval in seconds at runtime; ``reset`` drops collected samples."""
+    if not _is_admin(request):
+        return JSONResponse({"error": "Forbidden"}, status_code=403)
+    profiler.configure(rate, interval)
+    if reset:
+        profiler.reset()
+    return profiler.stats()
+
+
+@app.get("/health", response_class=PlainTextResponse)
+async def health():
+    """Liveness check for process supervisors (behind nginx, nginx answers it itself)."""
+    return "healthy\n"
+
+
+@app.get("/stats")
+async def get_stats():
+    """Cache, render pool and startup figures for monitoring and pool sizing."""
+    # The cache and job figures read SQLite, which can block
+    return await asyncio.get_running_loop().run_in_executor(None, _stats)
+
+
+def _stats() -> Dict[str, Any]:
+    return {
+        "cache": chart_cache.stats(),
+        "render_pool": render_pool.stats(),
+        "shaping": _aggregate_shaping_stats(),
+        "layout": {**_LAYOUT_STATS, "entries": len(_LAYOUT_CACHE)},
+        "tiles": {**_TILE_STATS, "entries": len(_TILE_CACHE)},
+        "jobs": job_queue.stats(),
+        "admission": admission.stats(),
+        "profiler": profiler.stats(),
+        "startup": {k: round(v, 4) for k, v in STARTUP_TIMINGS.items()},
+    }
 
 
 if __name__ == "__main__":
@@ -0,0 +1,77 @@
+"""Request models and the fixed vocabulary of a weekly chart.
+
+Kept apart from main.py so that renderers can use them without importing the
+web app.
+"""
+
+from typing import List
+
+from pydantic import BaseModel
+
+# Persian day names
+PERSIAN_DAYS = {
+    "شنبه": 0,
+    "یکشنبه": 1,
+    "دوشنبه": 2,
+    "سه‌شنبه": 3,
+    "چهارشنبه": 4,
+    "پنج‌شنبه": 5,
+    "جمعه": 6
+}
+
+DAY_NAMES = ["شنبه", "یکشنبه", "دوشنبه", "سه‌شنبه", "چهارشنبه", "پنج‌شنبه", "جمعه"]
+
+# One chart column per hour from 06:00 to 22:00
+CHART_HOURS = list(range(6, 23))
+
+# Colors for different lessons
+LESSON_COLORS = ["#FF6B6B", "#4ECDC4", "#45B7D1", "#96CEB4", "#FECA57", "#FF9FF3", "#54A0FF", "#FD79A8"]
+
+CHART_TITLE = "برنامه هفتگی دروس"
+UNITS_SUFFIX = "واحد"
+
+
+class LessonSchedule(BaseModel):
+    day: str
+    start_time: str
+    end_time: str
+
+
+class Lesson(BaseModel):
+    name: str
+    units: int
+    schedules: List[LessonSchedule]
+
+
+class Section(BaseModel):
+    """One alternative set of meetings for a course; ``label`` is for display
+    (e.g. the section number)."""
+    label: str = ""
+    schedules: List[LessonSchedule]
+
+
+class CourseSections(BaseModel):
+    """A course offered in several sections, exactly one of which is taken."""
+    name: str
+    units: int
+    sections: List[Section]
+
+
+def units_line(units: int) -> str:
+    return f"({units} {UNITS_SUFFIX})"
+
+
+def label_candidates(lesson: Lesson) -> List[str]:
+    """Possible (unshaped) labels for a lesson block, fewest lines first.
+
+    Multi-word names may also be broken onto two lines; the most balanced
+    breaks are listed first so they win ties at equal font size.
+    """
+    units = units_line(lesson.units)
+    candidates = [f"{lesson.name}\n{units}"]
+    words = lesson.name.split()
+    splits = sorted(range(1, len(words)),
+                    key=lambda i: abs(len(" ".join(words[:i])) - len(" ".join(words[i:]))))
+    for i in splits:
+        candidates.append(f"{' '.join(words[:i])}\n{' '.join(words[i:])}\n{units}")
+    return candidates
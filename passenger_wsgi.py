@@ -1,60 +1,60 @@
-import sys, os, subprocess, time, requests
-from wsgiref.util import setup_testing_defaults
+"""Passenger entry point: serve the app with Daphne and forward requests to it.
+
+Passenger only speaks WSGI, so the ASGI app runs under Daphne on a local
+port and this module proxies to it (see wsgi_proxy.py): pooled keep-alive
+connections, streamed bodies, the backend's own status and headers, and a
+supervisor that restarts Daphne when it dies or stops answering.
+
+Settings (environment variables):
+    HAFTESOOZ_DAPHNE            path of the daphne executable
+    HAFTESOOZ_DAPHNE_PORT       port Daphne listens on (8001)
+    HAFTESOOZ_BACKEND_URL       proxy to an already running server instead,
+                                e.g. http://127.0.0.1:8001; it is not supervised
+                                (start it with HAFTESOOZ_TRUST_PROXY=1)
+    HAFTESOOZ_PROXY_POOL_SIZE   keep-alive connections per Passenger process (16)
+    HAFTESOOZ_PROXY_TIMEOUT     seconds to wait for the backend (60)
+    HAFTESOOZ_HEALTH_INTERVAL   seconds between health checks (5)
+"""
+
+import os
+import sys
+from urllib.parse import urlsplit
 
 # Add project directory to sys.path
 sys.path.insert(0, os.path.dirname(__file__))
 
+from wsgi_proxy import BackendSupervisor, ProxyApp
+
+project_dir = os.path.dirname(os.path.abspath(__file__))
+
 # Path to daphne binary inside your virtualenv
-daphne_cmd = "/home/kecxpozx/virtualenv/haftesooz/3.9/bin/daphne"
-daphne_port = 8001
+daphne_cmd = os.environ.get("HAFTESOOZ_DAPHNE", "/home/kecxpozx/virtualenv/haftesooz/3.9/bin/daphne")
+daphne_port = int(os.environ.get("HAFTESOOZ_DAPHNE_PORT", "8001"))
 pidfile = "/tmp/daphne_haftesooz.pid"
 
-
-def start_daphne():
-    """Start Daphne ASGI server if it's not already running."""
-    if not os.path.exists(pidfile):
-        with open(pidfile, "w") as f:
-            proc = subprocess.Popen(
-                [daphne_cmd, "-b", "127.0.0.1", "-p", str(daphne_port), "main:app"],
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL
-            )
-            f.write(str(proc.pid))
-        time.sleep(2)
-
-
-# Start Daphne once when Passenger loads this file
-start_daphne()
-
-
-def application(environ, start_response):
-    """WSGI entrypoint called by Passenger."""
-    setup_testing_defaults(environ)
-
-    method = environ['REQUEST_METHOD']
-    path = environ.get('PATH_INFO', '/')
-    query = environ.get('QUERY_STRING', '')
-    url = f"http://127.0.0.1:{daphne_port}{path}"
-    if query:
-        url += "?" + query
-
-    # Read request body if exists
-    length = int(environ.get('CONTENT_LENGTH') or 0)
-    body = environ['wsgi.input'].read(length) if length > 0 else b''
-
-    # Build headers
-    headers = {
-        k[5:].replace('_', '-'): v
-        for k, v in environ.items() if k.startswith('HTTP_')
-    }
-
-    try:
-        # Send request to local Daphne server
-        resp = requests.request(method, url, headers=headers, data=body)
-        start_response(f"{resp.status_code} OK", list(resp.headers.items()))
-        return [resp.content]
-
-    except Exception as e:
-        err = f"Internal error: {str(e)}".encode()
-        start_response("500 Internal Server Error", [("Content-Type", "text/plain")])
-        return [err]
+backend_url = os.environ.get("HAFTESOOZ_BACKEND_URL")
+if backend_url:
+    parts = urlsplit(backend_url)
+    backend_host, backend_port = parts.hostname, parts.port or 80
+    supervisor = None
+else:
+    backend_host, backend_port = "127.0.0.1", daphne_port
+    # Daphne only listens locally, so every request comes through the proxy,
+    # which sets X-Real-IP; the app queues renders under that address
+    os.environ.setdefault("HAFTESOOZ_TRUST_PROXY", "1")
+    supervisor = BackendSupervisor(
+        [daphne_cmd, "-b", backend_host, "-p", str(daphne_port), "main:app"],
+        backend_host, daphne_port, pidfile,
+        interval=float(os.environ.get("HAFTESOOZ_HEALTH_INTERVAL", "5")),
+        cwd=project_dir,
+        log_path=os.path.join(project_dir, "daphne.log"),
+    )
+    # Starts Daphne in the background if it is not up yet, then keeps watching it
+    supervisor.start()
+
+application = ProxyApp(
+    backend_host, backend_port,
+    pool_size=int(os.environ.get("HAFTESOOZ_PROXY_POOL_SIZE", "16")),
+    timeout=float(os.environ.get("HAFTESOOZ_PROXY_TIMEOUT", "60")),
+    supervisor=supervisor,
+)
@@ -0,0 +1,303 @@
+"""PNG encoding for rendered charts: palette quantization and zlib tuning.
+
+A chart is a handful of flat fills (white, the lesson colors, black, the grid
+grey) plus the antialiased edges between them: a few thousand distinct colors,
+with ~99% of the pixels in a dozen of them. Stored as an 8-bit palette PNG it
+is about half the size of a truecolor one, and faster to deflate.
+
+The palette is the image's most frequent colors, kept exact, topped up with
+an octree palette of a subsample for the edges. Each distinct
+color of the image is then matched to its nearest palette entry once, and the
+pixels are mapped through that lookup table. Flat fills therefore keep their
+exact color; only antialiased pixels move, by a few levels at most. An image
+with no more distinct colors than the palette holds is encoded losslessly.
+
+Memory stays flat: pixels are processed in stripes of rows, and the color
+tables (48 MB, indexed by 24-bit color) are allocated once per thread and
+reused, so a quantize allocates little beyond its 8-bit output. The encoded
+PNG can be written straight into a file, file descriptor or socket.
+
+How much work goes into each output is set by a ``PngProfile``: the preview
+is small and re-encoded often, the print PNG is large and downloaded rarely.
+"""
+
+from __future__ import annotations
+
+import io
+import os
+import threading
+import zlib
+from contextlib import contextmanager
+from dataclasses import dataclass, fields
+from typing import Dict, Iterator, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from instrumentation import count, span
+
+try:
+    # Lossless recompression pass (pyoxipng), used by profiles with optimize on
+    import oxipng
+except ImportError:
+    oxipng = None
+
+STRATEGIES: Dict[str, int] = {
+    "default": zlib.Z_DEFAULT_STRATEGY,
+    "filtered": zlib.Z_FILTERED,
+    "huffman": zlib.Z_HUFFMAN_ONLY,
+    "rle": zlib.Z_RLE,
+    "fixed": zlib.Z_FIXED,
+}
+
+# Most frequent colors taken verbatim before the octree fills the rest
+EXACT_COLORS = 32
+# The octree part of the palette is built from a subsample about this wide
+SAMPLE_WIDTH = 1200
+# Rows packed and mapped at a time
+STRIPE_ROWS = 256
+
+
+@dataclass(frozen=True)
+class PngProfile:
+    """How one kind of output is encoded.
+
+    ``colors`` is the palette size; 0 writes truecolor RGB. ``level`` and
+    ``strategy`` go to zlib. With ``optimize`` the image is also deflated at
+    level 9 with each of ``passes`` (and run through oxipng when installed),
+    and the smallest result is kept.
+    """
+    name: str
+    colors: int = 256
+    level: int = 6
+    strategy: str = "default"
+    optimize: bool = False
+    passes: Tuple[str, ...] = ("default", "filtered")
+
+    def __post_init__(self):
+        if not 0 <= self.colors <= 256:
+            raise ValueError(f"colors must be between 0 and 256, not {self.colors}")
+        if not 0 <= self.level <= 9:
+            raise ValueError(f"level must be between 0 and 9, not {self.level}")
+        for strategy in (self.strategy, *self.passes):
+            if strategy not in STRATEGIES:
+                raise ValueError(f"unknown zlib strategy {strategy!r}; expected one of {', '.join(STRATEGIES)}")
+
+    @classmethod
+    def parse(cls, name: str, spec: str) -> "PngProfile":
+        """A profile from ``key=value`` pairs, e.g. ``"colors=0,level=9,passes=default+rle"``."""
+        known = {f.name for f in fields(cls)} - {"name"}
+        values = {}
+        for item in filter(None, (part.strip() for part in spec.split(","))):
+            key, sep, value = item.partition("=")
+            key = key.strip()
+            if not sep or key not in known:
+                raise ValueError(f"bad PNG profile setting {item!r}; expected key=value with key one of "
+                                 f"{', '.join(sorted(known))}")
+            value = value.strip()
+            if key in ("colors", "level"):
+                values[key] = int(value)
+            elif key == "optimize":
+                values[key] = value.lower() in ("1", "true", "yes", "on")
+            elif key == "passes":
+                values[key] = tuple(filter(None, value.split("+")))
+            else:
+                values[key] = value
+        return cls(name, **values)
+
+
+def _pack(pixels: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """RGB(A) pixels as one uint32 0xBBGGRR per pixel (alpha is ignored)."""
+    if pixels.shape[2] == 4 and pixels.flags.c_contiguous and np.little_endian:
+        # Reinterpreting RGBA bytes is much cheaper than shifting three channels
+        return np.bitwise_and(pixels.view(np.uint32)[..., 0], np.uint32(0xFFFFFF), out=out)
+    rgb = pixels[..., :3].astype(np.uint32)
+    packed = rgb[..., 0] | (rgb[..., 1] << 8) | (rgb[..., 2] << 16)
+    if out is None:
+        return packed
+    out[...] = packed
+    return out
+
+
+class _Tables(threading.local):
+    """Per-thread scratch space for ``quantize``, allocated on first use."""
+
+    def __init__(self):
+        self.present = np.zeros(1 << 24, dtype=bool)
+        self.rank = np.zeros(1 << 24, dtype=np.uint16)
+        self.stripe = np.empty(0, dtype=np.uint32)
+
+    def stripes(self, pixels: np.ndarray) -> Iterator[Tuple[slice, np.ndarray]]:
+        """(rows, packed colors) per stripe; the packed array is reused between stripes."""
+        height, width = pixels.shape[:2]
+        if self.stripe.size < STRIPE_ROWS * width:
+            self.stripe = np.empty(STRIPE_ROWS * width, dtype=np.uint32)
+        for top in range(0, height, STRIPE_ROWS):
+            rows = slice(top, min(top + STRIPE_ROWS, height))
+            out = self.stripe[:(rows.stop - top) * width].reshape(rows.stop - top, width)
+            yield rows, _pack(pixels[rows], out)
+
+
+_TABLES = _Tables()
+
+
+def _unpack(packed: np.ndarray) -> np.ndarray:
+    return np.stack([packed & 0xFF, (packed >> 8) & 0xFF, (packed >> 16) & 0xFF], axis=-1).astype(np.uint8)
+
+
+def _palette(pixels: np.ndarray, distinct: np.ndarray, counts: np.ndarray, colors: int) -> np.ndarray:
+    """``colors`` RGB palette entries: the most frequent colors, then an octree palette of a subsample."""
+    exact = distinct[np.argsort(-counts, kind="stable")[:min(EXACT_COLORS, colors)]]
+    rest = colors - len(exact)
+    palette = [_unpack(exact)]
+    if rest:
+        step = max(1, pixels.shape[1] // SAMPLE_WIDTH)
+        sample = np.ascontiguousarray(pixels[::step, ::step, :3])
+        octree = Image.fromarray(sample, "RGB").quantize(rest, method=Image.Quantize.FASTOCTREE,
+                                                          dither=Image.Dither.NONE)
+        palette.append(np.array(octree.getpalette(), dtype=np.uint8).reshape(-1, 3)[:rest])
+    return np.concatenate(palette)
+
+
+def _nearest(colors: np.ndarray, palette: np.ndarray, chunk: int = 4096) -> np.ndarray:
+    """Index of the nearest ``palette`` entry (squared RGB distance) for each of ``colors``."""
+    palette = palette.astype(np.int32)
+    out = np.empty(len(colors), dtype=np.uint8)
+    for start in range(0, len(colors), chunk):
+        block = colors[start:start + chunk].astype(np.int32)
+        out[start:start + chunk] = ((block[:, None, :] - palette[None, :, :]) ** 2).sum(axis=2).argmin(axis=1)
+    return out
+
+
+def quantize(pixels: np.ndarray, colors: int = 256) -> Image.Image:
+    """A palette ("P") image of an RGB(A) array, with flat colors kept exact."""
+    tables = _TABLES
+    present = tables.present
+    present.fill(False)
+    for _, packed in tables.stripes(pixels):
+        present[packed] = True
+    distinct = np.flatnonzero(present).astype(np.uint32)
+    # Position of each pixel's color in ``distinct``; entries of other colors
+    # are left over from earlier images and never read
+    rank = tables.rank if len(distinct) <= 1 << 16 else np.zeros(1 << 24, dtype=np.uint32)
+    rank[distinct] = np.arange(len(distinct))
+    if len(distinct) <= colors:
+        palette = _unpack(distinct)
+        mapping = np.arange(len(distinct), dtype=np.uint8)
+    else:
+        # Exact counts, so thin lines a subsample would skip still get their color
+        counts = np.zeros(len(distinct), dtype=np.int64)
+        for _, packed in tables.stripes(pixels):
+            counts += np.bincount(rank[packed].ravel(), minlength=len(distinct))
+        palette = _palette(pixels, distinct, counts, colors)
+        mapping = _nearest(_unpack(distinct), palette)
+    indices = np.empty(pixels.shape[:2], dtype=np.uint8)
+    for rows, packed in tables.stripes(pixels):
+        np.take(mapping, rank[packed], out=indices[rows])
+    image = Image.fromarray(indices, "P")
+    image.putpalette(palette.tobytes())
+    return image
+
+
+def _deflate(image: Image.Image, level: int, strategy: str, dpi: Optional[float], out=None) -> bytes:
+    """The PNG bytes, or with ``out`` the PNG written into it and b"" returned."""
+    buf = io.BytesIO() if out is None else out
+    options = {"dpi": (dpi, dpi)} if dpi else {}
+    image.save(buf, format="PNG", compress_level=level, compress_type=STRATEGIES[strategy], **options)
+    return buf.getvalue() if out is None else b""
+
+
+class _Counted:
+    """File-like wrapper counting the bytes written through it."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.written = 0
+
+    def write(self, data) -> int:
+        self.raw.write(data)
+        self.written += len(data)
+        return len(data)
+
+    def flush(self):
+        self.raw.flush()
+
+
+@contextmanager
+def _writer(out):
+    """A binary file object writing to a file descriptor, socket or file."""
+    if isinstance(out, int):
+        f = os.fdopen(out, "wb", buffering=0, closefd=False)
+    elif hasattr(out, "sendall"):
+        f = out.makefile("wb", buffering=0)
+    else:
+        f = None
+    try:
+        yield _Counted(out if f is None else f)
+    finally:
+        if f is not None:
+            f.close()
+
+
+def prepare_image(pixels: np.ndarray, profile: PngProfile) -> Image.Image:
+    """The image ``profile`` writes for an RGB(A) array: quantized, or RGB for truecolor.
+
+    Alpha is dropped: charts are drawn on opaque white.
+    """
+    with span(f"png_{profile.name}_quantize"):
+        if profile.colors:
+            return quantize(pixels, profile.colors)
+        return Image.fromarray(pixels, "RGBA" if pixels.shape[2] == 4 else "RGB").convert("RGB")
+
+
+def write_png(image: Image.Image, profile: PngProfile, dpi: Optional[float] = None, out=None):
+    """Deflate an image from ``prepare_image`` with the zlib settings of ``profile``.
+
+    Returns the PNG bytes. With ``out`` (a binary file, a file descriptor or
+    a socket) the PNG is written into it as it is compressed and the number
+    of bytes written is returned instead; profiles with ``optimize`` still
+    compare their candidates in memory first.
+
+    Time goes to the ``png_<profile>_deflate`` and ``_optimize`` stages; the
+    encoded and uncompressed (24-bit) sizes are counted as
+    ``png_<profile>_bytes`` and ``png_<profile>_raw_bytes``, and what the
+    optimization passes saved as ``png_<profile>_optimize_saved_bytes``.
+    """
+    stage = f"png_{profile.name}"
+    if out is not None and not profile.optimize:
+        with _writer(out) as f, span(f"{stage}_deflate"):
+            _deflate(image, profile.level, profile.strategy, dpi, f)
+        _count_sizes(stage, image, f.written)
+        return f.written
+    with span(f"{stage}_deflate"):
+        data = _deflate(image, profile.level, profile.strategy, dpi)
+    if profile.optimize:
+        first = len(data)
+        with span(f"{stage}_optimize"):
+            for strategy in profile.passes:
+                if profile.level == 9 and strategy == profile.strategy:
+                    continue
+                candidate = _deflate(image, 9, strategy, dpi)
+                if len(candidate) < len(data):
+                    data = candidate
+            if oxipng is not None:
+                candidate = oxipng.optimize_from_memory(data)
+                if len(candidate) < len(data):
+                    data = candidate
+        count(f"{stage}_optimize_saved_bytes", first - len(data))
+    _count_sizes(stage, image, len(data))
+    if out is None:
+        return data
+    with _writer(out) as f:
+        f.write(data)
+    return len(data)
+
+
+def _count_sizes(stage: str, image: Image.Image, size: int):
+    count(f"{stage}_bytes", size)
+    count(f"{stage}_raw_bytes", image.width * image.height * 3)
+
+
+def encode_png(pixels: np.ndarray, profile: PngProfile, dpi: Optional[float] = None, out=None):
+    """Encode an RGB(A) array as PNG according to ``profile`` (see ``write_png`` for ``out``)."""
+    return write_png(prepare_image(pixels, profile), profile, dpi, out)
@@ -0,0 +1,217 @@
+"""Process pool that keeps CPU-heavy chart rendering off the event loop.
+
+Renders run in a fixed set of pre-warmed worker processes. The event loop only
+awaits the result, so a slow 300-DPI render no longer blocks ``GET /`` or static
+files on the same uvicorn worker. Each render has a timeout; a render that times
+out or takes its worker process down causes the pool to be rebuilt instead of
+taking the server with it.
+
+With ``workers=0`` renders run on ``threads`` threads of this process instead,
+which is handy for tests and for hosts that do not allow spawning processes.
+The chart renderer is thread-safe; threads share the process's caches and
+overlap wherever drawing and encoding release the GIL.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+
+
+class RenderError(Exception):
+    """Base class for failures of the render pool itself (not of the payload)."""
+
+
+class RenderTimeout(RenderError):
+    pass
+
+
+class RenderCrashed(RenderError):
+    pass
+
+
+def _timed_call(fn: Callable, *args):
+    """Run ``fn`` inside the worker and report how long it actually ran."""
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+def _noop():
+    return None
+
+
+class RenderPool:
+    def __init__(self, workers: int, timeout: float = 30.0,
+                 initializer: Optional[Callable] = None,
+                 start_method: Optional[str] = None,
+                 threads: int = 1):
+        self.workers = max(0, workers)
+        self.threads = max(1, threads)
+        self.timeout = timeout
+        self.initializer = initializer
+        self.start_method = start_method
+
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._created = time.monotonic()
+
+        self.in_flight = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.crashes = 0
+        self.restarts = 0
+        self.busy_seconds = 0.0
+        self.queue_wait_seconds = 0.0
+
+    @property
+    def capacity(self) -> int:
+        """How many renders can run at the same time."""
+        return self.workers or self.threads
+
+    # -- lifecycle -----------------------------------------------------------
+
+    def start(self, probe: Callable = _noop) -> list:
+        """Create the worker processes now rather than on the first render.
+
+        ``probe`` is run once per worker slot after the initializers finished;
+        its results are returned (e.g. to collect warm-up timings).
+        """
+        if self.workers == 0:
+            if self.initializer:
+                self.initializer()
+            return [probe()]
+        executor = self._get_executor()
+        # Forked pools start every process on first submit; make that happen
+        # at startup and wait for the initializers to finish.
+        return [fut.result() for fut in [executor.submit(probe) for _ in range(self.workers)]]
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+            threads, self._threads = self._threads, None
+        for pool in (executor, threads):
+            if pool is not None:
+                pool.shutdown(wait=True, cancel_futures=True)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                ctx = multiprocessing.get_context(self.start_method) if self.start_method else None
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=ctx, initializer=self.initializer)
+            return self._executor
+
+    def _get_threads(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._threads is None:
+                self._threads = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="render")
+            return self._threads
+
+    def _discard(self, executor: ProcessPoolExecutor, kill: bool):
+        """Throw away a broken or stuck pool; the next render builds a new one."""
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+            self.restarts += 1
+        if kill:
+            # A stuck render cannot be cancelled, only its process can be stopped
+            for proc in list(getattr(executor, "_processes", {}).values()):
+                try:
+                    proc.kill()
+                except Exception:
+                    pass
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    # -- rendering -----------------------------------------------------------
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """Run ``fn(*args)`` in a worker and return its result.
+
+        Raises RenderTimeout when the render exceeds the timeout and
+        RenderCrashed when the worker process died twice in a row. Exceptions
+        raised by ``fn`` itself propagate unchanged.
+        """
+        with self._lock:
+            self.in_flight += 1
+            self.submitted += 1
+        submitted = time.perf_counter()
+        try:
+            result, elapsed = await self._run_with_retry(fn, args)
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+        total = time.perf_counter() - submitted
+        with self._lock:
+            self.completed += 1
+            self.busy_seconds += elapsed
+            self.queue_wait_seconds += max(0.0, total - elapsed)
+        return result
+
+    async def _run_with_retry(self, fn: Callable, args: tuple):
+        if self.workers == 0:
+            loop = asyncio.get_running_loop()
+            try:
+                return await asyncio.wait_for(
+                    loop.run_in_executor(self._get_threads(), _timed_call, fn, *args), self.timeout)
+            except asyncio.TimeoutError:
+                with self._lock:
+                    self.timeouts += 1
+                # A thread cannot be stopped; the render runs on and holds its thread
+                raise RenderTimeout(f"render exceeded {self.timeout:g}s and is still running on its thread")
+
+        # A worker can also die because a neighbouring render was killed for
+        # timing out, so one retry on a fresh pool is allowed.
+        for attempt in range(2):
+            executor = self._get_executor()
+            try:
+                future = executor.submit(_timed_call, fn, *args)
+                return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+            except asyncio.TimeoutError:
+                with self._lock:
+                    self.timeouts += 1
+                self._discard(executor, kill=True)
+                raise RenderTimeout(f"render exceeded {self.timeout:g}s")
+            except BrokenProcessPool:
+                with self._lock:
+                    self.crashes += 1
+                self._discard(executor, kill=False)
+        raise RenderCrashed("render worker process died")
+
+    # -- introspection -------------------------------------------------------
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            capacity = self.capacity
+            busy = min(self.in_flight, capacity)
+            uptime = max(1e-9, time.monotonic() - self._created)
+            return {
+                "workers": self.workers,
+                "threads": self.threads if self.workers == 0 else 0,
+                "in_flight": self.in_flight,
+                "busy_workers": busy,
+                "queue_depth": max(0, self.in_flight - capacity),
+                "utilization": round(self.busy_seconds / (capacity * uptime), 4),
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "timeouts": self.timeouts,
+                "crashes": self.crashes,
+                "restarts": self.restarts,
+                "busy_seconds": round(self.busy_seconds, 3),
+                "queue_wait_seconds": round(self.queue_wait_seconds, 3),
+            }
@@ -0,0 +1,141 @@
+"""Minute-resolution weekly schedule and conflict detection.
+
+Times are minutes after midnight. Each day's occupancy is kept as a Python
+int used as a 1440-bit mask (bit ``m`` set when minute ``m`` is taken), which
+makes "is this slot free" and "do these two days collide" single AND
+operations. Conflicts are only enumerated for days whose masks actually
+collided, with one sort-and-sweep over that day's slots that reports every
+overlapping pair. Slots that merely touch (one ends at 10:00, the next starts
+at 10:00) do not conflict.
+"""
+
+from __future__ import annotations
+
+import re
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Sequence
+
+from models import DAY_NAMES, PERSIAN_DAYS, Lesson
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def parse_minutes(value: str) -> int:
+    """Minutes after midnight for "HH:MM" (or "H"); "24:00" is end of day.
+
+    Raises ValueError for anything else.
+    """
+    match = re.fullmatch(r"(\d{1,2})(?::(\d{2}))?", value.strip())
+    if not match:
+        raise ValueError(f"invalid time: {value!r}")
+    hours, minutes = int(match.group(1)), int(match.group(2) or 0)
+    total = hours * 60 + minutes
+    if minutes >= 60 or total > MINUTES_PER_DAY:
+        raise ValueError(f"invalid time: {value!r}")
+    return total
+
+
+def format_minutes(minutes: int) -> str:
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def slot_mask(start: int, end: int) -> int:
+    """Bit mask of the minutes in [start, end)."""
+    return ((1 << (end - start)) - 1) << start if end > start else 0
+
+
+@dataclass(frozen=True)
+class TimeSlot:
+    """One meeting of a lesson: indexes into the lesson list and its schedules."""
+    lesson: int
+    schedule: int
+    day: int
+    start: int
+    end: int
+
+    @property
+    def mask(self) -> int:
+        return slot_mask(self.start, self.end)
+
+
+@dataclass(frozen=True)
+class ScheduleConflict:
+    """Two meetings on the same day whose times overlap.
+
+    ``str()`` gives the same message the form shows; ``in`` searches it.
+    """
+    lesson1: str
+    lesson2: str
+    day: str
+    time1: str
+    time2: str
+    overlap_minutes: int
+
+    def __str__(self) -> str:
+        return f"تداخل: {self.lesson1} و {self.lesson2} در {self.day} ({self.time1} و {self.time2})"
+
+    def __contains__(self, text: str) -> bool:
+        return text in str(self)
+
+    def to_dict(self) -> Dict[str, object]:
+        return {**asdict(self), "message": str(self)}
+
+
+class WeekSchedule:
+    """The meetings of a lesson list, indexed by day.
+
+    Meetings on unknown days or with unparseable or empty time ranges are
+    left out, as the chart does not draw them either.
+    """
+
+    def __init__(self, lessons: Sequence[Lesson]):
+        self.lessons = list(lessons)
+        self.slots: Dict[int, List[TimeSlot]] = {}
+        self.masks: Dict[int, int] = {}
+        self._collided = set()
+        for li, lesson in enumerate(self.lessons):
+            for si, schedule in enumerate(lesson.schedules):
+                day = PERSIAN_DAYS.get(schedule.day)
+                if day is None:
+                    continue
+                try:
+                    start, end = parse_minutes(schedule.start_time), parse_minutes(schedule.end_time)
+                except ValueError:
+                    continue
+                if end <= start:
+                    continue
+                slot = TimeSlot(li, si, day, start, end)
+                self.slots.setdefault(day, []).append(slot)
+                mask = self.masks.get(day, 0)
+                if mask & slot.mask:
+                    self._collided.add(day)
+                self.masks[day] = mask | slot.mask
+
+    def is_free(self, day: int, start: int, end: int) -> bool:
+        return not self.masks.get(day, 0) & slot_mask(start, end)
+
+    def has_conflicts(self) -> bool:
+        return bool(self._collided)
+
+    def conflicts(self) -> List[ScheduleConflict]:
+        """Every overlapping pair of meetings, by day and start time."""
+        found = []
+        for day in sorted(self._collided):
+            active: List[TimeSlot] = []
+            for slot in sorted(self.slots[day], key=lambda s: (s.start, s.end, s.lesson, s.schedule)):
+                # Meetings ending at (or before) this start only touch it
+                active = [a for a in active if a.end > slot.start]
+                for other in active:
+                    found.append(self._conflict(other, slot))
+                active.append(slot)
+        return found
+
+    def _conflict(self, first: TimeSlot, second: TimeSlot) -> ScheduleConflict:
+        return ScheduleConflict(
+            lesson1=self.lessons[first.lesson].name,
+            lesson2=self.lessons[second.lesson].name,
+            day=DAY_NAMES[first.day],
+            time1=f"{format_minutes(first.start)}-{format_minutes(first.end)}",
+            time2=f"{format_minutes(second.start)}-{format_minutes(second.end)}",
+            overlap_minutes=min(first.end, second.end) - max(first.start, second.start),
+        )
@@ -0,0 +1,186 @@
+"""Production server: load the app once, then fork workers that share it.
+
+``uvicorn main:app --workers N`` starts every worker as a fresh interpreter,
+so each one imports matplotlib, registers the fonts and builds the shaping
+and layout tables on its own: N private copies of the same pages. This
+server does that work once, in the parent, and forks the workers after it;
+their copies of those pages stay shared copy-on-write until a worker writes
+to them. The garbage collector is frozen before the fork, so collections in
+the workers do not write to every preloaded object and copy its page.
+
+The workers accept connections from one listening socket. Each renders in
+a pool of one process of its own, forked from the worker and so sharing the
+preloaded pages too: the CPUs are already split between the workers, and a
+render that hangs past its timeout or crashes takes down only that process,
+which is replaced. Rendering on threads (HAFTESOOZ_RENDER_WORKERS=0) saves
+those processes, but a render on a thread cannot be stopped, so a timed-out
+one keeps its thread until it finishes.
+
+The workers share the rendered charts through the chart cache index
+(chart_index.py) and job state through ``SqliteJobStore``, so any worker can
+answer for a chart or a job another one produced. /metrics and /stats
+describe the worker that answered. The parent only supervises: a worker that dies is replaced (its render
+process is stopped with it), and SIGTERM or SIGINT stops them all
+gracefully.
+
+Usage: python server.py [--host 0.0.0.0] [--port 8000] [--workers N]
+
+Settings (environment variables):
+    HAFTESOOZ_SERVER_WORKERS    worker processes (one per available CPU)
+    HAFTESOOZ_RENDER_WORKERS    render processes in each worker (1); 0 renders
+                                on HAFTESOOZ_RENDER_THREADS threads instead
+    HAFTESOOZ_JOB_STORE         job store for more than one worker
+                                (jobs:SqliteJobStore)
+"""
+
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+log = logging.getLogger("haftesooz.server")
+
+# A worker that dies sooner than this after starting is replaced only after this long
+RESTART_BACKOFF = 1.0
+
+
+def available_cpus() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def preload(workers: int):
+    """Import the app and build everything the workers can share."""
+    # Set before main reads them at import
+    os.environ.setdefault("HAFTESOOZ_RENDER_WORKERS", "1")
+    if workers > 1:
+        os.environ.setdefault("HAFTESOOZ_JOB_STORE", "jobs:SqliteJobStore")
+
+    import main
+
+    main.init_renderer()
+    # Loads the fonts, glyph caches and shaping tables on a tiny canvas; the
+    # full-size scaffold is written to on every render, so each worker builds
+    # its own while it warms up
+    main.render_chart_image(main._WARMUP_LESSONS, dpi=20)
+    gc.collect()
+    gc.freeze()
+    return main.app
+
+
+def listen(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    sock = socket.create_server((host, port), backlog=backlog, reuse_port=False)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, sock: socket.socket, args):
+    import uvicorn
+
+    config = uvicorn.Config(app, log_level=args.log_level, access_log=args.access_log,
+                            timeout_graceful_shutdown=args.graceful_timeout)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def serve(app, sock: socket.socket, args) -> int:
+    """Fork ``args.workers`` workers and keep that many running until told to stop."""
+    children = {}
+    stopping = False
+    deadline = 0.0
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                # Signals reach a worker only through the parent, so uvicorn sees each once
+                os.setpgid(0, 0)
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                signal.signal(signal.SIGINT, signal.SIG_DFL)
+                run_worker(app, sock, args)
+                status = 0
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                os._exit(status)
+        children[pid] = time.monotonic()
+
+    def stop(signum, frame):
+        nonlocal stopping, deadline
+        if stopping:
+            return
+        stopping = True
+        # uvicorn gets the graceful timeout; the rest is for its lifespan shutdown
+        deadline = time.monotonic() + args.graceful_timeout + 10
+        log.info("stopping %d workers", len(children))
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(args.workers):
+        spawn()
+    log.info("serving on %s:%d with %d workers", args.host, args.port, args.workers)
+
+    while children:
+        if stopping and time.monotonic() > deadline:
+            for pid in list(children):
+                os.kill(pid, signal.SIGKILL)
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG if stopping else 0)
+        except ChildProcessError:
+            break
+        if pid == 0:
+            time.sleep(0.1)
+            continue
+        started = children.pop(pid, None)
+        if started is None:
+            continue
+        # A worker leads its own process group; its render processes would
+        # otherwise outlive it, waiting for work that never comes
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+        if stopping:
+            continue
+        log.warning("worker %d exited with status %d; starting another", pid, os.waitstatus_to_exitcode(status))
+        if time.monotonic() - started < RESTART_BACKOFF:
+            time.sleep(RESTART_BACKOFF)
+        if not stopping:
+            spawn()
+    return 0
+
+
+def main_cli(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int,
+                        default=int(os.environ.get("HAFTESOOZ_SERVER_WORKERS", "0")) or available_cpus())
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--no-access-log", dest="access_log", action="store_false")
+    parser.add_argument("--graceful-timeout", type=float, default=30.0,
+                        help="seconds a stopping worker waits for open requests")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level.upper(), format="%(levelname)s:     [%(process)d] %(message)s")
+    sock = listen(args.host, args.port)
+    app = preload(args.workers)
+    return serve(app, sock, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,133 @@
+"""Persian text shaping for the chart renderer.
+
+matplotlib draws glyphs left to right with no shaping, so Persian strings are
+passed through arabic_reshaper (contextual letter forms) and python-bidi
+(visual right-to-left order) first. Both are pure Python and comparatively
+slow, while the strings on a chart repeat a lot: day names and the title on
+every render, and the same lesson names across candidate line splits and
+across requests. ``PersianShaper`` puts a bounded LRU cache in front of them
+and keeps pinned, never-evicted entries for known constants.
+
+Text is shaped line by line. For Persian lines this gives the same result as
+shaping the whole label, and it keeps each line's direction independent, so a
+name starting with Latin letters no longer flips the "(N واحد)" line.
+"""
+
+from __future__ import annotations
+
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List
+
+# Optional shaping deps: attempt import once at module load so we can use in functions
+try:
+    import arabic_reshaper as _arabic_reshaper
+    from bidi.algorithm import get_display as _bidi_get_display
+    BIDI_AVAILABLE = True
+except Exception:
+    _arabic_reshaper = None
+    _bidi_get_display = None
+    BIDI_AVAILABLE = False
+
+
+def _fallback_bidi_approx(text: str) -> str:
+    """A conservative bidi fallback for when python-bidi/arabic_reshaper are missing.
+
+    This does not do real shaping. It reverses the order of Arabic/RTL groups while
+    leaving numbers and punctuation in place. It's a visual approximation so the
+    text appears right-to-left instead of fully garbled.
+    """
+    # Split text into runs of Arabic (letters) and non-Arabic
+    parts = re.findall(r"[\u0600-\u06FF\u0750-\u077F\u08A0-\u08FF\uFB50-\uFDFF\uFE70-\uFEFF]+|[^\u0600-\u06FF\u0750-\u077F\u08A0-\u08FF\uFB50-\uFDFF\uFE70-\uFEFF]+", text)
+    # Reverse the order of runs so RTL runs appear first
+    parts = parts[::-1]
+    joined = "".join(parts)
+    # Prepend RLM mark to hint rendering direction
+    return "\u200F" + joined
+
+
+def shape_line_uncached(text: str) -> str:
+    """Shape and bidi-reorder one line of Persian text when possible; otherwise use a fallback.
+
+    - If arabic_reshaper + python-bidi are available, use them for correct shaping and bidi.
+    - Otherwise use a conservative approximation that reverses RTL groups and adds RLM.
+    """
+    if not text:
+        return text
+
+    if BIDI_AVAILABLE:
+        try:
+            return _bidi_get_display(_arabic_reshaper.reshape(text))
+        except Exception:
+            # Fall through to approximation
+            return _fallback_bidi_approx(text)
+    return _fallback_bidi_approx(text)
+
+
+class PersianShaper:
+    """Memoizing front for ``shape_line_uncached``.
+
+    Lines are cached individually, keyed on the raw text, in an LRU of at most
+    ``maxsize`` entries. Pinned lines (see ``preload``) are kept outside the LRU.
+    """
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self._pinned: Dict[str, str] = {}
+        self._lru: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def preload(self, texts: Iterable[str]):
+        """Shape ``texts`` now and keep them for the lifetime of the process."""
+        for text in texts:
+            for line in text.split("\n"):
+                if line not in self._pinned:
+                    self._pinned[line] = shape_line_uncached(line)
+
+    def _shape_line(self, line: str) -> str:
+        pinned = self._pinned.get(line)
+        if pinned is not None:
+            with self._lock:
+                self.hits += 1
+            return pinned
+        with self._lock:
+            shaped = self._lru.get(line)
+            if shaped is not None:
+                self._lru.move_to_end(line)
+                self.hits += 1
+                return shaped
+            self.misses += 1
+        shaped = shape_line_uncached(line)
+        with self._lock:
+            self._lru[line] = shaped
+            if len(self._lru) > self.maxsize:
+                self._lru.popitem(last=False)
+        return shaped
+
+    def shape(self, text: str) -> str:
+        """Shape (possibly multi-line) ``text`` for display."""
+        if not text:
+            return text
+        return "\n".join(self._shape_line(line) for line in text.split("\n"))
+
+    def shape_many(self, texts: Iterable[str]) -> List[str]:
+        """Shape a batch of labels, shaping each distinct line only once."""
+        texts = list(texts)
+        lines = {line for text in texts if text for line in text.split("\n")}
+        shaped = {line: self._shape_line(line) for line in lines}
+        return ["\n".join(shaped[line] for line in text.split("\n")) if text else text
+                for text in texts]
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "cached": len(self._lru),
+                "pinned": len(self._pinned),
+            }
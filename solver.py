@@ -0,0 +1,206 @@
+"""Conflict-free timetables from alternative course sections.
+
+Each course offers several sections (sets of meetings) and a timetable picks
+one section per course so that no two meetings overlap. Trying every
+combination is exponential (5 sections x 12 courses is 244 million), so the
+search works on bitsets instead:
+
+* a section's whole week is one int mask (bit ``day * 1440 + minute``), and
+  sections whose meetings collide with each other are dropped up front;
+* for every pair of sections of different courses compatibility is a single
+  AND, precomputed as "which sections of course j still fit next to section
+  a of course i", itself a bitset over course j's sections;
+* the search picks the course with the fewest remaining sections first and,
+  after every choice, narrows all other courses' candidates with one AND
+  each (forward checking). A course left with no candidates cuts the whole
+  branch off at once.
+
+Timetables are produced lazily, in section preference order, or ranked by
+compactness (fewest days on campus, then least idle time between classes),
+where branches already using more days than the worst kept result are
+pruned. Both stop at a time budget and report whether the search finished.
+"""
+
+from __future__ import annotations
+
+import heapq
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from models import DAY_NAMES, CourseSections, Lesson
+from schedule import MINUTES_PER_DAY, WeekSchedule
+
+_DAY_MASK = (1 << MINUTES_PER_DAY) - 1
+
+RANKINGS = ("first", "compact")
+
+
+def _popcount(value: int) -> int:
+    return bin(value).count("1")
+
+
+def week_mask(lesson: Lesson) -> Optional[int]:
+    """The lesson's meetings as one week-wide mask, or None if they overlap."""
+    week = WeekSchedule([lesson])
+    if week.has_conflicts():
+        return None
+    mask = 0
+    for day, day_mask in week.masks.items():
+        mask |= day_mask << (day * MINUTES_PER_DAY)
+    return mask
+
+
+def days_used(mask: int) -> int:
+    return sum(1 for day in range(len(DAY_NAMES)) if (mask >> (day * MINUTES_PER_DAY)) & _DAY_MASK)
+
+
+def compactness(mask: int) -> Tuple[int, int]:
+    """(days with classes, idle minutes between the first and last class)."""
+    days = idle = 0
+    for day in range(len(DAY_NAMES)):
+        chunk = (mask >> (day * MINUTES_PER_DAY)) & _DAY_MASK
+        if chunk:
+            days += 1
+            first = (chunk & -chunk).bit_length() - 1
+            idle += chunk.bit_length() - first - _popcount(chunk)
+    return days, idle
+
+
+@dataclass(frozen=True)
+class Timetable:
+    """One section index per course and the timetable's compactness."""
+    sections: Tuple[int, ...]
+    days: int
+    idle_minutes: int
+
+    @property
+    def score(self) -> Tuple[int, int]:
+        return self.days, self.idle_minutes
+
+
+class TimetableSolver:
+    """Search the conflict-free combinations of ``courses``' sections."""
+
+    def __init__(self, courses: Sequence[CourseSections]):
+        self.courses = list(courses)
+        self.masks: List[List[Optional[int]]] = [
+            [week_mask(Lesson(name=course.name, units=course.units, schedules=section.schedules))
+             for section in course.sections]
+            for course in self.courses
+        ]
+        # Sections whose own meetings do not collide
+        self.domains = [sum(1 << s for s, mask in enumerate(masks) if mask is not None)
+                        for masks in self.masks]
+        # compatible[i][a][j]: sections of course j that fit next to section a of course i
+        self.compatible: List[List[List[int]]] = []
+        for i, masks in enumerate(self.masks):
+            rows = []
+            for mask in masks:
+                row = []
+                for j, others in enumerate(self.masks):
+                    if mask is None or i == j:
+                        row.append(0)
+                        continue
+                    row.append(sum(1 << b for b, other in enumerate(others)
+                                   if other is not None and not mask & other))
+                rows.append(row)
+            self.compatible.append(rows)
+        self.stats: Dict[str, object] = {}
+
+    def lessons(self, timetable: Timetable) -> List[Lesson]:
+        """The chosen sections as the lesson list the chart is drawn from."""
+        return [Lesson(name=course.name, units=course.units, schedules=course.sections[s].schedules)
+                for course, s in zip(self.courses, timetable.sections)]
+
+    def solve(self, limit: Optional[int] = None, rank: str = "first",
+              time_budget: Optional[float] = None) -> Iterator[Timetable]:
+        """Yield up to ``limit`` conflict-free timetables.
+
+        With ``rank="first"`` they are yielded as soon as they are found, in
+        section order. With ``rank="compact"`` the search runs to the end (or
+        the budget) and the best ``limit`` are yielded, most compact first.
+        ``self.stats`` says how far the search got once the iterator is done.
+        """
+        if rank not in RANKINGS:
+            raise ValueError(f"unknown ranking: {rank!r}")
+        deadline = None if time_budget is None else time.perf_counter() + time_budget
+        self.stats = {"nodes": 0, "pruned": 0, "found": 0, "timed_out": False, "complete": False}
+        if rank == "first":
+            for found, timetable in enumerate(self._search(deadline), 1):
+                yield timetable
+                if limit is not None and found >= limit:
+                    return
+        else:
+            # Min-heap on the negated score: best[0] is the worst timetable kept
+            best: List[Tuple[Tuple[int, int], int, Timetable]] = []
+            for found, timetable in enumerate(self._search(deadline, best, limit)):
+                entry = ((-timetable.days, -timetable.idle_minutes), -found, timetable)
+                if limit is None or len(best) < limit:
+                    heapq.heappush(best, entry)
+                elif entry > best[0]:
+                    heapq.heapreplace(best, entry)
+            yield from (entry[2] for entry in sorted(best, reverse=True))
+
+    def _search(self, deadline: Optional[float], best: Optional[list] = None,
+                keep: Optional[int] = None) -> Iterator[Timetable]:
+        """Depth-first search with forward checking, one frame per course.
+
+        With ``best`` (the caller's heap of ``keep`` results) full, branches
+        that cannot beat its worst entry are pruned.
+        """
+        stats = self.stats
+        n = len(self.courses)
+        if not n or not all(self.domains):
+            stats["complete"] = True
+            return
+        chosen = [0] * n
+        # Each frame: (domains, course being assigned, its remaining sections, mask so far)
+        stack = []
+
+        def frame(domains: List[int], mask: int):
+            course = min((j for j in range(n) if domains[j] >= 0), key=lambda j: _popcount(domains[j]))
+            return domains, course, domains[course], mask
+
+        stack.append(frame(list(self.domains), 0))
+        while stack:
+            if deadline is not None and time.perf_counter() > deadline:
+                stats["timed_out"] = True
+                return
+            domains, course, remaining, mask = stack[-1]
+            if not remaining:
+                stack.pop()
+                continue
+            section = (remaining & -remaining).bit_length() - 1
+            stack[-1] = (domains, course, remaining & (remaining - 1), mask)
+            stats["nodes"] += 1
+
+            chosen[course] = section
+            new_mask = mask | self.masks[course][section]
+            if best and keep is not None and len(best) >= keep:
+                # Days only ever get added, so a partial timetable already on
+                # more days than the worst kept result cannot beat it
+                if days_used(new_mask) > -best[0][0][0]:
+                    stats["pruned"] += 1
+                    continue
+
+            row = self.compatible[course][section]
+            narrowed = list(domains)
+            narrowed[course] = -1
+            dead_end = False
+            for j in range(n):
+                if narrowed[j] >= 0:
+                    narrowed[j] &= row[j]
+                    if not narrowed[j]:
+                        dead_end = True
+                        break
+            if dead_end:
+                stats["pruned"] += 1
+                continue
+            if len(stack) == n:
+                days, idle = compactness(new_mask)
+                stats["found"] += 1
+                yield Timetable(tuple(chosen), days, idle)
+                continue
+            stack.append(frame(narrowed, new_mask))
+        stats["complete"] = True
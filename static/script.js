@@ -12,6 +12,12 @@ function convertPersianToEnglish(str) {
   return str;
 }
 
+// Minutes after midnight for "HH:MM" (or "H")
+function timeToMinutes(value) {
+  const [hours, minutes] = value.split(":");
+  return parseInt(hours) * 60 + (parseInt(minutes) || 0);
+}
+
 // Check for schedule overlaps across all lessons
 function checkScheduleOverlaps() {
   const allSchedules = [];
@@ -52,10 +58,10 @@ function checkScheduleOverlaps() {
       // Skip if different days
       if (schedule1.day !== schedule2.day) continue;
 
-      const start1 = parseInt(schedule1.startTime.split(":")[0]);
-      const end1 = parseInt(schedule1.endTime.split(":")[0]);
-      const start2 = parseInt(schedule2.startTime.split(":")[0]);
-      const end2 = parseInt(schedule2.endTime.split(":")[0]);
+      const start1 = timeToMinutes(schedule1.startTime);
+      const end1 = timeToMinutes(schedule1.endTime);
+      const start2 = timeToMinutes(schedule2.startTime);
+      const end2 = timeToMinutes(schedule2.endTime);
 
       // Check for overlap
       if (start1 < end2 && start2 < end1) {
@@ -412,11 +418,134 @@ function updateLessonNumbers() {
   });
 }
 
+// Render jobs: the chart is queued with POST /jobs and followed over
+// server-sent events (or by polling), so the page stays usable while it renders
+const JOB_STAGES = {
+  queued: "در صف ساخت نمودار...",
+  running: "در حال ساخت نمودار...",
+  rendering: "در حال ساخت نمودار...",
+  saving: "در حال آماده‌سازی تصویر...",
+};
+
+function showJobStatus(message, failed) {
+  const status = document.getElementById("job-status");
+  if (!status) return;
+  status.textContent = message;
+  status.classList.toggle("failed", Boolean(failed));
+  status.hidden = false;
+}
+
+function hideJobStatus() {
+  const status = document.getElementById("job-status");
+  if (status) status.hidden = true;
+}
+
+function setSubmitting(submitting) {
+  const button = document.querySelector('#lessonForm button[type="submit"]');
+  if (button) button.disabled = submitting;
+}
+
+// The modal shows the small preview; the download link points at the
+// full-resolution image, which the server only encodes once it is requested
+function openChartModal(url, downloadUrl) {
+  const overlay = document.getElementById("chartModal");
+  if (!overlay) {
+    window.location.href = downloadUrl || url;
+    return;
+  }
+  overlay.querySelector("img").src = url;
+  overlay.querySelector(".btn-download").href = downloadUrl || url;
+  overlay.style.display = "";
+  overlay.classList.add("open");
+}
+
+function jobFinished(job) {
+  setSubmitting(false);
+  if (job.status === "done") {
+    hideJobStatus();
+    openChartModal(job.result.url, job.result.download_url);
+  } else {
+    const reason = (job.error && job.error.error) || "";
+    showJobStatus(`خطا در ایجاد نمودار: ${reason}`, true);
+  }
+}
+
+function pollJob(job) {
+  fetch(job.status_url)
+    .then((response) => response.json())
+    .then((latest) => {
+      if (latest.status === "done" || latest.status === "failed") {
+        jobFinished(latest);
+      } else {
+        showJobStatus(JOB_STAGES[latest.stage] || JOB_STAGES.running);
+        setTimeout(() => pollJob(latest), 1000);
+      }
+    })
+    .catch(() => setTimeout(() => pollJob(job), 2000));
+}
+
+function followJob(job) {
+  if (job.status === "done" || job.status === "failed") {
+    jobFinished(job);
+    return;
+  }
+  showJobStatus(JOB_STAGES[job.stage] || JOB_STAGES.queued);
+  if (!window.EventSource) {
+    pollJob(job);
+    return;
+  }
+  const source = new EventSource(job.events_url);
+  source.addEventListener("progress", (e) => {
+    const latest = JSON.parse(e.data);
+    showJobStatus(JOB_STAGES[latest.stage] || JOB_STAGES.running);
+  });
+  const finish = (e) => {
+    source.close();
+    jobFinished(JSON.parse(e.data));
+  };
+  source.addEventListener("done", finish);
+  source.addEventListener("failed", finish);
+  source.onerror = () => {
+    // Stream dropped (proxy, network); carry on by polling
+    source.close();
+    pollJob(job);
+  };
+}
+
+function submitChartJob(lessons, form) {
+  setSubmitting(true);
+  showJobStatus(JOB_STAGES.queued);
+  fetch("/jobs?format=preview", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(lessons),
+  })
+    .then((response) =>
+      response.json().then((body) => ({ status: response.status, body }))
+    )
+    .then(({ status, body }) => {
+      if (status === 409) {
+        setSubmitting(false);
+        hideJobStatus();
+        showConflictWarning(body.conflicts.map((conflict) => conflict.message));
+      } else if (status !== 202) {
+        setSubmitting(false);
+        showJobStatus(`خطا در ایجاد نمودار: ${body.error || status}`, true);
+      } else {
+        followJob(body);
+      }
+    })
+    .catch(() => {
+      // Jobs unavailable: fall back to a normal form post
+      form.submit();
+    });
+}
+
 // Form submission handler
 document.getElementById("lessonForm").addEventListener("submit", function (e) {
-  // On submit: build the lessons_data payload and let the browser perform a normal POST
-  // This ensures the server-rendered page is fully loaded and inline scripts (restoreFormData)
-  // are executed by the browser so form data can be rehydrated.
+  // On submit: build the lessons payload and queue a render job for it. The
+  // hidden lessons_data input is filled too, for the plain form post used as
+  // a fallback (the server-rendered page then rehydrates the form).
   const conflicts = checkScheduleOverlaps();
   if (conflicts.length > 0) {
     // Prevent submit when conflicts exist
@@ -481,13 +610,15 @@ document.getElementById("lessonForm").addEventListener("submit", function (e) {
     return;
   }
 
-  // Put JSON into hidden input so server receives it when browser submits the form normally
+  // Put JSON into hidden input so server receives it if the form is posted normally
   const hidden = document.getElementById("lessons_data");
   if (hidden) {
     hidden.value = JSON.stringify(lessons);
   }
 
-  // Allow form to submit normally (no fetch). Browser will render the server response and execute scripts.
+  e.preventDefault();
+  hideConflictWarning();
+  submitChartJob(lessons, this);
 });
 
 // Add event listeners for time validation and conflict detection
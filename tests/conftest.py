@@ -0,0 +1,20 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+LESSONS = [{"name": "ریاضی", "units": 3, "schedules": [
+    {"day": "شنبه", "start_time": "08:00", "end_time": "10:00"}]}]
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """The app with its charts and cache in ``tmp_path``, rendering in-process."""
+    monkeypatch.setattr(main, "CHARTS_DIR", str(tmp_path))
+    monkeypatch.setattr(main, "chart_cache", main.ChartCache(str(tmp_path)))
+    monkeypatch.setattr(main.render_pool, "workers", 0)
+    return TestClient(main.app)
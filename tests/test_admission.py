@@ -0,0 +1,108 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from admission import AdmissionController, Overloaded
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_in_flight_and_memory_budget_bound_concurrent_renders():
+    async def scenario():
+        control = AdmissionController(max_in_flight=3, memory_budget=200, max_queued=10)
+        first = await control.acquire("a", 100)
+        second = await control.acquire("b", 100)
+        # Under the slot limit but over the memory budget: has to wait
+        third = asyncio.ensure_future(control.acquire("c", 100))
+        await asyncio.sleep(0)
+        assert not third.done() and control.stats()["queued"] == 1
+        control.release(first)
+        ticket = await third
+        assert control.memory_in_use == 200 and ticket.wait > 0
+        control.release(second)
+        control.release(ticket)
+        # Larger than the whole budget: still runs when nothing else does
+        control.release(await control.acquire("d", 500))
+
+    run(scenario())
+
+
+def test_full_queue_fails_fast_with_retry_after():
+    async def scenario():
+        control = AdmissionController(max_in_flight=1, max_queued=1, max_wait=5)
+        held = await control.acquire("a", 1)
+        waiting = asyncio.ensure_future(control.acquire("b", 1))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as excinfo:
+            await control.acquire("c", 1)
+        assert excinfo.value.retry_after >= 1
+        # Jobs and batches wait their turn instead
+        patient = asyncio.ensure_future(control.acquire("c", 1, fail_fast=False))
+        await asyncio.sleep(0)
+        control.release(held)
+        control.release(await waiting)
+        control.release(await patient)
+        assert control.stats()["rejected"] == 1
+
+    run(scenario())
+
+
+def test_queue_wait_times_out():
+    async def scenario():
+        control = AdmissionController(max_in_flight=1, max_wait=0.01)
+        held = await control.acquire("a", 1)
+        with pytest.raises(Overloaded):
+            await control.acquire("b", 1)
+        assert control.stats()["timed_out"] == 1 and control.stats()["queued"] == 0
+        control.release(held)
+
+    run(scenario())
+
+
+def test_fair_queuing_alternates_between_clients():
+    async def scenario(fair):
+        control = AdmissionController(max_in_flight=1, max_queued=10, fair=fair)
+        held = await control.acquire("busy", 1)
+        order = []
+
+        async def render(client):
+            async with control.slot(client, 1):
+                order.append(client)
+
+        tasks = [asyncio.ensure_future(render(c)) for c in ["busy", "busy", "busy", "other"]]
+        await asyncio.sleep(0)
+        control.release(held)
+        await asyncio.gather(*tasks)
+        return order
+
+    assert run(scenario(True)) == ["busy", "other", "busy", "busy"]
+    assert run(scenario(False)) == ["busy", "busy", "busy", "other"]
+
+
+def test_api_answers_503_when_saturated(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "chart_cache", main.ChartCache(str(tmp_path)))
+    control = AdmissionController(max_in_flight=1, max_queued=0)
+    control.in_flight = 1  # a render that never finishes
+    monkeypatch.setattr(main, "admission", control)
+    lessons = [{"name": "ریاضی", "units": 3, "schedules": [
+        {"day": "شنبه", "start_time": "08:00", "end_time": "10:00"}]}]
+    response = TestClient(main.app).post("/api/chart?format=svg", json=lessons)
+    assert response.status_code == 503
+    assert int(response.headers["retry-after"]) >= 1
+
+
+def test_api_reports_queue_wait_apart_from_render_time(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "chart_cache", main.ChartCache(str(tmp_path)))
+    lessons = [{"name": "فیزیک", "units": 2, "schedules": [
+        {"day": "یکشنبه", "start_time": "10:30", "end_time": "12:00"}]}]
+    response = TestClient(main.app).post("/api/chart?format=svg", json=lessons)
+    timing = response.headers["server-timing"]
+    assert timing.startswith("queue;dur=") and ", render;dur=" in timing
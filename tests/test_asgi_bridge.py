@@ -0,0 +1,113 @@
+import io
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from wsgiref.util import setup_testing_defaults
+
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from asgi_bridge import AsgiBridge
+
+events = []
+
+
+@asynccontextmanager
+async def lifespan(app):
+    events.append(("startup", threading.current_thread().name))
+    yield
+    events.append(("shutdown", threading.current_thread().name))
+
+
+demo = FastAPI(lifespan=lifespan)
+
+
+@demo.get("/thread")
+async def thread_name():
+    return {"thread": threading.current_thread().name}
+
+
+@demo.post("/echo")
+async def echo(request: Request):
+    body = await request.body()
+    return PlainTextResponse(body, status_code=201, headers={"X-Length": str(len(body)),
+                                                             "X-Type": request.headers.get("content-type", "")})
+
+
+@demo.get("/stream")
+async def stream():
+    async def parts():
+        for i in range(3):
+            yield f"part{i};".encode()
+    return StreamingResponse(parts(), media_type="text/plain")
+
+
+@demo.get("/boom")
+async def boom():
+    raise RuntimeError("boom")
+
+
+def call(app, path, method="GET", body=b"", **extra):
+    env = {"REQUEST_METHOD": method, "PATH_INFO": path, "wsgi.input": io.BytesIO(body)}
+    if body:
+        env["CONTENT_LENGTH"] = str(len(body))
+    env.update(extra)
+    setup_testing_defaults(env)
+    captured = {}
+
+    def start_response(status, headers, exc_info=None):
+        captured["status"], captured["headers"] = status, dict(headers)
+
+    result = app(env, start_response)
+    chunks = list(result)
+    getattr(result, "close", lambda: None)()
+    return captured["status"], captured["headers"], chunks
+
+
+def test_requests_share_one_loop_and_lifespan_runs_once():
+    bridge = AsgiBridge(demo)
+    try:
+        threads = {call(bridge, "/thread")[2][0] for _ in range(3)}
+        assert threads == {b'{"thread":"asgi-bridge"}'}
+        with ThreadPoolExecutor(8) as pool:
+            statuses = list(pool.map(lambda _: call(bridge, "/thread")[0], range(32)))
+        assert statuses == ["200 OK"] * 32
+        assert events == [("startup", "asgi-bridge")]
+    finally:
+        bridge.stop()
+    assert events[-1] == ("shutdown", "asgi-bridge")
+
+
+def test_bodies_status_and_headers():
+    bridge = AsgiBridge(demo, lifespan=False, buffer_limit=1024)
+    try:
+        payload = os.urandom(300000)
+        status, headers, chunks = call(bridge, "/echo", "POST", payload, CONTENT_TYPE="application/octet-stream")
+        assert status == "201 Created"
+        assert b"".join(chunks) == payload
+        assert headers["x-length"] == str(len(payload))
+        assert headers["x-type"] == "application/octet-stream"
+
+        status, _, chunks = call(bridge, "/stream")
+        assert chunks == [b"part0;", b"part1;", b"part2;"]
+
+        assert call(bridge, "/missing")[0] == "404 Not Found"
+        assert call(bridge, "/boom")[0] == "500 Internal Server Error"
+    finally:
+        bridge.stop()
+
+
+def test_serves_the_app():
+    from main import app
+
+    bridge = AsgiBridge(app, lifespan=False)
+    try:
+        status, _, chunks = call(bridge, "/health")
+        assert status == "200 OK"
+        assert b"".join(chunks) == b"healthy\n"
+    finally:
+        bridge.stop()
@@ -0,0 +1,75 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import io
+import json
+import zipfile
+
+import pytest
+
+import main
+from conftest import LESSONS
+
+MATH = LESSONS[0]
+PHYSICS = {"name": "فیزیک", "units": 2, "schedules": [{"day": "شنبه", "start_time": "09:00", "end_time": "11:00"}]}
+
+
+@pytest.fixture
+def render_calls(monkeypatch):
+    calls = []
+    render = main.render_chart_document
+
+    def counting(lessons, fmt):
+        calls.append(lessons)
+        return render(lessons, fmt)
+
+    monkeypatch.setattr(main, "render_chart_document", counting)
+    return calls
+
+
+BATCH = [
+    {"id": "ali", "lessons": [MATH]},
+    # Same week spelled differently: rendered once
+    {"id": "sara", "lessons": [{**MATH, "schedules": [{"day": "شنبه", "start_time": "۸", "end_time": "10"}]}]},
+    {"id": "clash", "lessons": [MATH, PHYSICS]},
+    {"id": "broken", "lessons": [{"name": "ریاضی"}]},
+    {"id": "../evil", "lessons": [PHYSICS]},
+]
+
+
+def test_batch_zip_dedups_and_reports_item_errors(client, render_calls):
+    response = client.post("/api/batch?format=svg", json=BATCH)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    assert sorted(archive.namelist()) == ["ali.svg", "evil.svg", "manifest.json", "sara.svg"]
+    assert archive.read("ali.svg") == archive.read("sara.svg")
+    assert len(render_calls) == 2
+
+    manifest = json.loads(archive.read("manifest.json"))
+    assert (manifest["items"], manifest["charts"], manifest["errors"]) == (5, 2, 2)
+    by_id = {r["id"]: r for r in manifest["results"]}
+    assert by_id["clash"]["conflicts"][0]["lesson1"] == "ریاضی"
+    assert by_id["broken"]["error"] == "Invalid lessons"
+    assert {by_id["ali"]["cache"], by_id["sara"]["cache"]} == {"miss", "duplicate"}
+
+
+def test_batch_ndjson_links_to_cached_charts(client):
+    response = client.post("/api/batch?output=ndjson&format=pdf", json=BATCH)
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[-1] == {"done": True, "items": 5, "charts": 2, "errors": 2}
+    ok = [line for line in lines[:-1] if line["status"] == "ok"]
+    assert len(ok) == 3
+    chart = client.get(ok[0]["url"])
+    assert chart.status_code == 200 and chart.content.startswith(b"%PDF")
+
+    # Already rendered: served from the cache
+    again = [json.loads(line) for line in client.post("/api/batch?output=ndjson&format=pdf",
+                                                      json=BATCH[:1]).text.splitlines()]
+    assert again[0]["cache"] == "hit"
+
+
+def test_batch_size_is_bounded(client, monkeypatch):
+    monkeypatch.setattr(main, "BATCH_MAX_ITEMS", 1)
+    assert client.post("/api/batch", json=BATCH).status_code == 413
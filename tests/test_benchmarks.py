@@ -0,0 +1,48 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+from schedule import WeekSchedule
+from suite import compare
+from workloads import WORKLOADS, pathological, typical
+
+
+def test_workloads_are_reproducible_and_conflict_free():
+    for name, generate in WORKLOADS.items():
+        for seed in range(5):
+            lessons = generate(seed)
+            assert lessons, name
+            assert [lesson.name for lesson in lessons] == [lesson.name for lesson in generate(seed)]
+            assert not WeekSchedule(lessons).has_conflicts(), (name, seed)
+
+
+def test_workload_shapes():
+    assert all(6 <= len(typical(seed)) <= 8 for seed in range(10))
+    lessons = pathological(0)
+    blocks = [s for lesson in lessons for s in lesson.schedules]
+    # Every hour of every day is taken by a one-hour block
+    assert len(blocks) == 7 * 16
+    assert len({s.day for s in blocks}) == 7
+    assert min(len(lesson.name) for lesson in lessons) > 30
+
+
+def _results(**case):
+    return {"results": {"typical/png": case}}
+
+
+def test_compare_flags_regressions_beyond_threshold():
+    baseline = _results(warm_median_s=1.0, output_bytes=1000, throughput={"1": 2.0, "2": 4.0})
+    current = _results(warm_median_s=1.1, output_bytes=1300, throughput={"1": 2.0, "2": 3.0})
+    regressions = compare(baseline, current, 0.2)
+    assert len(regressions) == 2
+    assert any("output_bytes" in r for r in regressions)
+    assert any("throughput[2]" in r for r in regressions)
+
+
+def test_compare_ignores_improvements_and_new_cases():
+    baseline = _results(warm_median_s=1.0, peak_rss_bytes=None)
+    current = {"results": {"typical/png": {"warm_median_s": 0.5, "peak_rss_bytes": 10},
+                           "small/svg": {"warm_median_s": 9.0}}}
+    assert compare(baseline, current, 0.1) == []
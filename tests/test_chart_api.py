@@ -0,0 +1,71 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from conftest import LESSONS
+
+
+def test_api_returns_png_from_memory_then_serves_cached_copy(client, tmp_path):
+    first = client.post("/api/chart", json=LESSONS)
+    assert first.status_code == 200
+    assert first.headers["content-type"] == "image/png"
+    assert first.headers["x-cache"] == "miss"
+    assert first.content.startswith(b"\x89PNG")
+
+    # Stored in the background once the response was sent
+    chart_url = first.headers["content-location"]
+    assert (tmp_path / chart_url.rsplit("/", 1)[1]).exists()
+
+    second = client.post("/api/chart", json=LESSONS)
+    assert second.headers["x-cache"] == "hit"
+    assert second.content == first.content
+    assert second.headers["etag"] == first.headers["etag"]
+
+
+def test_chart_get_supports_conditional_requests(client):
+    created = client.post("/api/chart", json=LESSONS)
+    url, etag = created.headers["content-location"], created.headers["etag"]
+
+    fresh = client.get(url)
+    assert fresh.status_code == 200
+    assert fresh.headers["etag"] == etag
+    assert "immutable" in fresh.headers["cache-control"]
+
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+    assert client.get(url, headers={"If-None-Match": f'"other", W/{etag}'}).status_code == 304
+    assert client.post("/api/chart", json=LESSONS, headers={"If-None-Match": etag}).status_code == 304
+
+
+def test_api_renders_vector_formats_with_their_own_etag(client):
+    png = client.post("/api/chart", json=LESSONS)
+    svg = client.post("/api/chart?format=svg", json=LESSONS)
+    assert svg.status_code == 200
+    assert svg.headers["content-type"].startswith("image/svg+xml")
+    assert svg.content.startswith(b"<?xml")
+    assert svg.headers["etag"] != png.headers["etag"]
+    assert svg.headers["content-location"].endswith(".svg")
+
+    served = client.get(svg.headers["content-location"])
+    assert served.content == svg.content
+    assert served.headers["content-type"].startswith("image/svg+xml")
+
+    pdf = client.post("/api/chart?format=pdf", json=LESSONS)
+    assert pdf.headers["content-type"] == "application/pdf"
+    assert pdf.content.startswith(b"%PDF-")
+    assert client.post("/api/chart?format=gif", json=LESSONS).status_code == 422
+
+
+def test_layout_endpoint_returns_cacheable_json(client):
+    first = client.post("/api/layout", json=LESSONS)
+    assert first.status_code == 200
+    assert first.headers["content-type"] == "application/json"
+    layout = first.json()
+    assert [b["label"][0]["text"] for b in layout["blocks"]] == ["ریاضی"]
+    assert client.get(first.headers["content-location"]).content == first.content
+    assert client.post("/api/layout", json=LESSONS,
+                       headers={"If-None-Match": first.headers["etag"]}).status_code == 304
+
+
+def test_unknown_or_unsafe_chart_names_are_not_found(client):
+    assert client.get("/chart/schedule_deadbeef.png").status_code == 404
+    assert client.get("/chart/..%2Fmain.py").status_code == 404
@@ -0,0 +1,107 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from main import (ChartCache, Lesson, LessonSchedule, canonicalize_lessons,
+                  schedule_cache_key)
+
+
+def _key(lessons):
+    return schedule_cache_key(canonicalize_lessons(lessons))
+
+
+def test_equivalent_schedules_share_a_key():
+    a = [
+        Lesson(name="ریاضی  عمومی", units=3, schedules=[
+            LessonSchedule(day="یکشنبه", start_time="10:00", end_time="12:00"),
+            LessonSchedule(day="شنبه", start_time="08:00", end_time="10:00"),
+        ]),
+        Lesson(name="فیزیک", units=2, schedules=[
+            LessonSchedule(day="سه‌شنبه", start_time="08:00", end_time="10:00"),
+        ]),
+    ]
+    b = [
+        Lesson(name="فيزيک", units=2, schedules=[
+            LessonSchedule(day="سه شنبه", start_time="۰۸:۰۰", end_time="10"),
+        ]),
+        Lesson(name=" ریاضی عمومی ", units=3, schedules=[
+            LessonSchedule(day="شنبه", start_time="8:00", end_time="10:00"),
+            LessonSchedule(day="یکشنبه", start_time="10:00", end_time="12:00"),
+        ]),
+    ]
+    assert _key(a) == _key(b)
+
+
+def test_different_schedules_get_different_keys():
+    a = [Lesson(name="ریاضی", units=3, schedules=[
+        LessonSchedule(day="شنبه", start_time="08:00", end_time="10:00")])]
+    b = [Lesson(name="ریاضی", units=3, schedules=[
+        LessonSchedule(day="شنبه", start_time="08:00", end_time="11:00")])]
+    assert _key(a) != _key(b)
+
+
+def _fake_render(cache, key, size=10):
+    with open(cache.path_for(key), "wb") as f:
+        f.write(b"x" * size)
+    return cache.put(key)
+
+
+def test_cache_counts_hits_and_misses(tmp_path):
+    cache = ChartCache(str(tmp_path))
+    assert cache.get("a" * 64) is None
+    _fake_render(cache, "a" * 64)
+    assert cache.get("a" * 64) == cache.filename_for("a" * 64)
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = ChartCache(str(tmp_path), max_entries=2)
+    _fake_render(cache, "a" * 64)
+    _fake_render(cache, "b" * 64)
+    cache.get("a" * 64)
+    _fake_render(cache, "c" * 64)
+
+    assert cache.get("b" * 64) is None
+    assert not os.path.exists(cache.path_for("b" * 64))
+    assert cache.get("a" * 64) and cache.get("c" * 64)
+    assert cache.stats()["evictions"] == 1
+
+
+def test_cache_respects_byte_budget(tmp_path):
+    cache = ChartCache(str(tmp_path), max_bytes=25)
+    for ch in "abc":
+        _fake_render(cache, ch * 64, size=10)
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["bytes"] <= 25
+
+
+def test_cache_index_is_shared_between_processes(tmp_path):
+    # Two caches on one directory stand in for two server workers
+    first = ChartCache(str(tmp_path), max_entries=2)
+    second = ChartCache(str(tmp_path), max_entries=2)
+    _fake_render(first, "a" * 64)
+    assert second.get("a" * 64) == second.filename_for("a" * 64)
+
+    _fake_render(second, "b" * 64)
+    first.get("a" * 64)
+    _fake_render(second, "c" * 64)
+    # "a" was used last through the other cache, so "b" is the one evicted
+    assert first.get("b" * 64) is None and not os.path.exists(first.path_for("b" * 64))
+    assert first.stats()["entries"] == second.stats()["entries"] == 2
+
+
+def test_cache_index_survives_fork_and_restart(tmp_path):
+    cache = ChartCache(str(tmp_path))
+    _fake_render(cache, "a" * 64)
+    pid = os.fork()
+    if pid == 0:
+        # The child opens its own connection and sees the parent's entries
+        os._exit(0 if cache.get("a" * 64) and _fake_render(cache, "b" * 64) else 1)
+    assert os.waitstatus_to_exitcode(os.waitpid(pid, 0)[1]) == 0
+    assert cache.get("b" * 64)
+
+    os.remove(cache.path_for("a" * 64))
+    restarted = ChartCache(str(tmp_path))
+    assert restarted.stats()["entries"] == 1
+    assert restarted.get("a" * 64) is None and restarted.get("b" * 64)
@@ -0,0 +1,94 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import main
+from main import Lesson, LessonSchedule, create_schedule_chart
+from workloads import edit_one_lesson, pathological, typical
+
+LESSONS = [
+    Lesson(name="ریاضی", units=3, schedules=[
+        LessonSchedule(day="شنبه", start_time="06:00", end_time="08:00"),
+        LessonSchedule(day="یکشنبه", start_time="10:00", end_time="12:00"),
+    ]),
+    Lesson(name="فیزیک پایه یک و آزمایشگاه فیزیک", units=2, schedules=[
+        LessonSchedule(day="جمعه", start_time="20:00", end_time="22:00"),
+    ]),
+]
+
+
+def _pixels(path):
+    return np.asarray(Image.open(path).convert("RGBA"))
+
+
+def test_composited_chart_matches_full_render(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "CHARTS_DIR", str(tmp_path))
+    # The reference path is written by savefig, so compare truecolor output
+    monkeypatch.setitem(main.PNG_PROFILES, "print", main.PngProfile("print", colors=0))
+    full = create_schedule_chart(LESSONS, filename="full.png", composite=False)
+    fast = create_schedule_chart(LESSONS, filename="fast.png")
+    assert np.array_equal(_pixels(tmp_path / full), _pixels(tmp_path / fast))
+
+
+def test_background_is_reused_between_renders(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "CHARTS_DIR", str(tmp_path))
+    create_schedule_chart(LESSONS[:1], filename="a.png")
+    create_schedule_chart(LESSONS[1:], filename="b.png")
+    empty = create_schedule_chart([], filename="empty.png")
+    # Renders one after another share one scaffold
+    assert len(main._CHART_SCAFFOLDS[(main.CHART_FIGSIZE, main.CHART_DPI)]) == 1
+    # Blocks of earlier renders must not leak into later ones
+    scaffold = main._CHART_SCAFFOLDS[(main.CHART_FIGSIZE, main.CHART_DPI)][0]
+    assert not scaffold.ax.patches and not scaffold.ax.texts
+    assert _pixels(tmp_path / empty).shape == _pixels(tmp_path / "a.png").shape
+
+
+def test_renderer_profile_is_built_once_and_immutable():
+    import dataclasses
+    import matplotlib
+    import pytest
+
+    profile = main.init_renderer()
+    assert main.init_renderer() is profile
+    # The style is applied per figure, not to the global rcParams
+    assert matplotlib.rcParams["font.family"] == matplotlib.rcParamsDefault["font.family"]
+    with main._figure_style():
+        assert matplotlib.rcParams["font.family"] == [profile.font_name]
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        profile.font_name = "other"
+    with pytest.raises(TypeError):
+        profile.rc["font.size"] = 8
+
+
+@pytest.mark.parametrize("workload, dpi", [(typical, main.CHART_DPI), (pathological, main.CHART_DPI),
+                                           (pathological, 20)])
+def test_edited_schedule_reuses_day_tiles_and_matches_full_render(workload, dpi, monkeypatch):
+    main.init_renderer()
+    lessons = workload(4)
+    main.render_chart_image(lessons, dpi=dpi)
+    hits = main._TILE_STATS["hits"]
+    for seed in range(3):
+        lessons = edit_one_lesson(lessons, seed)
+        tiled = main.render_chart_image(lessons, dpi=dpi)
+        with monkeypatch.context() as m:
+            m.setattr(main, "TILE_CACHE_BYTES", 0)
+            assert np.array_equal(tiled, main.render_chart_image(lessons, dpi=dpi))
+    if dpi == main.CHART_DPI:
+        # Every edit leaves most days as they were
+        assert main._TILE_STATS["hits"] - hits >= 3 * 2
+
+
+def test_tile_cache_stays_within_its_budget(monkeypatch):
+    main.init_renderer()
+    monkeypatch.setattr(main, "TILE_CACHE_BYTES", 200 * 1024)
+    monkeypatch.setattr(main, "_TILE_CACHE", main.OrderedDict())
+    monkeypatch.setitem(main._TILE_STATS, "bytes", 0)
+    for seed in range(4):
+        main.render_chart_image(typical(seed), dpi=40)
+    assert main._TILE_CACHE
+    assert main._TILE_STATS["bytes"] == sum(tile.nbytes for _, _, tile in main._TILE_CACHE.values()) <= 200 * 1024
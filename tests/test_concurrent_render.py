@@ -0,0 +1,92 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+import gc
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import matplotlib
+import numpy as np
+import pytest
+from matplotlib.figure import Figure
+from matplotlib.patches import Rectangle
+from matplotlib.text import Text
+
+import main
+from workloads import typical
+
+# Renders are drawn at a low DPI to keep the suite quick; raise
+# HAFTESOOZ_STRESS_RENDERS for a longer soak
+DPI = 20
+RENDERS = int(os.environ.get("HAFTESOOZ_STRESS_RENDERS", "1000"))
+THREADS = 8
+SCHEDULES = [typical(seed) for seed in range(12)]
+
+
+def _live(kind):
+    gc.collect()
+    return sum(1 for obj in gc.get_objects() if isinstance(obj, kind))
+
+
+def _render_all(indices):
+    with ThreadPoolExecutor(THREADS) as pool:
+        return list(pool.map(lambda i: (i, main.render_chart_image(SCHEDULES[i], dpi=DPI)), indices))
+
+
+@pytest.fixture(scope="module")
+def references():
+    main.init_renderer()
+    return [main.render_chart_image(lessons, dpi=DPI) for lessons in SCHEDULES]
+
+
+def test_concurrent_renders_match_serial_renders(references):
+    rng = random.Random(0)
+    # Warm up: one scaffold per thread gets built here
+    for i, pixels in _render_all([rng.randrange(len(SCHEDULES)) for _ in range(4 * THREADS)]):
+        assert np.array_equal(pixels, references[i])
+    counts = {kind: _live(kind) for kind in (Figure, Rectangle, Text)}
+    rc = dict(matplotlib.rcParams)
+
+    mismatches = [i for i, pixels in _render_all([rng.randrange(len(SCHEDULES)) for _ in range(RENDERS)])
+                  if not np.array_equal(pixels, references[i])]
+    assert not mismatches
+
+    # Nothing accumulates: no new figures, and every block and label is removed again
+    assert {kind: _live(kind) for kind in counts} == counts
+    scaffolds = main._CHART_SCAFFOLDS[(main.CHART_FIGSIZE, DPI)]
+    assert 1 <= len(scaffolds) <= THREADS + 1
+    assert all(not s.ax.patches and not s.ax.texts for s in scaffolds)
+    # The chart style never leaks into the global rcParams
+    assert dict(matplotlib.rcParams) == rc
+    assert matplotlib.rcParams["font.family"] == matplotlib.rcParamsDefault["font.family"]
+
+
+def test_failed_renders_leave_scaffolds_clean(references, monkeypatch):
+    add_artists = main._add_lesson_artists
+    rng = random.Random(1)
+
+    def flaky(ax, layout):
+        artists = add_artists(ax, layout)
+        if rng.random() < 0.3:
+            raise RuntimeError("render failed")
+        return artists
+
+    monkeypatch.setattr(main, "_add_lesson_artists", flaky)
+    failures = 0
+    with ThreadPoolExecutor(THREADS) as pool:
+        futures = [pool.submit(main.render_chart_image, SCHEDULES[i % len(SCHEDULES)], DPI)
+                   for i in range(RENDERS // 5)]
+        for i, future in enumerate(futures):
+            try:
+                assert np.array_equal(future.result(), references[i % len(SCHEDULES)])
+            except RuntimeError:
+                failures += 1
+    assert failures
+    monkeypatch.undo()
+
+    # A failure partway through adding artists leaves none behind on a scaffold
+    for i, pixels in _render_all(range(len(SCHEDULES))):
+        assert np.array_equal(pixels, references[i])
+    assert all(not s.ax.patches and not s.ax.texts for s in main._CHART_SCAFFOLDS[(main.CHART_FIGSIZE, DPI)])
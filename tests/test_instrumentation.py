@@ -0,0 +1,95 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import json
+import logging
+import time
+from collections import OrderedDict
+
+import main
+from conftest import LESSONS
+from instrumentation import Metrics, SamplingProfiler, Trace, count, span, traced, tracing
+
+
+def test_spans_and_counts_are_noops_without_a_trace():
+    with span("layout"):
+        count("blocks")
+    trace = Trace("request")
+    with tracing(trace):
+        with span("layout"):
+            count("blocks", 3)
+    assert trace.counts == {"blocks": 3} and trace.spans["layout"] > 0
+
+
+def test_job_traces_merge_into_the_request_trace():
+    def work():
+        with span("draw"):
+            time.sleep(0.03)
+        count("blocks", 2)
+        return "png"
+
+    result, data = traced(work, profile=True, interval=0.002)
+    assert result == "png"
+    assert data["samples"] and any("work" in stack for stack in data["samples"])
+
+    trace = Trace("request")
+    trace.merge(data)
+    trace.merge(data)
+    assert trace.counts["blocks"] == 4 and trace.spans["draw"] >= 0.06
+
+
+def test_metrics_text_format():
+    metrics = Metrics(buckets=(0.1, 1))
+    metrics.describe("stage_seconds", "histogram", "Time per stage.")
+    metrics.observe("stage_seconds", 0.5, stage="draw")
+    metrics.inc("requests_total", endpoint='/a"b', status="200")
+    metrics.gauge(lambda: [("render_in_flight", {}, 2)])
+    lines = metrics.render().splitlines()
+    assert "# TYPE haftesooz_stage_seconds histogram" in lines
+    assert 'haftesooz_stage_seconds_bucket{le="0.1",stage="draw"} 0' in lines
+    assert 'haftesooz_stage_seconds_bucket{le="1",stage="draw"} 1' in lines
+    assert 'haftesooz_stage_seconds_bucket{le="+Inf",stage="draw"} 1' in lines
+    assert 'haftesooz_requests_total{endpoint="/a\\"b",status="200"} 1' in lines
+    assert "haftesooz_render_in_flight 2" in lines
+
+
+def test_profiler_rate_bounds():
+    profiler = SamplingProfiler()
+    assert not profiler.should_profile()
+    profiler.configure(rate=5)
+    assert profiler.rate == 1.0 and profiler.should_profile()
+
+
+def test_metrics_endpoint_reports_stages_and_counters(client, caplog, monkeypatch):
+    # Other tests lay out the same lessons; a cached layout records no stage
+    monkeypatch.setattr(main, "_LAYOUT_CACHE", OrderedDict())
+    with caplog.at_level(logging.INFO, logger="haftesooz.requests"):
+        main.request_log.propagate = True
+        try:
+            assert client.post("/api/chart?format=svg", json=LESSONS).status_code == 200
+        finally:
+            main.request_log.propagate = False
+    text = client.get("/metrics").text
+    assert 'haftesooz_stage_seconds_count{stage="layout"}' in text
+    assert 'haftesooz_stage_seconds_count{stage="svg_encode"}' in text
+    assert 'haftesooz_requests_total{endpoint="/api/chart",method="POST",status="200"}' in text
+    assert "haftesooz_bytes_written_total" in text and "haftesooz_peak_rss_bytes" in text
+
+    record = json.loads([r.message for r in caplog.records if r.name == "haftesooz.requests"][-1])
+    assert record["endpoint"] == "/api/chart" and record["status"] == 200
+    assert "svg_encode" in record["stages_ms"] and record["counts"]["blocks"] == 1
+
+
+def test_profiler_can_be_toggled_at_runtime(client, monkeypatch):
+    assert client.post("/debug/profile?rate=1").status_code == 403
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "secret")
+    headers = {"X-Admin-Token": "secret"}
+    monkeypatch.setattr(main.profiler, "rate", 0.0)
+    assert client.post("/debug/profile?rate=1&interval=0.001&reset=true", headers=headers).json()["rate"] == 1.0
+    try:
+        client.post("/api/chart", json=LESSONS)
+    finally:
+        client.post("/debug/profile?rate=0", headers=headers)
+    assert main.profiler.stats()["profiled"] == 1
+    assert "render_chart_png" in client.get("/debug/profile", headers=headers).text
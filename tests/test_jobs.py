@@ -0,0 +1,127 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import asyncio
+import time
+
+import pytest
+
+from conftest import LESSONS
+from jobs import DONE, FAILED, Job, JobQueue, MemoryJobStore, QueueFull, SqliteJobStore, load_job_store
+
+
+@pytest.fixture
+def client(client):
+    # One portal for the whole test, so queue workers outlive single requests
+    with client:
+        yield client
+
+
+def wait_for(client, url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(url).json()
+        if job["status"] in (DONE, FAILED):
+            return job
+        time.sleep(0.05)
+    raise AssertionError("job did not finish")
+
+
+def test_job_renders_in_background_and_reports_chart_url(client):
+    created = client.post("/jobs?format=svg", json=LESSONS)
+    assert created.status_code == 202
+    job = created.json()
+    assert created.headers["location"] == job["status_url"]
+
+    finished = wait_for(client, job["status_url"])
+    assert finished["status"] == DONE
+    chart = client.get(finished["result"]["url"])
+    assert chart.headers["content-type"] == "image/svg+xml"
+
+    # Already rendered: the job is done on arrival
+    again = client.post("/jobs?format=svg", json=LESSONS).json()
+    assert again["status"] == DONE and again["result"]["url"] == finished["result"]["url"]
+    assert set(finished["result"]["timings"]) == {"queue", "render"}
+
+
+def test_job_events_stream_ends_with_final_state(client):
+    job = client.post("/jobs?format=pdf", json=LESSONS).json()
+    with client.stream("GET", job["events_url"]) as response:
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = [line[len("event: "):] for line in response.iter_lines() if line.startswith("event: ")]
+    assert events[-1] == DONE
+    assert set(events[:-1]) <= {"progress"}
+
+
+def test_conflicting_and_unknown_jobs(client):
+    clash = LESSONS + [{"name": "فیزیک", "units": 2, "schedules": [
+        {"day": "شنبه", "start_time": "09:00", "end_time": "11:00"}]}]
+    assert client.post("/jobs", json=clash).status_code == 409
+    assert client.get("/jobs/nope").status_code == 404
+    assert client.get("/jobs/nope/events").status_code == 404
+
+
+def test_queue_records_failures_and_bounds_its_length():
+    async def scenario():
+        store = MemoryJobStore()
+        queue = JobQueue(store, workers=1, max_queued=1)
+
+        async def boom(job_id):
+            raise RuntimeError("no fonts")
+
+        job = await queue.submit(boom)
+        while not (await store.get(job.id)).finished:
+            await store.wait(job.id, (await store.get(job.id)).version, 1)
+        failed = await store.get(job.id)
+        assert failed.status == FAILED and "no fonts" in failed.error["error"]
+
+        gate = asyncio.Event()
+
+        async def blocked(job_id):
+            await gate.wait()
+            return {}
+
+        await queue.submit(blocked)
+        await asyncio.sleep(0)  # taken by the worker
+        await queue.submit(blocked)
+        with pytest.raises(QueueFull):
+            await queue.submit(blocked)
+        gate.set()
+        await queue.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_job_store_is_pluggable():
+    assert isinstance(load_job_store(None), MemoryJobStore)
+    assert isinstance(load_job_store("jobs:MemoryJobStore"), MemoryJobStore)
+
+
+def test_sqlite_job_store_is_shared_and_bounded(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+
+    async def scenario():
+        # Two stores on one file stand in for two server workers
+        first = load_job_store("jobs:SqliteJobStore", path=path, max_jobs=2, ttl=60)
+        second = SqliteJobStore(path, max_jobs=2, ttl=60)
+        await first.save(Job(id="a"))
+        await second.update("a", status=DONE, result={"url": "/chart/x.png"})
+        job = await first.get("a")
+        assert job.status == DONE and job.version == 1 and job.result == {"url": "/chart/x.png"}
+
+        for job_id in "bc":
+            await second.save(Job(id=job_id))
+        assert await first.get("a") is None and await first.get("c") is not None
+        assert first.stats() == {"jobs": 2}
+
+        await first.save(Job(id="old", updated=0))
+        assert await second.get("old") is None
+
+    asyncio.run(scenario())
+
+
+def test_form_page_has_job_status_and_chart_modal(client):
+    page = client.get("/")
+    assert page.status_code == 200
+    assert 'id="job-status"' in page.text and 'id="chartModal"' in page.text
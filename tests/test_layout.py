@@ -0,0 +1,59 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import json
+
+import main
+from layout import BLOCK_HEIGHT, ChartLayout
+from main import Lesson, LessonSchedule
+
+LESSONS = [
+    Lesson(name="ریاضی عمومی ۱", units=3, schedules=[
+        LessonSchedule(day="شنبه", start_time="08:00", end_time="10:00"),
+        LessonSchedule(day="دوشنبه", start_time="08:00", end_time="10:00"),
+    ]),
+    Lesson(name="فیزیک پایه یک و آزمایشگاه", units=1, schedules=[
+        LessonSchedule(day="یکشنبه", start_time="10:00", end_time="11:00"),
+        LessonSchedule(day="نامعلوم", start_time="10:00", end_time="11:00"),
+    ]),
+]
+
+
+def test_blocks_are_placed_on_the_reversed_hour_axis():
+    engine = main.layout_engine
+    layout = engine.layout(LESSONS)
+    assert [(b.lesson, b.day, b.start, b.duration) for b in layout.blocks] == [
+        (0, 0, 2.0, 2.0), (0, 2, 2.0, 2.0), (1, 1, 4.0, 1.0)]
+
+    first, _, third = layout.blocks
+    # 08:00-10:00 ends two columns before 10:00's column start, counted from the right
+    assert abs(first.width - 2 * engine.col_w) < 1e-9
+    assert abs(first.height - BLOCK_HEIGHT * engine.row_h) < 1e-9
+    assert third.x + third.width < first.x + 1e-9
+    assert first.color != third.color
+
+
+def test_labels_fit_inside_their_blocks():
+    layout = main.layout_engine.layout(LESSONS)
+    for block in layout.blocks:
+        assert block.label[-1].text == f"({LESSONS[block.lesson].units} واحد)"
+        for line in block.label:
+            assert line.size == block.font_size
+            assert block.y < line.y < block.y + block.height
+            assert abs(line.x - (block.x + block.width / 2)) < 1e-9
+    # The long name does not fit a one-hour block on one line
+    assert len(layout.blocks[2].label) == 3
+
+
+def test_layout_round_trips_through_json():
+    layout = main.layout_engine.layout(LESSONS)
+    data = json.loads(json.dumps(layout.to_dict()))
+    restored = ChartLayout.from_dict(data)
+    assert restored.to_dict() == data
+    assert restored.blocks[0].shaped_label == layout.blocks[0].shaped_label
+    assert main.layout_engine.layout(LESSONS).to_dict() == layout.to_dict()
+
+
+def test_chart_layout_is_memoized():
+    assert main.chart_layout(LESSONS) is main.chart_layout(LESSONS)
@@ -0,0 +1,84 @@
+import asyncio
+import json
+import os
+import sys
+from urllib.parse import parse_qs
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+from loadgen import ROOT, LoadGenerator, capacity, form_body, load_corpus, nginx_config, percentile, write_corpus
+
+
+def test_corpus_round_trip_and_form_body(tmp_path):
+    path = tmp_path / "corpus.jsonl"
+    write_corpus(str(path), 20, seed=3)
+    corpus = load_corpus(str(path))
+    assert len(corpus) == 20
+    assert {entry["workload"] for entry in corpus} <= {"small", "typical", "pathological"}
+
+    lessons = json.loads(parse_qs(form_body(corpus[0]).decode())["lessons_data"][0])
+    assert lessons == corpus[0]["lessons_data"]
+    busted = json.loads(parse_qs(form_body(corpus[0], "x1").decode())["lessons_data"][0])
+    assert busted[0]["name"] == corpus[0]["lessons_data"][0]["name"] + " x1"
+    assert busted[1:] == lessons[1:]
+
+
+def test_percentile_and_capacity():
+    ordered = [i / 100 for i in range(1, 101)]
+    assert percentile(ordered, 50) == 0.5
+    assert percentile(ordered, 99) == 0.99
+    assert percentile([], 50) is None
+
+    steps = [
+        {"concurrency": 1, "throughput_rps": 1.0, "p99_s": 1.0, "error_rate": 0.0},
+        {"concurrency": 4, "throughput_rps": 3.0, "p99_s": 4.0, "error_rate": 0.0},
+        {"concurrency": 16, "throughput_rps": 3.5, "p99_s": 20.0, "error_rate": 0.0},
+        {"concurrency": 32, "throughput_rps": 5.0, "p99_s": 2.0, "error_rate": 0.2},
+    ]
+    assert capacity(steps, p99_limit=5.0, max_error_rate=0.01)["concurrency"] == 4
+    assert capacity(steps, p99_limit=0.5, max_error_rate=0.01) is None
+
+
+def test_nginx_config_is_rewritten_for_local_run(tmp_path):
+    config = nginx_config(os.path.join(ROOT, "nginx.conf"), str(tmp_path), 18080, 18000)
+    assert "server 127.0.0.1:18000;" in config
+    assert "listen 127.0.0.1:18080;" in config
+    assert "/var/log/nginx" not in config and "/app/" not in config
+    assert f"pid {tmp_path}/nginx.pid;" in config
+    assert "proxy_http_version 1.1;" in config
+
+
+def test_load_generator_step_against_local_server(tmp_path):
+    async def run():
+        async def handle(reader, writer):
+            try:
+                while True:
+                    headers = []
+                    while True:
+                        line = await reader.readline()
+                        if not line:
+                            return
+                        if line == b"\r\n":
+                            break
+                        headers.append(line)
+                    length = next(int(h.split(b":")[1]) for h in headers if h.lower().startswith(b"content-length"))
+                    await reader.readexactly(length)
+                    body = b'<img src="/chart/x.png">'
+                    writer.write(b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n"
+                                 + b"%x\r\n" % len(body) + body + b"\r\n0\r\n\r\n")
+                    await writer.drain()
+            finally:
+                writer.close()
+
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        corpus = [{"lessons_data": [{"name": "a", "units": 1, "schedules": []}]}]
+        async with server:
+            return (await LoadGenerator(f"http://127.0.0.1:{port}", corpus).step(3, 0.2)).summary()
+
+    summary = asyncio.run(run())
+    assert summary["requests"] > 3
+    assert summary["errors"] == 0
+    assert summary["statuses"] == {"200": summary["requests"]}
+    assert summary["p50_s"] is not None
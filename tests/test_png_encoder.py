@@ -0,0 +1,115 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import io
+import socket
+import threading
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import main
+from instrumentation import traced
+from png_encoder import PngProfile, encode_png, quantize
+from main import Lesson, LessonSchedule
+
+LESSONS = [
+    Lesson(name="ریاضی", units=3, schedules=[
+        LessonSchedule(day="شنبه", start_time="06:00", end_time="08:00"),
+        LessonSchedule(day="یکشنبه", start_time="10:00", end_time="12:00"),
+    ]),
+    Lesson(name="فیزیک پایه یک و آزمایشگاه فیزیک", units=2, schedules=[
+        LessonSchedule(day="جمعه", start_time="20:00", end_time="22:00"),
+    ]),
+]
+
+
+@pytest.fixture(scope="module")
+def chart():
+    main.init_renderer()
+    return main.render_chart_image(LESSONS)
+
+
+def _decode(data):
+    return Image.open(io.BytesIO(data))
+
+
+def test_palette_png_keeps_flat_colors_exact(chart):
+    data, trace = traced(encode_png, chart, PngProfile("print"))
+    image = _decode(data)
+    assert image.mode == "P"
+    pixels = np.asarray(image.convert("RGB")).astype(int)
+    error = np.abs(pixels - chart[..., :3]).max(axis=2)
+    # The flat colors (white, the lesson fills, black, the grid) come out
+    # exactly; only antialiased edge pixels move, and not far
+    rgb = chart[..., :3].astype(np.uint32)
+    packed = rgb[..., 0] << 16 | rgb[..., 1] << 8 | rgb[..., 2]
+    colors, counts = np.unique(packed, return_counts=True)
+    for color in colors[np.argsort(-counts)[:10]]:
+        assert error[packed == color].max() == 0, hex(color)
+    assert error.max() <= 16 and error.mean() < 0.1
+    assert trace["counts"]["png_print_bytes"] == len(data)
+    assert trace["counts"]["png_print_raw_bytes"] == chart.shape[0] * chart.shape[1] * 3
+    assert {"png_print_quantize", "png_print_deflate"} <= set(trace["spans"])
+
+
+def test_palette_png_is_smaller_than_truecolor(chart):
+    palette = encode_png(chart, PngProfile("print"))
+    truecolor = encode_png(chart, PngProfile("print", colors=0))
+    assert _decode(truecolor).mode == "RGB"
+    assert np.array_equal(np.asarray(_decode(truecolor)), chart[..., :3])
+    assert len(palette) < 0.8 * len(truecolor)
+
+
+def test_few_colors_are_encoded_losslessly():
+    rng = np.random.default_rng(0)
+    pixels = rng.choice(np.array([[255, 255, 255], [104, 212, 204], [0, 0, 0]], dtype=np.uint8), size=(40, 60))
+    image = quantize(pixels)
+    assert len(image.getpalette()) == 9
+    assert np.array_equal(np.asarray(image.convert("RGB")), pixels)
+
+
+def test_optimize_passes_never_grow_the_output(chart):
+    plain = encode_png(chart, PngProfile("preview", level=1))
+    optimized, trace = traced(encode_png, chart, PngProfile("preview", level=1, optimize=True))
+    assert len(optimized) <= len(plain)
+    assert trace["counts"]["png_preview_optimize_saved_bytes"] == len(plain) - len(optimized)
+    assert np.array_equal(np.asarray(_decode(optimized)), np.asarray(_decode(plain)))
+
+
+def test_profiles_parse_and_validate():
+    profile = PngProfile.parse("print", "colors=0, level=9,strategy=filtered,optimize=yes,passes=rle+default")
+    assert profile == PngProfile("print", colors=0, level=9, strategy="filtered", optimize=True,
+                                 passes=("rle", "default"))
+    assert PngProfile.parse("preview", "") == PngProfile("preview")
+    for spec in ("level=10", "colors=300", "strategy=best", "speed=1", "level"):
+        with pytest.raises(ValueError):
+            PngProfile.parse("print", spec)
+
+
+def test_png_is_written_straight_into_files_descriptors_and_sockets(chart, tmp_path):
+    profile = PngProfile("print")
+    expected = encode_png(chart, profile)
+
+    with open(tmp_path / "file.png", "wb") as f:
+        assert encode_png(chart, profile, out=f) == len(expected)
+    fd = os.open(tmp_path / "fd.png", os.O_WRONLY | os.O_CREAT)
+    try:
+        assert encode_png(chart, profile, out=fd) == len(expected)
+    finally:
+        os.close(fd)
+    assert (tmp_path / "file.png").read_bytes() == (tmp_path / "fd.png").read_bytes() == expected
+
+    sender, receiver = socket.socketpair()
+    received = []
+    reader = threading.Thread(target=lambda: received.extend(iter(lambda: receiver.recv(65536), b"")))
+    reader.start()
+    try:
+        assert encode_png(chart, PngProfile("preview", optimize=True), out=sender) > 0
+    finally:
+        sender.close()
+        reader.join()
+        receiver.close()
+    assert b"".join(received) == encode_png(chart, PngProfile("preview", optimize=True))
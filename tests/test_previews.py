@@ -0,0 +1,80 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import io
+import json
+import re
+import time
+
+import pytest
+from PIL import Image
+
+import main
+from conftest import LESSONS
+
+
+def _post_form(client):
+    page = client.post("/generate_chart", data={"lessons_data": json.dumps(LESSONS)}).text
+    preview = re.search(r'src="/chart/([^"]+)"', page).group(1)
+    download = re.search(r'href="/chart/([^"]+)"\s+download', page).group(1)
+    return preview, download
+
+
+def test_form_renders_only_the_preview(client, tmp_path):
+    preview, download = _post_form(client)
+    assert preview.endswith(".preview.png")
+    assert download == preview.replace(".preview.png", ".png")
+    assert (tmp_path / preview).exists()
+    assert not (tmp_path / download).exists()
+
+    image = Image.open(tmp_path / preview)
+    assert image.width <= main.PREVIEW_WIDTH
+    for fmt in main.preview_formats():
+        assert (tmp_path / preview.replace(".png", f".{fmt}")).exists()
+
+
+def test_preview_is_negotiated_on_accept(client):
+    preview, _ = _post_form(client)
+    plain = client.get(f"/chart/{preview}")
+    assert plain.headers["content-type"] == "image/png"
+    assert plain.headers["vary"] == "Accept"
+
+    if "webp" not in main.preview_formats():
+        pytest.skip("Pillow was built without WebP")
+    webp = client.get(f"/chart/{preview}", headers={"Accept": "image/webp,image/*;q=0.8"})
+    assert webp.headers["content-type"] == "image/webp"
+    assert webp.headers["content-location"].endswith(".preview.webp")
+    assert webp.headers["etag"] != plain.headers["etag"]
+    assert len(webp.content) < len(plain.content)
+    refused = client.get(f"/chart/{preview}", headers={"Accept": "image/webp;q=0, image/png"})
+    assert refused.headers["content-type"] == "image/png"
+
+
+def test_full_resolution_is_encoded_on_first_download(client, tmp_path):
+    preview, download = _post_form(client)
+    full = client.get(f"/chart/{download}")
+    assert full.status_code == 200
+    assert full.headers["content-type"] == "image/png"
+    assert (tmp_path / download).exists()
+    # Same image as rendering the schedule directly
+    direct = client.post("/api/chart", json=LESSONS)
+    assert direct.headers["content-location"] == f"/chart/{download}"
+    assert Image.open(io.BytesIO(full.content)).size == Image.open(io.BytesIO(direct.content)).size
+    assert Image.open(io.BytesIO(full.content)).width > 3 * Image.open(tmp_path / preview).width
+
+    (tmp_path / download).unlink()
+    (tmp_path / preview.replace(".preview.png", ".lessons.json")).unlink()
+    main.chart_cache = main.ChartCache(str(tmp_path))
+    assert client.get(f"/chart/{download}").status_code == 404
+
+
+def test_preview_job_reports_download_url(client):
+    with client:
+        job = client.post("/jobs?format=preview", json=LESSONS).json()
+        while job["status"] not in ("done", "failed"):
+            time.sleep(0.05)
+            job = client.get(job["status_url"]).json()
+    assert job["status"] == "done"
+    assert job["result"]["url"].endswith(".preview.png")
+    assert job["result"]["download_url"] == job["result"]["url"].replace(".preview.png", ".png")
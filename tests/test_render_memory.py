@@ -0,0 +1,47 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import json
+import subprocess
+
+import main
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+
+# Runs in a fresh interpreter, so ru_maxrss only reflects these renders
+PROBE = """
+import json, os, resource, sys
+sys.path.insert(0, "benchmarks")
+
+def peak():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+import main
+from workloads import pathological, typical
+
+main.init_renderer()
+imported = peak()
+main.render_chart_png(typical(0))
+main.render_chart_previews(typical(0))
+warm = peak()
+with open(os.devnull, "wb") as sink:
+    for seed in range(6):
+        main.render_chart_png(pathological(seed), out=sink.fileno())
+        main.render_chart_previews(typical(seed + 1))
+print(json.dumps({"imported": imported, "warm": warm, "after": peak()}))
+"""
+
+
+def test_peak_rss_per_render_is_bounded():
+    env = dict(os.environ, HAFTESOOZ_REQUEST_LOG="0")
+    out = subprocess.run([sys.executable, "-c", PROBE], cwd=ROOT, env=env, check=True,
+                         capture_output=True, text=True).stdout
+    rss = json.loads(out.strip().splitlines()[-1])
+    canvas = main.PNG_RENDER_COST
+    # The first render builds the reused scaffold (canvas plus background)
+    # and the quantizer tables; it used to peak at over 5 canvases
+    assert rss["warm"] - rss["imported"] < 3 * canvas, rss
+    # Later renders, however heavy, run in the buffers that are already there;
+    # only the day-row tile cache grows, up to its budget
+    assert rss["after"] - rss["warm"] < 32 * 1024 * 1024 + main.TILE_CACHE_BYTES, rss
@@ -0,0 +1,96 @@
+import sys
+import os
+import asyncio
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+
+from render_pool import RenderCrashed, RenderPool, RenderTimeout
+
+
+def _square(x):
+    return x * x
+
+
+def _sleep(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def _die():
+    os._exit(1)
+
+
+def _raise():
+    raise ValueError("bad payload")
+
+
+def _run(pool, fn, *args):
+    return asyncio.run(pool.run(fn, *args))
+
+
+def test_renders_in_worker_and_reports_stats():
+    pool = RenderPool(workers=2, timeout=10)
+    pool.start()
+    try:
+        assert _run(pool, _square, 7) == 49
+        stats = pool.stats()
+        assert stats["completed"] == 1 and stats["in_flight"] == 0
+    finally:
+        pool.shutdown()
+
+
+def test_timeout_kills_render_and_pool_recovers():
+    pool = RenderPool(workers=1, timeout=0.5)
+    try:
+        with pytest.raises(RenderTimeout):
+            _run(pool, _sleep, 30)
+        assert _run(pool, _square, 3) == 9
+        assert pool.stats()["timeouts"] == 1
+    finally:
+        pool.shutdown()
+
+
+def test_thread_timeout_reports_the_render_still_running():
+    pool = RenderPool(workers=0, timeout=0.2)
+    try:
+        with pytest.raises(RenderTimeout, match="still running"):
+            _run(pool, _sleep, 1)
+        assert pool.stats()["timeouts"] == 1
+    finally:
+        pool.shutdown()
+
+
+def test_crashing_worker_does_not_take_down_the_pool():
+    pool = RenderPool(workers=1, timeout=10)
+    try:
+        with pytest.raises(RenderCrashed):
+            _run(pool, _die)
+        assert _run(pool, _square, 4) == 16
+        assert pool.stats()["crashes"] == 2
+    finally:
+        pool.shutdown()
+
+
+def test_payload_errors_propagate():
+    pool = RenderPool(workers=0, timeout=10)
+    with pytest.raises(ValueError):
+        _run(pool, _raise)
+    assert pool.stats()["failed"] == 1
+
+
+def test_in_process_pool_runs_renders_on_threads():
+    pool = RenderPool(workers=0, timeout=10, threads=4)
+    assert pool.capacity == 4
+
+    async def burst():
+        return await asyncio.gather(*(pool.run(_sleep, 0.3) for _ in range(4)))
+
+    started = time.perf_counter()
+    try:
+        assert asyncio.run(burst()) == [0.3] * 4
+    finally:
+        pool.shutdown()
+    assert time.perf_counter() - started < 1.0
+    assert pool.stats()["threads"] == 4 and pool.stats()["completed"] == 4
@@ -0,0 +1,69 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from models import Lesson, LessonSchedule
+from schedule import WeekSchedule, parse_minutes, slot_mask
+
+
+def lesson(name, *meetings):
+    return Lesson(name=name, units=3, schedules=[
+        LessonSchedule(day=day, start_time=start, end_time=end) for day, start, end in meetings])
+
+
+def test_parse_minutes():
+    assert parse_minutes("10:30") == 630
+    assert parse_minutes("8") == 480
+    assert parse_minutes("24:00") == 1440
+    for bad in ("10:60", "25:00", "ten", "10:3"):
+        with pytest.raises(ValueError):
+            parse_minutes(bad)
+
+
+def test_slot_mask_covers_half_open_range():
+    assert slot_mask(600, 630) & slot_mask(630, 660) == 0
+    assert bin(slot_mask(600, 630)).count("1") == 30
+
+
+def test_half_hour_overlap_is_detected_and_touching_is_not():
+    week = WeekSchedule([lesson("ریاضی", ("شنبه", "08:00", "10:30")),
+                         lesson("فیزیک", ("شنبه", "10:00", "12:00")),
+                         lesson("شیمی", ("شنبه", "12:00", "13:00"))])
+    conflicts = week.conflicts()
+    assert len(conflicts) == 1
+    assert conflicts[0].overlap_minutes == 30
+    assert conflicts[0].time1 == "08:00-10:30"
+    assert "ریاضی" in conflicts[0] and "فیزیک" in conflicts[0]
+    assert week.is_free(0, 13 * 60, 14 * 60) and not week.is_free(0, 690, 720)
+
+
+def test_every_overlapping_pair_is_reported_including_same_lesson():
+    week = WeekSchedule([lesson("ریاضی", ("یکشنبه", "08:00", "11:00"), ("یکشنبه", "10:00", "12:00")),
+                         lesson("فیزیک", ("یکشنبه", "09:00", "10:30"))])
+    pairs = {(c.lesson1, c.lesson2, c.time1, c.time2) for c in week.conflicts()}
+    assert pairs == {("ریاضی", "فیزیک", "08:00-11:00", "09:00-10:30"),
+                     ("ریاضی", "ریاضی", "08:00-11:00", "10:00-12:00"),
+                     ("فیزیک", "ریاضی", "09:00-10:30", "10:00-12:00")}
+
+
+def test_layout_places_blocks_to_the_minute():
+    block, = main.chart_layout([lesson("ریاضی", ("شنبه", "10:30", "12:00"))]).blocks
+    assert block.start == pytest.approx(4.5)
+    assert block.duration == pytest.approx(1.5)
+
+
+def test_api_rejects_conflicts_before_rendering(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "chart_cache", main.ChartCache(str(tmp_path)))
+    client = TestClient(main.app)
+    payload = [{"name": "ریاضی", "units": 3, "schedules": [{"day": "شنبه", "start_time": "08:00", "end_time": "10:30"}]},
+               {"name": "فیزیک", "units": 2, "schedules": [{"day": "شنبه", "start_time": "10:00", "end_time": "11:00"}]}]
+    response = client.post("/api/chart", json=payload)
+    assert response.status_code == 409
+    conflict, = response.json()["conflicts"]
+    assert conflict["overlap_minutes"] == 30
+    assert conflict["message"].startswith("تداخل: ریاضی و فیزیک")
+    assert not list(tmp_path.glob("schedule_*"))
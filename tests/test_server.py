@@ -0,0 +1,105 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+import json
+import signal
+import subprocess
+import time
+import urllib.request
+import uuid
+
+import pytest
+
+from loadgen import ROOT, free_port, wait_ready
+
+LESSONS = [{"name": "ریاضی", "units": 3, "schedules": [
+    {"day": "شنبه", "start_time": "08:00", "end_time": "10:00"}]}]
+
+
+def _children(pid):
+    # Listed per thread that forked them; the render pool is started off the main thread
+    children = []
+    for task in os.listdir(f"/proc/{pid}/task"):
+        try:
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                children.extend(int(child) for child in f.read().split())
+        except FileNotFoundError:
+            pass
+    return sorted(children)
+
+
+def _post(url, body):
+    request = urllib.request.Request(url, data=json.dumps(body).encode(),
+                                     headers={"Content-Type": "application/json", "Connection": "close"})
+    with urllib.request.urlopen(request) as response:
+        return response.headers, json.loads(response.read()) if "json" in response.headers["content-type"] else None
+
+
+@pytest.fixture
+def server(tmp_path):
+    port = free_port()
+    # Charts, the cache index and the job database all go under the charts directory
+    env = dict(os.environ, HAFTESOOZ_REQUEST_LOG="0", HAFTESOOZ_CHARTS_DIR=str(tmp_path))
+    env.pop("HAFTESOOZ_RENDER_WORKERS", None)
+    process = subprocess.Popen([sys.executable, "server.py", "--workers", "2", "--port", str(port),
+                                "--no-access-log", "--log-level", "warning", "--graceful-timeout", "5"],
+                               cwd=ROOT, env=env)
+    try:
+        url = f"http://127.0.0.1:{port}"
+        wait_ready(url + "/health", timeout=120)
+        yield process, url
+    finally:
+        if process.poll() is None:
+            workers = _children(process.pid)
+            process.kill()
+            process.wait()
+            for worker in workers:
+                try:
+                    os.killpg(worker, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+
+def test_workers_share_charts_and_jobs_and_are_replaced(server):
+    process, url = server
+    workers = _children(process.pid)
+    lessons = [dict(LESSONS[0], name=f"ریاضی {uuid.uuid4().hex[:8]}")]
+    assert len(workers) == 2
+    # Each worker renders in a process of its own, started with its app
+    deadline = time.monotonic() + 60
+    while not all(_children(worker) for worker in workers):
+        assert time.monotonic() < deadline, "workers have no render process"
+        time.sleep(0.2)
+
+    headers, _ = _post(url + "/api/chart?format=svg", lessons)
+    assert headers["X-Cache"] == "miss"
+    # A rendered chart is stored after its response has gone out
+    deadline = time.monotonic() + 10
+    while _post(url + "/api/chart?format=svg", lessons)[0]["X-Cache"] != "hit":
+        assert time.monotonic() < deadline
+        time.sleep(0.1)
+    # Each request is a new connection, so both workers answer some of these
+    assert {_post(url + "/api/chart?format=svg", lessons)[0]["X-Cache"] for _ in range(10)} == {"hit"}
+
+    _, job = _post(url + "/jobs?format=pdf", lessons)
+    for _ in range(10):
+        with urllib.request.urlopen(urllib.request.Request(url + job["status_url"],
+                                                           headers={"Connection": "close"})) as response:
+            assert response.status == 200
+
+    render_processes = _children(workers[0])
+    os.kill(workers[0], signal.SIGKILL)
+    deadline = time.monotonic() + 30
+    while len(_children(process.pid)) < 2 or workers[0] in _children(process.pid):
+        assert time.monotonic() < deadline, "worker was not replaced"
+        time.sleep(0.2)
+    # The dead worker's render process goes with it
+    deadline = time.monotonic() + 10
+    while any(os.path.exists(f"/proc/{pid}") for pid in render_processes):
+        assert time.monotonic() < deadline, "render process outlived its worker"
+        time.sleep(0.1)
+
+    process.send_signal(signal.SIGTERM)
+    assert process.wait(30) == 0
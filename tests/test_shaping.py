@@ -0,0 +1,33 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from shaping import PersianShaper, shape_line_uncached
+
+
+def test_cached_shaping_matches_uncached():
+    shaper = PersianShaper()
+    text = "فیزیک پایه\n(2 واحد)"
+    expected = "\n".join(shape_line_uncached(line) for line in text.split("\n"))
+    assert shaper.shape(text) == expected
+    assert shaper.shape(text) == expected
+    assert shaper.stats()["hits"] == 2 and shaper.stats()["misses"] == 2
+
+
+def test_batch_shapes_each_distinct_line_once():
+    shaper = PersianShaper()
+    shaped = shaper.shape_many(["ریاضی\n(3 واحد)", "فیزیک\n(3 واحد)", ""])
+    assert shaped[2] == ""
+    assert shaped[0].split("\n")[1] == shaped[1].split("\n")[1]
+    assert shaper.stats()["misses"] == 3
+
+
+def test_lru_is_bounded_and_pinned_entries_stay():
+    shaper = PersianShaper(maxsize=2)
+    shaper.preload(["شنبه"])
+    for word in ["یک", "دو", "سه"]:
+        shaper.shape(word)
+    stats = shaper.stats()
+    assert stats["cached"] == 2 and stats["pinned"] == 1
+    shaper.shape("شنبه")
+    assert shaper.stats()["misses"] == 3
@@ -0,0 +1,82 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import itertools
+import json
+import random
+
+from fastapi.testclient import TestClient
+
+import main
+from models import DAY_NAMES, CourseSections, Lesson, LessonSchedule, Section
+from schedule import WeekSchedule
+from solver import TimetableSolver
+
+
+def course(name, *sections):
+    return CourseSections(name=name, units=3, sections=[
+        Section(label=str(i + 1), schedules=[LessonSchedule(day=d, start_time=s, end_time=e) for d, s, e in meetings])
+        for i, meetings in enumerate(sections)])
+
+
+def random_courses(count, sections, seed):
+    rng = random.Random(seed)
+
+    def meeting():
+        start = rng.randint(7, 18) * 60 + rng.choice([0, 30])
+        end = start + rng.choice([60, 90, 120])
+        return (rng.choice(DAY_NAMES[:6]), f"{start // 60:02d}:{start % 60:02d}", f"{end // 60:02d}:{end % 60:02d}")
+
+    return [course(f"درس {i}", *[[meeting(), meeting()] for _ in range(sections)]) for i in range(count)]
+
+
+def test_matches_brute_force():
+    courses = random_courses(5, 4, seed=3)
+    expected = set()
+    for combo in itertools.product(range(4), repeat=5):
+        lessons = [Lesson(name=c.name, units=c.units, schedules=c.sections[s].schedules)
+                   for c, s in zip(courses, combo)]
+        if not WeekSchedule(lessons).has_conflicts():
+            expected.add(combo)
+    solver = TimetableSolver(courses)
+    assert {t.sections for t in solver.solve()} == expected
+    assert solver.stats["complete"]
+
+
+def test_sections_that_clash_internally_are_never_chosen():
+    solver = TimetableSolver([course("ریاضی", [("شنبه", "08:00", "10:00"), ("شنبه", "09:00", "11:00")],
+                                     [("یکشنبه", "08:00", "10:00")])])
+    assert [t.sections for t in solver.solve()] == [(1,)]
+
+
+def test_compact_ranking_prefers_fewer_days_then_less_idle_time():
+    courses = [course("ریاضی", [("شنبه", "08:00", "10:00")], [("دوشنبه", "08:00", "10:00")]),
+               course("فیزیک", [("شنبه", "13:00", "15:00")], [("شنبه", "10:00", "12:00")])]
+    ranked = list(TimetableSolver(courses).solve(rank="compact"))
+    assert [t.sections for t in ranked] == [(0, 1), (0, 0), (1, 0), (1, 1)]
+    assert ranked[0].score == (1, 0) and ranked[1].score == (1, 180)
+
+
+def test_large_instances_stay_within_budget():
+    solver = TimetableSolver(random_courses(12, 6, seed=7))
+    first = list(solver.solve(limit=20, time_budget=5))
+    assert first and solver.stats["nodes"] < 10000
+    ranked = list(solver.solve(limit=5, rank="compact", time_budget=0.5))
+    assert len(ranked) == 5
+    assert solver.stats["complete"] or solver.stats["timed_out"]
+
+
+def test_api_streams_timetables_then_a_summary():
+    courses = [{"name": "ریاضی", "units": 3, "sections": [
+                   {"label": "۱", "schedules": [{"day": "شنبه", "start_time": "۰۸:۰۰", "end_time": "10:00"}]},
+                   {"label": "2", "schedules": [{"day": "دوشنبه", "start_time": "8", "end_time": "10"}]}]},
+               {"name": "فیزیک", "units": 2, "sections": [
+                   {"schedules": [{"day": "شنبه", "start_time": "09:00", "end_time": "11:00"}]}]}]
+    response = TestClient(main.app).post("/api/solve", json=courses)
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert len(lines) == 2
+    assert lines[0]["sections"] == ["2", "1"]
+    assert lines[0]["lessons"][0]["schedules"] == [{"day": "دوشنبه", "start_time": "08:00", "end_time": "10:00"}]
+    assert lines[-1]["done"] and lines[-1]["complete"]
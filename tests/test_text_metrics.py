@@ -0,0 +1,41 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from main import PERSIAN_FONT, _maybe_shape_persian
+from text_metrics import TextMetrics
+
+
+def test_extent_matches_matplotlib_layout():
+    fig = Figure(figsize=(6, 4))
+    FigureCanvasAgg(fig)
+    metrics = TextMetrics(PERSIAN_FONT, dpi=fig.dpi)
+    label = _maybe_shape_persian("فیزیک پایه\n(2 واحد)")
+    for size in (10, 21, 32):
+        text = fig.text(0.5, 0.5, label, fontsize=size, fontweight="bold",
+                        fontproperties=PERSIAN_FONT)
+        bbox = text.get_window_extent(renderer=fig.canvas.get_renderer())
+        width, height = metrics.extent(label, size, "bold")
+        assert abs(bbox.width - width) < 1e-6
+        assert abs(bbox.height - height) < 1e-6
+        text.remove()
+
+
+def test_fit_prefers_split_label_in_narrow_box():
+    metrics = TextMetrics(PERSIAN_FONT, dpi=100)
+    one_line = "word word word word\n(3)"
+    two_lines = "word word\nword word\n(3)"
+    text, size = metrics.fit([one_line, two_lines], 80, 200, max_size=32, min_size=6)
+    assert text == two_lines
+    assert metrics.fits(text, size, 80, 200)
+    assert not metrics.fits(text, size + 1, 80, 200)
+
+
+def test_fit_falls_back_to_min_size():
+    metrics = TextMetrics(PERSIAN_FONT, dpi=100)
+    assert metrics.fit(["a very long label"], 5, 5, max_size=32, min_size=10) == ("a very long label", 10)
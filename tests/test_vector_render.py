@@ -0,0 +1,54 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import re
+import xml.etree.ElementTree as ET
+
+import main
+from main import Lesson, LessonSchedule
+
+LESSONS = [
+    Lesson(name="ریاضی عمومی ۱", units=3, schedules=[
+        LessonSchedule(day="شنبه", start_time="08:00", end_time="10:00"),
+    ]),
+    Lesson(name="Data <Structures> & Algorithms", units=3, schedules=[
+        LessonSchedule(day="یکشنبه", start_time="13:00", end_time="15:00"),
+    ]),
+]
+
+
+def test_vector_output_is_byte_identical_for_identical_input():
+    for fmt in ("svg", "pdf"):
+        first = main.render_chart_document(LESSONS, fmt)
+        assert main.render_chart_document([l.model_copy(deep=True) for l in LESSONS], fmt) == first
+        assert main.render_chart_document(LESSONS[:1], fmt) != first
+
+
+def test_svg_is_well_formed_and_keeps_logical_text():
+    root = ET.fromstring(main.render_chart_document(LESSONS, "svg"))
+    ns = "{http://www.w3.org/2000/svg}"
+    texts = {t.text: t for t in root.iter(f"{ns}text")}
+    # Text is left for the viewer to shape, so it is stored unshaped
+    assert texts["(3 واحد)"].get("direction") == "rtl"
+    assert any("<Structures>" in t for t in texts)
+    assert texts["شنبه"].get("class") == "b"
+    assert len(root.findall(f"{ns}g/{ns}rect")) == 2
+    assert "Vazirmatn" in root.find(f"{ns}style").text
+
+
+def test_vector_layout_matches_png_size():
+    layout = main.chart_layout(LESSONS)
+    width, height = layout.width, layout.height
+    png_h, png_w = main.render_chart_image(LESSONS).shape[:2]
+    assert abs(width * main.CHART_DPI / 72 - png_w) < 2
+    assert abs(height * main.CHART_DPI / 72 - png_h) < 2
+
+
+def test_pdf_cross_reference_offsets_point_at_objects():
+    pdf = main.render_chart_document(LESSONS, "pdf")
+    xref = int(re.search(rb"startxref\n(\d+)", pdf).group(1))
+    assert pdf[xref:].startswith(b"xref")
+    offsets = [int(o) for o in re.findall(rb"(\d{10}) 00000 n", pdf)]
+    for number, offset in enumerate(offsets, start=1):
+        assert pdf[offset:].startswith(b"%d 0 obj" % number)
@@ -0,0 +1,190 @@
+import io
+import os
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from wsgiref.util import setup_testing_defaults
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from wsgi_proxy import BackendSupervisor, ProxyApp
+
+BIG = bytes(range(256)) * (3 * 1024 * 1024 // 256)
+
+
+class Backend(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    seen = []
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, body, headers=(), reason=None):
+        self.send_response(status, reason)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        Backend.seen.append((self.path, dict(self.headers)))
+        if self.path == "/big":
+            self._reply(200, BIG, [("Content-Type", "image/png")])
+        elif self.path == "/chunked":
+            self.send_response(200)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for part in (b"hello ", b"world"):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(part), part))
+            self.wfile.write(b"0\r\n\r\n")
+        elif self.path == "/cookies":
+            self._reply(200, b"", [("Set-Cookie", "a=1"), ("Set-Cookie", "b=2")])
+        else:
+            self._reply(404, b"missing", reason="Not Found Here")
+
+    def do_POST(self):
+        if self.headers.get("Transfer-Encoding") == "chunked":
+            body = b""
+            while True:
+                size = int(self.rfile.readline(), 16)
+                if not size:
+                    self.rfile.readline()
+                    break
+                body += self.rfile.read(size)
+                self.rfile.readline()
+        else:
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+        self._reply(201, body, [("Content-Type", self.headers.get("Content-Type", "")),
+                                ("X-Forwarded", self.headers.get("X-Forwarded-For", "")),
+                                ("X-Client", self.headers.get("X-Real-IP", ""))])
+
+
+@pytest.fixture(scope="module")
+def backend():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Backend)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.server_address[1]
+    server.shutdown()
+
+
+def call(app, path, method="GET", body=b"", **environ):
+    env = {"REQUEST_METHOD": method, "PATH_INFO": path, "wsgi.input": io.BytesIO(body),
+           "REMOTE_ADDR": "10.0.0.7"}
+    if body and "HTTP_TRANSFER_ENCODING" not in environ:
+        env["CONTENT_LENGTH"] = str(len(body))
+    env.update(environ)
+    setup_testing_defaults(env)
+    captured = {}
+
+    def start_response(status, headers):
+        captured["status"], captured["headers"] = status, headers
+
+    result = app(env, start_response)
+    try:
+        data = b"".join(result)
+    finally:
+        getattr(result, "close", lambda: None)()
+    return captured["status"], captured["headers"], data
+
+
+def test_status_headers_and_bodies_pass_through(backend):
+    app = ProxyApp("127.0.0.1", backend)
+    status, headers, data = call(app, "/big")
+    assert status == "200 OK"
+    assert data == BIG
+    assert ("Content-Type", "image/png") in headers
+
+    status, _, data = call(app, "/nope")
+    assert status == "404 Not Found Here"
+    assert data == b"missing"
+
+    _, headers, _ = call(app, "/cookies")
+    assert [v for k, v in headers if k == "Set-Cookie"] == ["a=1", "b=2"]
+
+    status, headers, data = call(app, "/chunked")
+    assert data == b"hello world"
+    assert not any(k.lower() == "transfer-encoding" for k, _ in headers)
+
+
+def test_connections_are_reused(backend):
+    app = ProxyApp("127.0.0.1", backend, pool_size=2)
+    for _ in range(5):
+        call(app, "/big")
+    stats = app.stats()["pool"]
+    assert stats["created"] == 1
+    assert stats["reused"] == 4
+
+
+def test_request_bodies_are_forwarded(backend):
+    app = ProxyApp("127.0.0.1", backend, buffer_limit=1024)
+    body = b"lessons_data=" + b"x" * 200000
+    status, headers, data = call(app, "/generate_chart", "POST", body,
+                                 CONTENT_TYPE="application/x-www-form-urlencoded", HTTP_X_REAL_IP="1.2.3.4")
+    assert status == "201 Created"
+    assert data == body
+    assert ("Content-Type", "application/x-www-form-urlencoded") in headers
+    assert ("X-Forwarded", "10.0.0.7") in headers
+    # The peer address, not one the client claims
+    assert ("X-Client", "10.0.0.7") in headers
+
+    status, _, data = call(app, "/upload", "POST", b"abc" * 50000, HTTP_TRANSFER_ENCODING="chunked")
+    assert status == "201 Created"
+    assert data == b"abc" * 50000
+
+    # A server that terminates its input streams bodies it has no length for
+    status, _, data = call(app, "/upload", "POST", b"abc" * 50000, CONTENT_LENGTH="",
+                           **{"wsgi.input_terminated": True})
+    assert status == "201 Created"
+    assert data == b"abc" * 50000
+
+
+def test_bodyless_requests_stay_replayable(backend):
+    app = ProxyApp("127.0.0.1", backend)
+    Backend.seen.clear()
+    status, _, _ = call(app, "/big", **{"wsgi.input_terminated": True})
+    assert status == "200 OK"
+    assert "Transfer-Encoding" not in Backend.seen[-1][1]
+
+
+def test_unreachable_backend_is_a_502():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    status, _, _ = call(ProxyApp("127.0.0.1", port), "/")
+    assert status == "502 Bad Gateway"
+
+
+def test_supervisor_restarts_a_dead_backend(tmp_path):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    supervisor = BackendSupervisor(
+        [sys.executable, "-m", "http.server", "--bind", "127.0.0.1", str(port)], "127.0.0.1", port,
+        str(tmp_path / "backend.pid"), health_path="/", startup_timeout=20, cwd=str(tmp_path))
+    try:
+        assert supervisor.ensure_running()
+        first = supervisor.stats()["pid"]
+        assert supervisor.ensure_running() and supervisor.restarts == 1
+
+        os.kill(first, 9)
+        deadline = time.monotonic() + 5
+        while supervisor.healthy() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        app = ProxyApp("127.0.0.1", port, supervisor=supervisor)
+        status, _, _ = call(app, "/")
+        assert status == "200 OK"
+        assert supervisor.restarts == 2
+        assert supervisor.stats()["pid"] != first
+    finally:
+        pid = supervisor.stats()["pid"]
+        if pid:
+            try:
+                os.kill(pid, 9)
+            except OSError:
+                pass
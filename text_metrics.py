@@ -0,0 +1,115 @@
+"""Analytic text measurement for chart labels.
+
+Label sizes used to be found by drawing the whole figure after every font-size
+attempt and asking matplotlib for the text's window extent. Here the same
+numbers are computed straight from the font with FreeType, the way the Agg
+renderer measures text, and memoized on (text, size, weight). The font size and
+line split of every label can then be chosen before anything is drawn.
+"""
+
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
+
+from matplotlib import font_manager as fm
+from matplotlib.backends.backend_agg import get_hinting_flag
+
+
+class TextMetrics:
+    """Measure (possibly multi-line) strings for a font family at a fixed DPI.
+
+    Extents are in pixels at ``dpi`` and match what ``Text.get_window_extent``
+    reports for unrotated text drawn with the same font properties.
+    """
+
+    def __init__(self, fontproperties: fm.FontProperties, dpi: float = 100.0,
+                 linespacing: float = 1.2, cache_size: int = 8192):
+        self.fontproperties = fontproperties
+        self.dpi = dpi
+        self.linespacing = linespacing
+        self._line_metrics = lru_cache(maxsize=cache_size)(self._measure_line)
+        self._font_path = lru_cache(maxsize=None)(self._find_font)
+
+    def _find_font(self, weight) -> str:
+        prop = self.fontproperties.copy()
+        prop.set_weight(weight)
+        return fm.findfont(prop)
+
+    def _measure_line(self, text: str, size: float, weight) -> Tuple[float, float, float]:
+        font = fm.get_font(self._font_path(weight))
+        font.clear()
+        font.set_size(size, self.dpi)
+        font.set_text(text, 0.0, flags=get_hinting_flag())
+        w, h = font.get_width_height()
+        return w / 64.0, h / 64.0, font.get_descent() / 64.0
+
+    def line_metrics(self, text: str, size: float, weight="normal") -> Tuple[float, float, float]:
+        """Width, height and descent of a single line."""
+        return self._line_metrics(text, size, weight)
+
+    def layout(self, text: str, size: float, weight="normal") -> Tuple[float, float, List[Tuple[str, float, float]]]:
+        """Lay ``text`` out line by line like ``Text``.
+
+        Returns the block's width and height and, per line, the line, its
+        width and the distance from the top of the block down to its baseline.
+        """
+        _, lp_h, lp_d = self._line_metrics("lp", size, weight)
+        min_dy = (lp_h - lp_d) * self.linespacing
+
+        width = 0.0
+        y = 0.0
+        lines = []
+        for i, line in enumerate(text.split("\n")):
+            w, h, d = self._line_metrics(line, size, weight) if line else (0.0, 0.0, 0.0)
+            h = max(h, lp_h)
+            d = max(d, lp_d)
+            width = max(width, w)
+            if i == 0:
+                y = -(h - d)
+            else:
+                y -= max(min_dy, (h - d) * self.linespacing)
+            lines.append((line, w, -y))
+            y -= d
+        return width, -y, lines
+
+    def extent(self, text: str, size: float, weight="normal") -> Tuple[float, float]:
+        """Width and height of ``text``, laid out line by line like ``Text``."""
+        width, height, _ = self.layout(text, size, weight)
+        return width, height
+
+    def fits(self, text: str, size: float, max_width: float, max_height: float, weight="normal") -> bool:
+        w, h = self.extent(text, size, weight)
+        return w <= max_width and h <= max_height
+
+    def largest_fitting_size(self, text: str, max_width: float, max_height: float,
+                             max_size: int, min_size: int, weight="normal") -> Optional[int]:
+        """Largest integer font size in [min_size, max_size] that fits, or None."""
+        if not self.fits(text, min_size, max_width, max_height, weight):
+            return None
+        lo, hi = min_size, max_size
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self.fits(text, mid, max_width, max_height, weight):
+                lo = mid
+            else:
+                hi = mid - 1
+        return lo
+
+    def fit(self, candidates: Sequence[str], max_width: float, max_height: float,
+            max_size: int, min_size: int, weight="normal") -> Tuple[str, int]:
+        """Pick the candidate and font size that give the largest fitting text.
+
+        Candidates are tried in order and earlier ones win ties, so callers
+        should list the preferred (fewest lines) variant first. When nothing
+        fits even at ``min_size`` the last candidate is used at ``min_size``.
+        """
+        best_text, best_size = candidates[-1], None
+        for text in candidates:
+            size = self.largest_fitting_size(text, max_width, max_height, max_size, min_size, weight)
+            if size is not None and (best_size is None or size > best_size):
+                best_text, best_size = text, size
+        return best_text, best_size if best_size is not None else min_size
+
+    def cache_info(self):
+        return self._line_metrics.cache_info()
@@ -0,0 +1,297 @@
+"""SVG and PDF charts written directly from a ``ChartLayout``.
+
+The raster chart goes through a matplotlib figure and a PNG encoder; here the
+same layout (see layout.py) is emitted as vector markup with plain string
+formatting. No figure is built and nothing is rasterized, so writing a chart
+takes about a millisecond.
+
+Output depends only on the layout: numbers are formatted with fixed
+precision, nothing time- or environment-dependent is written, and the font
+streams embedded in PDFs are compressed once per process. Identical input
+therefore gives byte-identical output, which is what lets SVG and PDF charts
+share the content-addressed cache with PNGs.
+
+SVG text is written in logical order and shaped by the viewer with the
+Vazirmatn web fonts. PDF has no shaping engine, so PDF text uses the
+layout's shaped form (as the PNG does), written as glyph ids of the embedded
+Vazirmatn TrueType fonts.
+"""
+
+from __future__ import annotations
+
+import base64
+import os
+import unicodedata
+import zlib
+from typing import Dict, List, Tuple
+from xml.sax.saxutils import escape
+
+from layout import BLOCK_ALPHA, BLOCK_EDGE_WIDTH, GRID_ALPHA, GRID_COLOR, LINE_WIDTH, ChartLayout, TextLine
+
+FONT_DIR = os.path.join(os.path.dirname(__file__), "static", "fonts")
+
+# Web font subsets with the unicode ranges static/style.css serves them for.
+# They are variable fonts, so one file covers every weight.
+WEB_FONTS = (
+    ("Vazirmatn-Arabic.woff2", ((0x0600, 0x06FF), (0x0750, 0x077F), (0x0870, 0x088E), (0x0890, 0x0891),
+                                (0x0897, 0x08E1), (0x08E3, 0x08FF), (0x200C, 0x200E), (0x2010, 0x2011),
+                                (0x204F, 0x204F), (0x2E41, 0x2E41), (0xFB50, 0xFDFF), (0xFE70, 0xFE74),
+                                (0xFE76, 0xFEFC))),
+    ("Vazirmatn-Latin-Ext.woff2", ((0x0100, 0x02BA), (0x02BD, 0x02C5), (0x02C7, 0x02CC), (0x02CE, 0x02D7),
+                                   (0x02DD, 0x02FF), (0x0304, 0x0304), (0x0308, 0x0308), (0x0329, 0x0329),
+                                   (0x1D00, 0x1DBF), (0x1E00, 0x1E9F), (0x1EF2, 0x1EFF), (0x2020, 0x2020),
+                                   (0x20A0, 0x20AB), (0x20AD, 0x20C0), (0x2113, 0x2113), (0x2C60, 0x2C7F),
+                                   (0xA720, 0xA7FF))),
+    ("Vazirmatn-Latin.woff2", ((0x0000, 0x00FF), (0x0131, 0x0131), (0x0152, 0x0153), (0x02BB, 0x02BC),
+                               (0x02C6, 0x02C6), (0x02DA, 0x02DA), (0x02DC, 0x02DC), (0x0304, 0x0304),
+                               (0x0308, 0x0308), (0x0329, 0x0329), (0x2000, 0x206F), (0x20AC, 0x20AC),
+                               (0x2122, 0x2122), (0x2191, 0x2191), (0x2193, 0x2193), (0x2212, 0x2212),
+                               (0x2215, 0x2215), (0xFEFF, 0xFEFF), (0xFFFD, 0xFFFD))),
+)
+WEB_FONT_URL = "/static/fonts/"
+
+
+def _num(value: float) -> str:
+    """Fixed-precision number formatting, so output does not depend on float noise."""
+    text = f"{value:.3f}".rstrip("0").rstrip(".")
+    return "0" if text == "-0" else text
+
+
+def _rgb(color: str) -> Tuple[float, float, float]:
+    color = color.lstrip("#")
+    return tuple(int(color[i:i + 2], 16) / 255.0 for i in (0, 2, 4))
+
+
+def _direction(text: str) -> str:
+    """Base direction of a line from its first strong character (bidi rule P2)."""
+    for char in text:
+        kind = unicodedata.bidirectional(char)
+        if kind in ("R", "AL"):
+            return "rtl"
+        if kind == "L":
+            return "ltr"
+    return "ltr"
+
+
+class VectorChartRenderer:
+    """Write chart layouts as SVG or PDF.
+
+    ``font_paths`` maps "normal" and "bold" to the TrueType files embedded in
+    PDFs; they must be the fonts the layout was measured with.
+    """
+
+    def __init__(self, font_paths: Dict[str, str]):
+        self.font_paths = dict(font_paths)
+        self._pdf_fonts: Dict[str, dict] = {}
+        self._web_fonts: Dict[str, str] = {}
+
+    # -- SVG -----------------------------------------------------------------
+
+    def _web_font_src(self, filename: str, embed: bool) -> str:
+        if not embed:
+            return f"url({WEB_FONT_URL}{filename})"
+        src = self._web_fonts.get(filename)
+        if src is None:
+            with open(os.path.join(FONT_DIR, filename), "rb") as f:
+                data = base64.b64encode(f.read()).decode("ascii")
+            src = self._web_fonts[filename] = f"url(data:font/woff2;base64,{data})"
+        return src
+
+    def _font_faces(self, texts: List[TextLine], embed: bool) -> str:
+        used = {ord(c) for t in texts for c in t.text}
+        faces = []
+        for filename, ranges in WEB_FONTS:
+            # Only subsets the chart actually needs, so embedded charts stay small
+            if not any(lo <= cp <= hi for cp in used for lo, hi in ranges):
+                continue
+            unicode_range = ",".join(f"U+{lo:04X}" if lo == hi else f"U+{lo:04X}-{hi:04X}"
+                                     for lo, hi in ranges)
+            faces.append("@font-face{font-family:Vazirmatn;font-style:normal;font-weight:100 900;"
+                         f"src:{self._web_font_src(filename, embed)} format(\"woff2\");"
+                         f"unicode-range:{unicode_range}}}")
+        return "".join(faces)
+
+    def svg(self, layout: ChartLayout, embed_fonts: bool = True) -> bytes:
+        """The chart as a standalone SVG document.
+
+        With ``embed_fonts`` the needed web font subsets are inlined so the
+        file renders anywhere (including ``<img>``); otherwise they are
+        referenced from /static/fonts.
+        """
+        width, height, texts = layout.width, layout.height, layout.all_texts()
+        out = [
+            '<?xml version="1.0" encoding="utf-8"?>\n',
+            f'<svg xmlns="http://www.w3.org/2000/svg" version="1.1" width="{_num(width)}pt" '
+            f'height="{_num(height)}pt" viewBox="0 0 {_num(width)} {_num(height)}">\n',
+            f"<style>{self._font_faces(texts, embed_fonts)}"
+            "text{font-family:Vazirmatn,sans-serif;font-weight:400;fill:#000}.b{font-weight:700}</style>\n",
+            f'<rect width="{_num(width)}" height="{_num(height)}" fill="#ffffff"/>\n',
+            f'<g stroke="{GRID_COLOR}" stroke-opacity="{_num(GRID_ALPHA)}" stroke-width="{_num(LINE_WIDTH)}" '
+            'stroke-linecap="square">\n',
+        ]
+        out.extend(f'<line x1="{_num(x1)}" y1="{_num(y1)}" x2="{_num(x2)}" y2="{_num(y2)}"/>\n'
+                   for x1, y1, x2, y2 in layout.grid)
+        out.append(f'</g>\n<g stroke="#000000" stroke-opacity="{_num(BLOCK_ALPHA)}" '
+                   f'stroke-width="{_num(BLOCK_EDGE_WIDTH)}" fill-opacity="{_num(BLOCK_ALPHA)}">\n')
+        out.extend(f'<rect x="{_num(b.x)}" y="{_num(b.y)}" width="{_num(b.width)}" height="{_num(b.height)}" '
+                   f'fill="{b.color}"/>\n' for b in layout.blocks)
+        out.append(f'</g>\n<g stroke="#000000" stroke-width="{_num(LINE_WIDTH)}">\n')
+        out.extend(f'<line x1="{_num(x1)}" y1="{_num(y1)}" x2="{_num(x2)}" y2="{_num(y2)}"/>\n'
+                   for x1, y1, x2, y2 in layout.frame)
+        out.append("</g>\n")
+        for t in texts:
+            direction = _direction(t.text)
+            if t.align == "center":
+                anchor = "middle"
+            else:
+                # Right-aligned: the right edge is "start" in right-to-left text
+                anchor = "start" if direction == "rtl" else "end"
+            cls = ' class="b"' if t.weight == "bold" else ""
+            out.append(f'<text{cls} x="{_num(t.x)}" y="{_num(t.y)}" font-size="{_num(t.size)}" '
+                       f'text-anchor="{anchor}" direction="{direction}">{escape(t.text)}</text>\n')
+        out.append("</svg>\n")
+        return "".join(out).encode("utf-8")
+
+    # -- PDF -----------------------------------------------------------------
+
+    def _load_pdf_font(self, weight: str) -> dict:
+        """Glyph ids, widths and the compressed font program, once per process."""
+        font = self._pdf_fonts.get(weight)
+        if font is None:
+            from fontTools.ttLib import TTFont
+
+            path = self.font_paths[weight]
+            tt = TTFont(path, lazy=True)
+            head, hhea, os2 = tt["head"], tt["hhea"], tt["OS/2"]
+            scale = 1000.0 / head.unitsPerEm
+            hmtx = tt["hmtx"].metrics
+            advances = [hmtx[name][0] * scale for name in tt.getGlyphOrder()]
+            with open(path, "rb") as f:
+                program = f.read()
+            font = self._pdf_fonts[weight] = {
+                "name": tt["name"].getDebugName(6),
+                "glyph_ids": {cp: tt.getGlyphID(name) for cp, name in tt.getBestCmap().items()},
+                "advances": advances,
+                "bbox": [round(v * scale) for v in (head.xMin, head.yMin, head.xMax, head.yMax)],
+                "ascent": round(hhea.ascent * scale),
+                "descent": round(hhea.descent * scale),
+                "cap_height": round(getattr(os2, "sCapHeight", hhea.ascent) * scale),
+                "widths": "[0 [" + " ".join(_num(a) for a in advances) + "]]",
+                "program": zlib.compress(program, 9),
+                "program_length": len(program),
+            }
+            tt.close()
+        return font
+
+    def pdf(self, layout: ChartLayout) -> bytes:
+        """The chart as a single-page PDF with the Vazirmatn faces it uses embedded."""
+        width, height, texts = layout.width, layout.height, layout.all_texts()
+        weights = sorted({t.weight for t in texts})
+        fonts = {weight: self._load_pdf_font(weight) for weight in weights}
+        resource_names = {weight: f"F{i}" for i, weight in enumerate(weights, start=1)}
+
+        ops = ["1 g", f"0 0 {_num(width)} {_num(height)} re f"]
+
+        def lines(segments):
+            for x1, y1, x2, y2 in segments:
+                ops.append(f"{_num(x1)} {_num(height - y1)} m {_num(x2)} {_num(height - y2)} l")
+            ops.append("S")
+
+        ops.append(f"q /GSgrid gs {' '.join(_num(c) for c in _rgb(GRID_COLOR))} RG {_num(LINE_WIDTH)} w 2 J")
+        lines(layout.grid)
+        ops.append("Q")
+        ops.append(f"q /GSblock gs 0 G {_num(BLOCK_EDGE_WIDTH)} w")
+        for b in layout.blocks:
+            ops.append(f"{' '.join(_num(c) for c in _rgb(b.color))} rg "
+                       f"{_num(b.x)} {_num(height - b.y - b.height)} {_num(b.width)} {_num(b.height)} re B")
+        ops.append("Q")
+        ops.append(f"q 0 G {_num(LINE_WIDTH)} w")
+        lines(layout.frame)
+        ops.append("Q")
+
+        used: Dict[str, Dict[int, str]] = {weight: {} for weight in weights}
+        ops.append("BT 0 g")
+        for t in texts:
+            font = fonts[t.weight]
+            gids = []
+            for char in t.shaped:
+                gid = font["glyph_ids"].get(ord(char), 0)
+                gids.append(gid)
+                used[t.weight].setdefault(gid, char)
+            line_width = sum(font["advances"][g] for g in gids) * t.size / 1000.0
+            x = t.x - line_width / 2.0 if t.align == "center" else t.x - line_width if t.align == "right" else t.x
+            ops.append(f"/{resource_names[t.weight]} {_num(t.size)} Tf 1 0 0 1 {_num(x)} {_num(height - t.y)} Tm "
+                       f"<{''.join(f'{g:04X}' for g in gids)}> Tj")
+        ops.append("ET")
+        content = zlib.compress("\n".join(ops).encode("ascii"), 6)
+
+        # Objects 1-4 are the document, page and content; each font takes five more
+        font_refs = " ".join(f"/{resource_names[w]} {5 + 5 * i} 0 R" for i, w in enumerate(weights))
+        objects = [
+            b"<< /Type /Catalog /Pages 2 0 R >>",
+            b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+            (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {_num(width)} {_num(height)}] "
+             f"/Resources << /Font << {font_refs} >> /ExtGState << /GSgrid << /CA {_num(GRID_ALPHA)} >> "
+             f"/GSblock << /ca {_num(BLOCK_ALPHA)} /CA {_num(BLOCK_ALPHA)} >> >> >> "
+             f"/Contents 4 0 R >>").encode("ascii"),
+            _pdf_stream(content, b"/Filter /FlateDecode"),
+        ]
+        for i, weight in enumerate(weights):
+            objects.extend(self._pdf_font_objects(fonts[weight], 5 + 5 * i, used[weight]))
+        return _pdf_document(objects)
+
+    def _pdf_font_objects(self, font: dict, first: int, used: Dict[int, str]) -> List[bytes]:
+        """Type0 font, CIDFont, descriptor, font program and ToUnicode, numbered from ``first``."""
+        name = font["name"]
+        return [
+            (f"<< /Type /Font /Subtype /Type0 /BaseFont /{name} /Encoding /Identity-H "
+             f"/DescendantFonts [{first + 1} 0 R] /ToUnicode {first + 4} 0 R >>").encode("ascii"),
+            (f"<< /Type /Font /Subtype /CIDFontType2 /BaseFont /{name} "
+             f"/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) /Supplement 0 >> "
+             f"/FontDescriptor {first + 2} 0 R /CIDToGIDMap /Identity /W {font['widths']} >>").encode("ascii"),
+            (f"<< /Type /FontDescriptor /FontName /{name} /Flags 4 "
+             f"/FontBBox [{' '.join(str(v) for v in font['bbox'])}] /ItalicAngle 0 "
+             f"/Ascent {font['ascent']} /Descent {font['descent']} /CapHeight {font['cap_height']} "
+             f"/StemV 80 /FontFile2 {first + 3} 0 R >>").encode("ascii"),
+            _pdf_stream(font["program"], f"/Filter /FlateDecode /Length1 {font['program_length']}".encode("ascii")),
+            _pdf_stream(zlib.compress(self._to_unicode(used), 6), b"/Filter /FlateDecode"),
+        ]
+
+    @staticmethod
+    def _to_unicode(used: Dict[int, str]) -> bytes:
+        """CMap mapping the glyphs used back to text, for copy and search."""
+        entries = sorted(used.items())
+        out = ["/CIDInit /ProcSet findresource begin 12 dict begin begincmap",
+               "/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def",
+               "/CMapName /Adobe-Identity-UCS def /CMapType 2 def",
+               "1 begincodespacerange <0000> <FFFF> endcodespacerange"]
+        for start in range(0, len(entries), 100):
+            chunk = entries[start:start + 100]
+            out.append(f"{len(chunk)} beginbfchar")
+            out.extend(f"<{gid:04X}> <{''.join(f'{u:04X}' for u in _utf16(char))}>" for gid, char in chunk)
+            out.append("endbfchar")
+        out.append("endcmap CMapName currentdict /CMap defineresource pop end end")
+        return "\n".join(out).encode("ascii")
+
+
+def _utf16(char: str) -> List[int]:
+    data = char.encode("utf-16-be")
+    return [int.from_bytes(data[i:i + 2], "big") for i in range(0, len(data), 2)]
+
+
+def _pdf_stream(data: bytes, extra: bytes) -> bytes:
+    return b"<< /Length %d %s >>\nstream\n%s\nendstream" % (len(data), extra, data)
+
+
+def _pdf_document(objects: List[bytes]) -> bytes:
+    out = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
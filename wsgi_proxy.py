@@ -0,0 +1,414 @@
+"""Forward WSGI requests to the app running under an ASGI server.
+
+``passenger_wsgi.py`` runs the app under Daphne next to Passenger and passes
+every request on to it over HTTP. This module does that forwarding:
+
+* ``ConnectionPool`` keeps keep-alive connections to the backend open
+  between requests instead of connecting for every one;
+* ``ProxyApp`` is the WSGI application. It streams request and response
+  bodies in chunks (a chart is several MB), passes the backend's status
+  line and headers through, and drops only hop-by-hop headers;
+* ``BackendSupervisor`` starts the backend, health-checks it and restarts
+  it when it dies or stops answering. A lock file makes sure only one of
+  Passenger's processes restarts it at a time.
+
+Only the standard library is used, so nothing beyond the app's own
+requirements has to be installed on the host.
+"""
+
+from __future__ import annotations
+
+import http.client
+import os
+import signal
+import socket
+import subprocess
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import quote
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+CHUNK_SIZE = 256 * 1024
+
+# Headers that describe one connection rather than the message (RFC 9110 7.6.1)
+HOP_BY_HOP = frozenset(["connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "te",
+                        "trailer", "trailers", "transfer-encoding", "upgrade"])
+
+
+class ConnectionPool:
+    """Up to ``size`` HTTP/1.1 connections to one backend, reused LIFO.
+
+    Connections idle for longer than ``max_idle`` seconds are closed instead
+    of reused, so they are not picked up just as the backend times them out.
+    """
+
+    def __init__(self, host: str, port: int, size: int = 16, timeout: float = 60.0, max_idle: float = 4.0):
+        self.host, self.port = host, port
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self._idle: Deque[Tuple[http.client.HTTPConnection, float]] = deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self.created = 0
+        self.reused = 0
+        self.discarded = 0
+
+    def acquire(self) -> Tuple[http.client.HTTPConnection, bool]:
+        """A connection and whether it was reused. Blocks while all ``size`` are in use."""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError("no backend connection became free")
+        now = time.monotonic()
+        with self._lock:
+            while self._idle:
+                conn, idle_since = self._idle.pop()
+                if now - idle_since <= self.max_idle:
+                    self.reused += 1
+                    return conn, True
+                conn.close()
+                self.discarded += 1
+            self.created += 1
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout), False
+
+    def release(self, conn: http.client.HTTPConnection, reusable: bool):
+        with self._lock:
+            if reusable:
+                self._idle.append((conn, time.monotonic()))
+            else:
+                conn.close()
+                self.discarded += 1
+        self._slots.release()
+
+    def close(self):
+        with self._lock:
+            while self._idle:
+                self._idle.pop()[0].close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"size": self.size, "idle": len(self._idle), "created": self.created,
+                "reused": self.reused, "discarded": self.discarded}
+
+
+class BackendSupervisor:
+    """Keeps the backend server process running and answering.
+
+    ``command`` starts the backend listening on ``host:port``. It is detached
+    into its own session, so it outlives the Passenger process that started
+    it and is shared by all of them; its pid is kept in ``pidfile``.
+    """
+
+    def __init__(self, command: List[str], host: str, port: int, pidfile: str,
+                 health_path: str = "/health", interval: float = 5.0, startup_timeout: float = 60.0,
+                 cwd: Optional[str] = None, log_path: Optional[str] = None):
+        self.command = command
+        self.host, self.port = host, port
+        self.pidfile = pidfile
+        self.lockfile = pidfile + ".lock"
+        self.health_path = health_path
+        self.interval = interval
+        self.startup_timeout = startup_timeout
+        self.cwd = cwd
+        self.log_path = log_path
+        self._lock = threading.Lock()
+        self._monitor: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self.restarts = 0
+        self.failed_checks = 0
+
+    def healthy(self, timeout: float = 2.0) -> bool:
+        """Whether the backend answers the health check with anything but a server error."""
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+        try:
+            conn.request("GET", self.health_path)
+            return conn.getresponse().status < 500
+        except (OSError, http.client.HTTPException):
+            return False
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _exclusive(self):
+        with self._lock, open(self.lockfile, "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def ensure_running(self) -> bool:
+        """Start or restart the backend unless it is healthy; True once it answers."""
+        if self.healthy():
+            return True
+        with self._exclusive():
+            # Another process (or thread) may have restarted it while we waited
+            if self.healthy():
+                return True
+            self._stop_stale()
+            self._spawn()
+            self.restarts += 1
+            return self._wait_healthy()
+
+    def _read_pid(self) -> Optional[int]:
+        try:
+            with open(self.pidfile) as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return None
+
+    def _is_backend(self, pid: int) -> bool:
+        """Whether ``pid`` is alive and (where /proc tells us) still runs our command."""
+        try:
+            os.kill(pid, 0)
+        except OSError:
+            return False
+        try:
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                cmdline = f.read().split(b"\0")
+        except OSError:
+            return True
+        return os.fsencode(self.command[-1]) in cmdline
+
+    def _stop_stale(self):
+        """Stop a backend that is running but not answering, so its port is freed."""
+        pid = self._read_pid()
+        if pid is None or not self._is_backend(pid):
+            return
+        for sig, wait in ((signal.SIGTERM, 5.0), (signal.SIGKILL, 2.0)):
+            try:
+                os.kill(pid, sig)
+            except OSError:
+                return
+            deadline = time.monotonic() + wait
+            while time.monotonic() < deadline:
+                try:
+                    # Reap it if it is our child; otherwise just poll for it
+                    if os.waitpid(pid, os.WNOHANG)[0] == pid:
+                        return
+                except ChildProcessError:
+                    if not self._is_backend(pid):
+                        return
+                time.sleep(0.05)
+
+    def _spawn(self):
+        log = open(self.log_path, "ab") if self.log_path else subprocess.DEVNULL
+        try:
+            proc = subprocess.Popen(self.command, cwd=self.cwd, stdin=subprocess.DEVNULL, stdout=log,
+                                    stderr=subprocess.STDOUT if self.log_path else subprocess.DEVNULL,
+                                    start_new_session=True)
+        finally:
+            if self.log_path:
+                log.close()
+        with open(self.pidfile, "w") as f:
+            f.write(str(proc.pid))
+
+    def _wait_healthy(self) -> bool:
+        deadline = time.monotonic() + self.startup_timeout
+        while time.monotonic() < deadline:
+            if self.healthy():
+                return True
+            time.sleep(0.1)
+        return False
+
+    def start(self):
+        """Check on the backend every ``interval`` seconds from a daemon thread,
+        starting it right away if it is not up yet."""
+        if self._monitor is not None:
+            return
+        self._monitor = threading.Thread(target=self._watch, name="backend-supervisor", daemon=True)
+        self._monitor.start()
+
+    def _watch(self):
+        self.ensure_running()
+        while not self._stopped.wait(self.interval):
+            if self.healthy():
+                continue
+            self.failed_checks += 1
+            self.ensure_running()
+
+    def stop(self):
+        self._stopped.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"pid": self._read_pid(), "restarts": self.restarts, "failed_checks": self.failed_checks}
+
+
+def _request_headers(environ: Dict[str, Any]) -> List[Tuple[str, str]]:
+    headers = []
+    for key, value in environ.items():
+        if key.startswith("HTTP_"):
+            name = key[5:].replace("_", "-").title()
+            if name.lower() not in HOP_BY_HOP and name.lower() != "content-length":
+                headers.append((name, value))
+    if environ.get("CONTENT_TYPE"):
+        headers.append(("Content-Type", environ["CONTENT_TYPE"]))
+    remote = environ.get("REMOTE_ADDR")
+    if remote:
+        forwarded = environ.get("HTTP_X_FORWARDED_FOR")
+        headers = [h for h in headers if h[0] not in ("X-Forwarded-For", "X-Real-Ip")]
+        headers.append(("X-Forwarded-For", f"{forwarded}, {remote}" if forwarded else remote))
+        # The address the app queues renders under (HAFTESOOZ_TRUST_PROXY), as nginx sets it
+        headers.append(("X-Real-IP", remote))
+    if "HTTP_X_FORWARDED_PROTO" not in environ:
+        headers.append(("X-Forwarded-Proto", environ.get("wsgi.url_scheme", "http")))
+    return headers
+
+
+def _target(environ: Dict[str, Any]) -> str:
+    # PATH_INFO arrives decoded as latin-1; quote it back into a request target
+    path = quote(environ.get("PATH_INFO", "/").encode("latin-1"), safe="/:@!$&'()*+,;=-._~%")
+    query = environ.get("QUERY_STRING")
+    return f"{path}?{query}" if query else path
+
+
+class _Body:
+    """The request body, read up front when small enough to be resent."""
+
+    def __init__(self, environ: Dict[str, Any], buffer_limit: int):
+        self.stream = environ.get("wsgi.input")
+        length = environ.get("CONTENT_LENGTH")
+        self.length = int(length) if length else None
+        # A terminated input without a length is streamed chunked, but only when
+        # the request can carry a body: a GET sent chunked could not be resent
+        self.chunked = self.length is None and (
+            environ.get("HTTP_TRANSFER_ENCODING", "").lower() == "chunked"
+            or environ.get("wsgi.input_terminated") and environ.get("REQUEST_METHOD") not in ("GET", "HEAD"))
+        self.buffered: Optional[bytes] = None
+        if self.length is not None and self.length <= buffer_limit:
+            self.buffered = self.stream.read(self.length) if self.length else b""
+        elif not self.chunked and self.length is None:
+            self.buffered = b""
+
+    @property
+    def replayable(self) -> bool:
+        return self.buffered is not None
+
+    def headers(self) -> List[Tuple[str, str]]:
+        if self.buffered is not None:
+            return [("Content-Length", str(len(self.buffered)))]
+        if self.chunked:
+            return [("Transfer-Encoding", "chunked")]
+        return [("Content-Length", str(self.length))]
+
+    def send(self, conn: http.client.HTTPConnection):
+        if self.buffered is not None:
+            if self.buffered:
+                conn.send(self.buffered)
+            return
+        remaining = self.length
+        while remaining is None or remaining > 0:
+            chunk = self.stream.read(CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+                conn.send(chunk)
+            else:
+                conn.send(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+        if self.chunked:
+            conn.send(b"0\r\n\r\n")
+
+
+class _ResponseBody:
+    """Streams the backend response; returns the connection to the pool on close."""
+
+    def __init__(self, pool: ConnectionPool, conn: http.client.HTTPConnection, response: http.client.HTTPResponse):
+        self.pool, self.conn, self.response = pool, conn, response
+        self._released = False
+
+    def __iter__(self):
+        while True:
+            chunk = self.response.read1(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+        # Nothing is left to read; this marks the response complete
+        self.response.read()
+
+    def close(self):
+        if self._released:
+            return
+        self._released = True
+        # Reusable only if the whole response was read and the backend keeps the connection
+        reusable = self.response.isclosed() and not self.response.will_close
+        if not reusable:
+            self.response.close()
+        self.pool.release(self.conn, reusable)
+
+
+class ProxyApp:
+    """WSGI application forwarding every request to ``host:port``."""
+
+    def __init__(self, host: str, port: int, pool_size: int = 16, timeout: float = 60.0,
+                 supervisor: Optional[BackendSupervisor] = None, buffer_limit: int = 1024 * 1024):
+        self.pool = ConnectionPool(host, port, size=pool_size, timeout=timeout)
+        self.supervisor = supervisor
+        self.buffer_limit = buffer_limit
+        self.retried = 0
+        self.failed = 0
+
+    def _send(self, conn: http.client.HTTPConnection, environ: Dict[str, Any], body: _Body):
+        conn.putrequest(environ["REQUEST_METHOD"], _target(environ), skip_host=True, skip_accept_encoding=True)
+        headers = _request_headers(environ) + body.headers()
+        if "HTTP_HOST" not in environ:
+            headers.append(("Host", f"{self.pool.host}:{self.pool.port}"))
+        for name, value in headers:
+            conn.putheader(name, value)
+        conn.endheaders()
+        body.send(conn)
+        return conn.getresponse()
+
+    def _forward(self, environ: Dict[str, Any], body: _Body):
+        for attempt in range(2):
+            conn, reused = self.pool.acquire()
+            try:
+                return conn, self._send(conn, environ, body)
+            except (ConnectionError, http.client.RemoteDisconnected, http.client.BadStatusLine) as exc:
+                self.pool.release(conn, False)
+                # Worth one more try: a kept-alive connection the backend had
+                # already closed, or a backend that was down and got restarted
+                refused = isinstance(exc, ConnectionRefusedError) and self.supervisor is not None
+                if attempt or not body.replayable or not (reused or refused):
+                    raise
+                if refused:
+                    self.supervisor.ensure_running()
+                self.retried += 1
+            except BaseException:
+                self.pool.release(conn, False)
+                raise
+
+    def __call__(self, environ: Dict[str, Any], start_response: Callable) -> Iterable[bytes]:
+        body = _Body(environ, self.buffer_limit)
+        try:
+            conn, response = self._forward(environ, body)
+        except socket.timeout:
+            self.failed += 1
+            return self._error(start_response, "504 Gateway Timeout", "Backend did not answer in time")
+        except (OSError, http.client.HTTPException) as exc:
+            self.failed += 1
+            if isinstance(exc, ConnectionRefusedError) and self.supervisor is not None and not body.replayable:
+                threading.Thread(target=self.supervisor.ensure_running, daemon=True).start()
+            return self._error(start_response, "502 Bad Gateway", f"Backend unavailable: {exc}")
+
+        headers = [(name, value) for name, value in response.getheaders() if name.lower() not in HOP_BY_HOP]
+        start_response(f"{response.status} {response.reason}", headers)
+        return _ResponseBody(self.pool, conn, response)
+
+    @staticmethod
+    def _error(start_response, status: str, message: str):
+        start_response(status, [("Content-Type", "text/plain; charset=utf-8"), ("Retry-After", "5")])
+        return [message.encode("utf-8") + b"\n"]
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {"pool": self.pool.stats(), "retried": self.retried, "failed": self.failed}
+        if self.supervisor is not None:
+            stats["backend"] = self.supervisor.stats()
+        return stats
@@ -0,0 +1,65 @@
+"""ZIP archives written front to back, for streaming responses.
+
+``zipfile`` can write to a stream it cannot seek in: sizes and checksums then
+follow each entry in a data descriptor instead of being patched into its
+header. ``ZipStream`` points it at an in-memory sink and hands out whatever
+bytes each ``add`` produced, so an archive can be sent while later entries
+are still being rendered, holding only one entry in memory at a time.
+"""
+
+from __future__ import annotations
+
+import re
+import zipfile
+from typing import List, Set
+
+# Entries get a fixed timestamp so identical batches give identical archives
+_ENTRY_DATE = (1980, 1, 1, 0, 0, 0)
+
+
+class _Sink:
+    """Write-only, unseekable file object collecting what zipfile writes."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ZipStream:
+    def __init__(self):
+        self._sink = _Sink()
+        self._zip = zipfile.ZipFile(self._sink, "w")
+        self._names: Set[str] = set()
+
+    def entry_name(self, stem: str, extension: str) -> str:
+        """A safe, unused entry name built from a user-supplied ``stem``."""
+        stem = re.sub(r"[^\w.-]+", "_", stem).strip("._") or "chart"
+        name, n = f"{stem}.{extension}", 1
+        while name in self._names:
+            n += 1
+            name = f"{stem}-{n}.{extension}"
+        return name
+
+    def add(self, name: str, data: bytes, compress: bool = True) -> bytes:
+        """Append an entry and return the archive bytes it produced."""
+        info = zipfile.ZipInfo(name, date_time=_ENTRY_DATE)
+        info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+        self._zip.writestr(info, data)
+        self._names.add(name)
+        return self._sink.drain()
+
+    def close(self) -> bytes:
+        """Write the central directory and return the final bytes."""
+        self._zip.close()
+        return self._sink.drain()